@@ -7,8 +7,33 @@ def assets_path(name: str):
     return os.path.join(os.path.dirname(__file__), "assets", name)
 
 
-def main(port=8000, api_key=""):
-    demo = create_interface(api_key)
+def main(
+    port=8000,
+    api_key="",
+    measurement_workers=1,
+    measurement_backend="thread",
+    model_memory_budget=None,
+    preload_models=(),
+    onnx_options=None,
+    inference_batch_size=8,
+    inference_max_wait=0.015,
+    warmup=False,
+    inference_cache_size=256 * 2**20,
+    inference_cache_dir=None,
+):
+    demo = create_interface(
+        api_key,
+        measurement_workers,
+        measurement_backend,
+        model_memory_budget,
+        preload_models,
+        onnx_options,
+        inference_batch_size,
+        inference_max_wait,
+        warmup,
+        inference_cache_size,
+        inference_cache_dir,
+    )
     demo.queue(default_concurrency_limit=5, api_open=True).launch(
         server_name="127.0.0.1",
         server_port=port,
@@ -1,5 +1,82 @@
 import argparse
-from particleanalyzer.app import main as run_app
+import os
+
+
+def run(args):
+    from particleanalyzer.app import main as run_app
+
+    run_app(
+        port=args.port,
+        api_key=args.api_key,
+        measurement_workers=args.measurement_workers,
+        measurement_backend=args.measurement_backend,
+        model_memory_budget=(
+            int(args.model_memory_budget * 2**20)
+            if args.model_memory_budget is not None
+            else None
+        ),
+        preload_models=args.preload,
+        onnx_options={
+            "intra_op_threads": args.onnx_intra_op_threads,
+            "inter_op_threads": args.onnx_inter_op_threads,
+            "execution_mode": args.onnx_execution_mode,
+            "optimization_level": args.onnx_optimization_level,
+            "cache_optimized": not args.no_onnx_cache,
+        },
+        inference_batch_size=args.batch_max_size,
+        inference_max_wait=args.batch_max_wait / 1000,
+        warmup=args.warmup,
+        inference_cache_size=int(args.inference_cache_size * 2**20),
+        inference_cache_dir=args.inference_cache_dir,
+    )
+
+
+def benchmark(args):
+    from particleanalyzer.core.benchmarks import BENCHMARKS, EXAMPLE_DIR
+
+    if args.name not in BENCHMARKS:
+        names = ", ".join(sorted(BENCHMARKS))
+        args.parser.error(f"unknown benchmark {args.name!r} (choose from {names})")
+    BENCHMARKS[args.name](image_dir=args.image_dir or EXAMPLE_DIR, repeats=args.repeats)
+
+
+def quantize(args):
+    from particleanalyzer.core.ONNXQuantizer import ONNXQuantizer
+    from particleanalyzer.core.benchmarks import load_example_images
+
+    def read_images(option, image_dir):
+        if not os.path.isdir(image_dir):
+            args.parser.error(f"{option}: directory not found: {image_dir}")
+        images = list(load_example_images(image_dir).values())
+        if not images:
+            args.parser.error(f"{option}: no images in {image_dir}")
+        return images
+
+    report = ONNXQuantizer().quantize(
+        images=read_images("--image-dir", args.image_dir),
+        method=args.method,
+        per_channel=args.per_channel,
+        gate=not args.no_gate,
+        validation_images=(
+            read_images("--validation-dir", args.validation_dir)
+            if args.validation_dir
+            else None
+        ),
+    )
+    for key, value in report.items():
+        print(f"{key}: {value}")
+
+
+def export_onnx(args):
+    from particleanalyzer.core.ONNXLoader import ONNXLoader
+    from particleanalyzer.core.YOLOLoader import YOLOLoader
+
+    loader = YOLOLoader()
+    for onnx_name, model_name in ONNXLoader.EXPORTED_MODELS.items():
+        if args.model and model_name not in args.model:
+            continue
+        path = loader.export_onnx(model_name, imgsz=args.imgsz)
+        print(f"{onnx_name}: {path}")
 
 
 def main():
@@ -16,11 +93,165 @@ def main():
     run_parser.add_argument(
         "--api-key", type=str, default="", help="The OpenRouter or Hugging Face API key for LLM output"
     )
+    run_parser.add_argument(
+        "--measurement-workers",
+        type=int,
+        default=1,
+        help="Parallel workers for particle measurement, 0 = all cores (default: 1, serial)",
+    )
+    run_parser.add_argument(
+        "--measurement-backend",
+        choices=["thread", "process"],
+        default="thread",
+        help="Parallel measurement backend (default: thread)",
+    )
+    run_parser.add_argument(
+        "--model-memory-budget",
+        type=float,
+        default=None,
+        help="Memory budget for loaded models in MiB, least recently used "
+        "models are unloaded (default: unlimited)",
+    )
+    run_parser.add_argument(
+        "--preload",
+        action="append",
+        default=[],
+        metavar="MODEL",
+        help='Model to load at startup, may be repeated (e.g. "Yolo11 (dataset 9)")',
+    )
+    run_parser.add_argument(
+        "--onnx-intra-op-threads",
+        type=int,
+        default=0,
+        help="ONNX Runtime threads inside an operator, 0 = automatic (default: 0)",
+    )
+    run_parser.add_argument(
+        "--onnx-inter-op-threads",
+        type=int,
+        default=0,
+        help="ONNX Runtime threads across operators, 0 = automatic (default: 0)",
+    )
+    run_parser.add_argument(
+        "--onnx-execution-mode",
+        choices=["sequential", "parallel"],
+        default="sequential",
+        help="ONNX Runtime execution mode (default: sequential)",
+    )
+    run_parser.add_argument(
+        "--onnx-optimization-level",
+        choices=["disable", "basic", "extended", "all"],
+        default="all",
+        help="ONNX Runtime graph optimization level (default: all)",
+    )
+    run_parser.add_argument(
+        "--no-onnx-cache",
+        action="store_true",
+        help="Do not save or reuse optimized ONNX graphs",
+    )
+
+    run_parser.add_argument(
+        "--batch-max-size",
+        type=int,
+        default=8,
+        help="Maximum images per cross-request inference batch, 1 = no batching "
+        "(default: 8)",
+    )
+    run_parser.add_argument(
+        "--batch-max-wait",
+        type=float,
+        default=15,
+        help="Milliseconds to collect concurrent requests into one batch, "
+        "0 = no batching (default: 15)",
+    )
+    run_parser.add_argument(
+        "--warmup",
+        action="store_true",
+        help="Run synthetic images through the loaded models and the scale "
+        "detector before serving, and print the timings",
+    )
+    run_parser.add_argument(
+        "--inference-cache-size",
+        type=float,
+        default=256,
+        help="Memory for cached detections in MiB; processing the same image "
+        "with the same model settings again skips the model, 0 = off "
+        "(default: 256)",
+    )
+    run_parser.add_argument(
+        "--inference-cache-dir",
+        type=str,
+        default=None,
+        help="Directory for a persistent on-disk tier of the detection cache "
+        "(default: memory only)",
+    )
+    run_parser.set_defaults(func=run)
+
+    benchmark_parser = subparsers.add_parser(
+        "benchmark", help="Run a performance benchmark"
+    )
+    benchmark_parser.add_argument("name", help="Benchmark to run, e.g. feret")
+    benchmark_parser.add_argument(
+        "--image-dir",
+        type=str,
+        default=None,
+        help="Directory with SEM images (default: bundled examples)",
+    )
+    benchmark_parser.add_argument(
+        "--repeats", type=int, default=3, help="Number of timed repeats (default: 3)"
+    )
+
+    benchmark_parser.set_defaults(func=benchmark, parser=benchmark_parser)
+
+    quantize_parser = subparsers.add_parser(
+        "quantize", help="Create the INT8 RF-DETR model for CPU serving"
+    )
+    quantize_parser.add_argument(
+        "--method",
+        choices=["static", "dynamic"],
+        default="static",
+        help="Static (calibrated activations) or dynamic quantization (default: static)",
+    )
+    quantize_parser.add_argument(
+        "--image-dir",
+        type=str,
+        required=True,
+        help="SEM images for calibration and the accuracy check; without "
+        "--validation-dir every second image is held out for the check",
+    )
+    quantize_parser.add_argument(
+        "--validation-dir",
+        type=str,
+        default=None,
+        help="Separate SEM images for the accuracy check",
+    )
+    quantize_parser.add_argument(
+        "--per-channel", action="store_true", help="Quantize weights per channel"
+    )
+    quantize_parser.add_argument(
+        "--no-gate",
+        action="store_true",
+        help="Keep the model even if it fails the accuracy check against FP32",
+    )
+
+    quantize_parser.set_defaults(func=quantize, parser=quantize_parser)
+
+    export_parser = subparsers.add_parser(
+        "export-onnx", help="Export YOLO segmentation models to ONNX"
+    )
+    export_parser.add_argument(
+        "--model",
+        action="append",
+        default=None,
+        help="YOLO model to export, repeatable (default: all segmentation models)",
+    )
+    export_parser.add_argument(
+        "--imgsz", type=int, default=640, help="Export input size (default: 640)"
+    )
 
-    run_parser.set_defaults(func=run_app)
+    export_parser.set_defaults(func=export_onnx)
 
     args = parser.parse_args()
-    args.func(port=args.port, api_key=args.api_key)
+    args.func(args)
 
 
 if __name__ == "__main__":
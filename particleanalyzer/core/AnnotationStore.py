@@ -0,0 +1,171 @@
+"""Компактное хранилище аннотаций частиц (RLE по рамке объекта)"""
+
+import json
+import numpy as np
+
+from particleanalyzer.core.MaskTile import MaskTile
+
+
+class AnnotationStore:
+    """
+    Маски и подписи частиц одного изображения.
+
+    Каждая маска обрезается до точной рамки объекта и хранится как RLE в
+    порядке COCO (по столбцам, первая серия — нули), поэтому память
+    пропорциональна числу серий, а не площади кадра. Маски декодируются
+    только по запросу; to_coco выгружает аннотации в формате COCO JSON.
+    """
+
+    CATEGORY = {"id": 1, "name": "particle"}
+
+    def __init__(self, image_shape):
+        self.image_shape = tuple(image_shape[:2])
+        self.labels = []
+        self.numbers = []
+        self.scores = []
+        self._boxes = []  # (x, y, width, height) точной рамки
+        self._counts = []  # RLE маски внутри рамки, uint32
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __iter__(self):
+        """Пары (полная маска, подпись), как в gr.AnnotatedImage"""
+        for i, label in enumerate(self.labels):
+            yield self.decode(i).to_full(), label
+
+    def add(self, mask, label: str, number: int = None, score: float = None):
+        """Добавление маски: MaskTile или полноразмерный бинарный массив"""
+        if not isinstance(mask, MaskTile):
+            mask = MaskTile(mask, 0, 0, self.image_shape)
+        rows = np.flatnonzero(mask.mask.any(axis=1))
+        columns = np.flatnonzero(mask.mask.any(axis=0))
+        if len(rows) == 0:
+            box, crop = (mask.x, mask.y, 0, 0), np.zeros((0, 0), dtype=bool)
+        else:
+            crop = mask.mask[rows[0] : rows[-1] + 1, columns[0] : columns[-1] + 1]
+            box = (
+                mask.x + int(columns[0]),
+                mask.y + int(rows[0]),
+                crop.shape[1],
+                crop.shape[0],
+            )
+        self._boxes.append(box)
+        self._counts.append(_encode(crop))
+        self.labels.append(label)
+        self.numbers.append(len(self.labels) if number is None else int(number))
+        self.scores.append(score)
+
+    def decode(self, index: int) -> MaskTile:
+        """Маска аннотации в виде фрагмента по рамке"""
+        x, y, width, height = self._boxes[index]
+        return MaskTile(
+            _decode(self._counts[index], height, width), x, y, self.image_shape
+        )
+
+    def area(self, index: int) -> int:
+        """Площадь маски (сумма серий единиц) без декодирования"""
+        return int(self._counts[index][1::2].sum())
+
+    @property
+    def nbytes(self) -> int:
+        return sum(counts.nbytes for counts in self._counts)
+
+    def to_coco(
+        self, image_id: int = 1, file_name: str = "image.png", numbers=None
+    ) -> dict:
+        """Аннотации в формате COCO (несжатый RLE на весь кадр)"""
+        height, width = self.image_shape
+        selected = None if numbers is None else {int(n) for n in numbers}
+        annotations = []
+        for i, number in enumerate(self.numbers):
+            if selected is not None and number not in selected:
+                continue
+            annotation = {
+                "id": number,
+                "image_id": image_id,
+                "category_id": self.CATEGORY["id"],
+                "segmentation": {
+                    "size": [height, width],
+                    "counts": self._full_frame_counts(i).tolist(),
+                },
+                "area": self.area(i),
+                "bbox": list(self._boxes[i]),
+                "iscrowd": 0,
+            }
+            if self.scores[i] is not None:
+                annotation["score"] = float(self.scores[i])
+            annotations.append(annotation)
+        return {
+            "images": [
+                {
+                    "id": image_id,
+                    "file_name": file_name,
+                    "height": height,
+                    "width": width,
+                }
+            ],
+            "annotations": annotations,
+            "categories": [self.CATEGORY],
+        }
+
+    def save_coco(
+        self, path: str, image_id: int = 1, file_name: str = "image.png", numbers=None
+    ):
+        """Сохранение аннотаций в файл COCO JSON"""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_coco(image_id, file_name, numbers), f)
+        return path
+
+    def _full_frame_counts(self, index: int) -> np.ndarray:
+        """
+        RLE маски на весь кадр без построения полной маски: серии единиц
+        внутри каждого столбца рамки переводятся в линейные индексы кадра.
+        """
+        height = self.image_shape[0]
+        x, y, box_width, box_height = self._boxes[index]
+        total = self.image_shape[0] * self.image_shape[1]
+        if box_width == 0:
+            return np.array([total], dtype=np.int64)
+
+        crop = _decode(self._counts[index], box_height, box_width)
+        # Нулевая строка между столбцами отделяет серии соседних столбцов
+        padded = np.zeros((box_width, box_height + 1), dtype=np.int8)
+        padded[:, 1:] = crop.T
+        changes = np.diff(padded.ravel(), append=0)
+        stride = box_height + 1
+
+        def to_frame(indices):
+            column, row = np.divmod(indices, stride)
+            return (x + column) * height + y + row - 1
+
+        # Первый пиксель серии и последний пиксель серии + 1
+        starts = to_frame(np.flatnonzero(changes == 1) + 1)
+        ends = to_frame(np.flatnonzero(changes == -1)) + 1
+        # Серии, продолжающиеся в следующем столбце кадра, объединяются
+        joined = np.flatnonzero(ends[:-1] == starts[1:])
+        starts = np.delete(starts, joined + 1)
+        ends = np.delete(ends, joined)
+        boundaries = np.concatenate(
+            [[0], np.column_stack([starts, ends]).ravel(), [total]]
+        )
+        counts = np.diff(boundaries)
+        return counts[:-1] if counts[-1] == 0 else counts
+
+
+def _encode(mask: np.ndarray) -> np.ndarray:
+    """RLE по столбцам (первая серия — нули)"""
+    flat = np.ravel(mask, order="F").astype(np.int8)
+    changes = np.flatnonzero(np.diff(flat, prepend=0, append=0))
+    boundaries = np.concatenate([[0], changes, [flat.size]])
+    counts = np.diff(boundaries)
+    if len(counts) > 1 and counts[-1] == 0:
+        counts = counts[:-1]
+    return counts.astype(np.uint32)
+
+
+def _decode(counts: np.ndarray, height: int, width: int) -> np.ndarray:
+    """Обратное преобразование RLE в маску (height, width)"""
+    values = np.arange(len(counts)) % 2 == 1
+    flat = np.repeat(values, counts)
+    return flat.reshape((height, width), order="F")
@@ -1,8 +1,14 @@
+"""Работаем с моделями Detectron2"""
+
 import os
+import threading
 import torch
 from detectron2.config import get_cfg
+from detectron2.engine import DefaultPredictor
 from detectron2.model_zoo import model_zoo
 from detectron2.utils.logger import setup_logger
+
+from particleanalyzer.core.ModelCache import ModelCache
 import logging
 import warnings
 
@@ -11,8 +17,6 @@ logger.setLevel("ERROR")
 logging.disable(logging.CRITICAL)
 warnings.filterwarnings("ignore", category=UserWarning)
 
-"""Работаем с моделями Detectron2"""
-
 
 class Detectron2Loader:
     MODEL_MAPPING = {
@@ -23,10 +27,15 @@ class Detectron2Loader:
         }
     }
 
-    def __init__(self, device=None):
+    def __init__(self, device=None, cache: ModelCache = None):
         self._base_path = os.path.join(os.path.dirname(__file__), "..", "model")
         self.device = self._get_device(device)
+        # Конфиги и predictor строятся при первом обращении; predictor
+        # живет в общем кэше моделей, граф и веса строятся один раз
         self.configs = {}
+        self.cache = cache if cache is not None else ModelCache()
+        self._locks = {name: threading.Lock() for name in self.__class__.MODEL_MAPPING}
+        self._configs_lock = threading.Lock()
         self._init_models()
 
     def _get_device(self, device):
@@ -50,10 +59,6 @@ class Detectron2Loader:
         return cfg
 
     def _init_models(self):
-        self.configs = {
-            name: self._init_model_config(name) for name in self.__class__.MODEL_MAPPING
-        }
-
         self.config_paths = {
             name: self._model_path(self.__class__.MODEL_MAPPING[name]["config_path"])
             for name in self.__class__.MODEL_MAPPING
@@ -64,17 +69,68 @@ class Detectron2Loader:
             for name in self.__class__.MODEL_MAPPING
         }
 
-        self._save_configs()
-
-    def _save_configs(self):
-        for model_name, cfg in self.configs.items():
-            with open(self.config_paths[model_name], "w") as f:
-                f.write(cfg.dump())
+    def _save_config(self, model_name: str, cfg):
+        with open(self.config_paths[model_name], "w") as f:
+            f.write(cfg.dump())
 
     def get_config(self, model_name: str):
-        return self.configs.get(model_name)
+        if model_name not in self.__class__.MODEL_MAPPING:
+            return None
+        with self._configs_lock:
+            if model_name not in self.configs:
+                cfg = self._init_model_config(model_name)
+                self._save_config(model_name, cfg)
+                self.configs[model_name] = cfg
+            return self.configs[model_name]
+
+    def get_predictor(self, model_name: str):
+        """Кэшированный DefaultPredictor (строится при первом обращении)"""
+        cfg = self.get_config(model_name)
+        if cfg is None:
+            raise ValueError(f"Модель {model_name} не найдена")
+        # Копия конфига: общий cfg не меняется порогами запросов
+        return self.cache.get(
+            ("detectron2", model_name),
+            lambda: DefaultPredictor(cfg.clone()),
+            ModelCache.file_size(self.get_model_path(model_name)),
+        )
+
+    def predict(
+        self,
+        model_name: str,
+        image_np,
+        confidence_threshold=0.5,
+        iou_threshold=0.5,
+        max_detections=100,
+    ):
+        """
+        Предсказание кэшированным predictor с порогами текущего запроса.
+
+        Пороги задаются прямо в головах ROI построенной модели; вызов
+        выполняется под блокировкой модели, поэтому одновременные запросы
+        из очереди Gradio не видят чужих порогов.
+        """
+        predictor = self.get_predictor(model_name)
+        with self._locks[model_name]:
+            self._set_thresholds(
+                predictor.model, confidence_threshold, iou_threshold, max_detections
+            )
+            return predictor(image_np)["instances"]
+
+    @staticmethod
+    def _set_thresholds(model, score_threshold, nms_threshold, max_detections):
+        """Пороги инференса для FastRCNNOutputLayers (в Cascade — всех этапов)"""
+        predictors = model.roi_heads.box_predictor
+        if not isinstance(predictors, torch.nn.ModuleList):
+            predictors = [predictors]
+        for box_predictor in predictors:
+            box_predictor.test_score_thresh = float(score_threshold)
+            box_predictor.test_nms_thresh = float(nms_threshold)
+            box_predictor.test_topk_per_image = int(max_detections)
 
     def get_config_path(self, model_name: str):
+        # Файл конфига записывается при его построении
+        self.get_config(model_name)
         return self.config_paths.get(model_name)
 
     def get_model_path(self, model_name: str):
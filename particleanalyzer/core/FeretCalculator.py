@@ -0,0 +1,257 @@
+"""Вычисление диаметров Ферета по выпуклой оболочке контура"""
+
+import cv2
+import numpy as np
+
+
+class FeretCalculator:
+    """
+    Диаметры Ферета (max, min, mean) и их углы.
+
+    Режим "exact" — точный расчет методом вращающихся калиперов по выпуклой
+    оболочке. Режим "sampled" — совместимость с прежним перебором углов
+    0..179° с шагом 1° (значения совпадают с поворотом через cv2.transform).
+    Угол θ задает направление измерения (cos θ, sin θ) в координатах изображения.
+
+    Контуры передаются в рваном формате: points — все точки подряд (N, 2),
+    offsets — границы контуров (n + 1,).
+    """
+
+    MODES = ("exact", "sampled")
+
+    # Коэффициенты поворота для режима совместимости (как cv2.getRotationMatrix2D)
+    SAMPLED_ANGLES = np.arange(0, 180, 1)
+    _SAMPLED_ROTATIONS = np.array(
+        [cv2.getRotationMatrix2D((0, 0), int(a), 1)[0, :2] for a in SAMPLED_ANGLES]
+    )
+    _SAMPLED_CHUNK = 16384
+
+    def __init__(self, mode: str = "exact"):
+        if mode not in self.MODES:
+            raise ValueError(f"Неизвестный режим расчета Feret: {mode}")
+        self.mode = mode
+
+    def compute(self, points: np.ndarray):
+        """Возвращает (feret_max, feret_min, feret_mean, angle_max, angle_min)"""
+        points = np.asarray(points, dtype=np.int32).reshape(-1, 2)
+        results = self.compute_batch(points, np.array([0, len(points)]))
+        return tuple(float(values[0]) for values in results)
+
+    def compute_batch(self, points: np.ndarray, offsets: np.ndarray):
+        """Массивы feret_max, feret_min, feret_mean, angle_max, angle_min (n,)"""
+        return self.compute_from_hulls(*self.convex_hulls(points, offsets))
+
+    def compute_from_hulls(self, hulls: np.ndarray, offsets: np.ndarray):
+        """То же по заранее построенным выпуклым оболочкам"""
+        if self.mode == "sampled":
+            return self.sampled(hulls, offsets)
+        return self.rotating_calipers(hulls, offsets)
+
+    @classmethod
+    def diameters(cls, hulls: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+        """
+        Максимальное расстояние между точками контура (диаметр оболочки).
+
+        Совпадает с максимумом pdist по всем точкам: самая далекая пара
+        всегда лежит на выпуклой оболочке.
+        """
+        return cls.rotating_calipers(hulls, offsets)[0]
+
+    @staticmethod
+    def convex_hulls(points: np.ndarray, offsets: np.ndarray):
+        """Выпуклые оболочки всех контуров в том же рваном формате"""
+        points = np.asarray(points, dtype=np.int32).reshape(-1, 2)
+        hulls = [
+            cv2.convexHull(points[start:end].reshape(-1, 1, 2)).reshape(-1, 2)
+            for start, end in zip(offsets[:-1], offsets[1:])
+        ]
+        hull_offsets = np.zeros(len(hulls) + 1, dtype=np.int64)
+        np.cumsum([len(h) for h in hulls], out=hull_offsets[1:])
+        if not hulls:
+            return np.empty((0, 2), dtype=np.int32), hull_offsets
+        return np.concatenate(hulls), hull_offsets
+
+    @classmethod
+    def sampled(cls, hulls: np.ndarray, offsets: np.ndarray):
+        """Перебор углов с шагом 1° (векторизованная версия прежнего цикла)"""
+        hulls = np.asarray(hulls, dtype=np.float64).reshape(-1, 2)
+        offsets = np.asarray(offsets, dtype=np.int64)
+        n = len(offsets) - 1
+        results = np.zeros((5, n), dtype=np.float64)
+        alpha, beta = cls._SAMPLED_ROTATIONS[:, 0], cls._SAMPLED_ROTATIONS[:, 1]
+
+        first = 0
+        while first < n:
+            # Порция оболочек примерно на _SAMPLED_CHUNK вершин
+            last = int(
+                np.searchsorted(offsets, offsets[first] + cls._SAMPLED_CHUNK, "right")
+            )
+            last = min(max(last - 1, first + 1), n)
+            chunk = hulls[offsets[first] : offsets[last]]
+            starts = offsets[first:last] - offsets[first]
+            # cv2.transform для int32 округляет координаты до ближайшего целого
+            x_coords = np.rint(chunk[:, 0, None] * alpha + chunk[:, 1, None] * beta)
+            feret_values = np.maximum.reduceat(
+                x_coords, starts, axis=0
+            ) - np.minimum.reduceat(x_coords, starts, axis=0)
+
+            i_max = np.argmax(feret_values, axis=1)
+            i_min = np.argmin(feret_values, axis=1)
+            rows = np.arange(len(starts))
+            results[:, first:last] = (
+                feret_values[rows, i_max],
+                feret_values[rows, i_min],
+                feret_values.mean(axis=1),
+                cls.SAMPLED_ANGLES[i_max],
+                cls.SAMPLED_ANGLES[i_min],
+            )
+            first = last
+
+        return tuple(results)
+
+    @staticmethod
+    def rotating_calipers(hulls: np.ndarray, offsets: np.ndarray):
+        """Точные диаметры Ферета методом вращающихся калиперов"""
+        pts = np.asarray(hulls, dtype=np.float64).reshape(-1, 2)
+        offsets = np.asarray(offsets, dtype=np.int64)
+        n = len(offsets) - 1
+        results = np.zeros((5, n), dtype=np.float64)
+        if n == 0:
+            return tuple(results)
+
+        seg = np.repeat(np.arange(n), np.diff(offsets))
+        nonempty = offsets[1:] > offsets[:-1]
+        nxt = np.arange(len(pts)) + 1
+        nxt[offsets[1:][nonempty] - 1] = offsets[:-1][nonempty]
+
+        # Убираем повторяющиеся вершины (ребра нулевой длины)
+        keep = np.any(pts != pts[nxt], axis=1)
+        pts, seg = pts[keep], seg[keep]
+        counts = np.bincount(seg, minlength=n)
+
+        # Вырожденные оболочки (точка или отрезок)
+        regular = counts >= 3
+        for i in np.flatnonzero(~regular):
+            results[:, i] = _degenerate_feret(pts[seg == i])
+        if not regular.any():
+            return tuple(results)
+
+        pts = pts[regular[seg]]
+        counts = counts[regular]
+        starts = np.zeros(len(counts), dtype=np.int64)
+        np.cumsum(counts[:-1], out=starts[1:])
+        local_seg = np.repeat(np.arange(len(counts)), counts)
+        seg_start, seg_len = starts[local_seg], counts[local_seg]
+        position = np.arange(len(pts)) - seg_start
+        nxt = seg_start + (position + 1) % seg_len
+
+        # Ориентация против часовой стрелки: углы ребер возрастают
+        x, y = pts[:, 0], pts[:, 1]
+        signed_area = np.add.reduceat(x * y[nxt] - x[nxt] * y, starts)
+        flip = (signed_area < 0)[local_seg]
+        pts = pts[seg_start + np.where(flip, seg_len - 1 - position, position)]
+
+        edges = pts[nxt] - pts
+        edge_len = np.hypot(edges[:, 0], edges[:, 1])
+        raw_angles = np.arctan2(edges[:, 1], edges[:, 0])
+        # Развертка углов целым числом оборотов внутри оболочки: результат
+        # не зависит от соседних оболочек в массиве (и от деления на части)
+        wraps = np.zeros(len(raw_angles), dtype=np.int64)
+        steps = np.diff(raw_angles)
+        wraps[1:] = (steps < -np.pi).astype(np.int64) - (steps > np.pi)
+        wraps[starts] = 0
+        wraps = np.cumsum(wraps)
+        edge_angles = raw_angles + 2 * np.pi * (wraps - wraps[seg_start])
+        first_angle = edge_angles[seg_start]
+
+        # Для каждого ребра — противолежащая опорная вершина (калипер на pi)
+        targets = first_angle + np.mod(edge_angles + np.pi - first_angle, 2 * np.pi)
+        found = _segment_searchsorted(edge_angles, local_seg, targets, local_seg)
+        antipodal = seg_start + (found - seg_start) % seg_len
+
+        # Минимальная ширина: расстояние от ребра до противолежащей вершины
+        to_antipodal = pts[antipodal] - pts
+        widths = (
+            edges[:, 0] * to_antipodal[:, 1] - edges[:, 1] * to_antipodal[:, 0]
+        ) / edge_len
+        i_min = _segment_argmax(-widths, starts)
+        feret_min = widths[i_min]
+        angle_min = _normalize_angles(edge_angles[i_min] - np.pi / 2)
+
+        # Диаметр: максимум по антиподальным парам (вершины ребра и соседи
+        # противолежащей вершины — на случай параллельных ребер)
+        vertices = np.arange(len(pts))
+        deltas = np.stack(
+            [
+                pts[seg_start + (antipodal - seg_start + step) % seg_len] - pts[first]
+                for first in (vertices, nxt)
+                for step in (-1, 0, 1)
+            ]
+        )
+        # sqrt суммы квадратов (а не hypot) — так же, как в pdist
+        distances = np.sqrt(deltas[..., 0] ** 2 + deltas[..., 1] ** 2)
+        best_pair = np.argmax(distances, axis=0)
+        distances = distances[best_pair, vertices]
+        deltas = deltas[best_pair, vertices]
+        i_max = _segment_argmax(distances, starts)
+        feret_max = distances[i_max]
+        angle_max = _normalize_angles(np.arctan2(deltas[i_max, 1], deltas[i_max, 0]))
+
+        # Средний диаметр Ферета по формуле Коши: периметр оболочки / pi
+        feret_mean = np.add.reduceat(edge_len, starts) / np.pi
+
+        results[:, regular] = (feret_max, feret_min, feret_mean, angle_max, angle_min)
+        return tuple(results)
+
+
+def _degenerate_feret(pts: np.ndarray):
+    """Оболочка из одной точки или отрезка"""
+    if len(pts) < 2:
+        return 0.0, 0.0, 0.0, 0.0, 0.0
+    dx, dy = pts[1] - pts[0]
+    length = float(np.sqrt(dx**2 + dy**2))
+    angle = float(_normalize_angles(np.arctan2(dy, dx)))
+    return length, 0.0, 2 * length / np.pi, angle, (angle + 90.0) % 180.0
+
+
+def _normalize_angles(radians):
+    """Приведение направления к диапазону [0, 180) градусов"""
+    angles = np.mod(np.degrees(radians), 180.0)
+    return np.where(angles >= 180.0, 0.0, angles)
+
+
+def _segment_searchsorted(
+    values: np.ndarray,
+    segments: np.ndarray,
+    queries: np.ndarray,
+    query_segments: np.ndarray,
+) -> np.ndarray:
+    """
+    np.searchsorted(side="left") внутри сегментов рваного массива.
+
+    values упорядочены по сегментам и возрастают внутри сегмента. Возвращает
+    глобальные индексы. Значения не сдвигаются, поэтому точность сравнения
+    не зависит от числа сегментов.
+    """
+    keys = np.concatenate([values, queries])
+    key_segments = np.concatenate([segments, query_segments])
+    # При равенстве запрос идет раньше значения (side="left")
+    is_value = np.concatenate(
+        [np.ones(len(values), dtype=bool), np.zeros(len(queries), dtype=bool)]
+    )
+    order = np.lexsort((is_value, keys, key_segments))
+    sorted_is_value = is_value[order]
+    values_before = np.cumsum(sorted_is_value) - sorted_is_value
+    found = np.empty(len(queries), dtype=np.int64)
+    found[order[~sorted_is_value] - len(values)] = values_before[~sorted_is_value]
+    return found
+
+
+def _segment_argmax(values: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    """Индекс первого максимума в каждом сегменте рваного массива"""
+    segment_max = np.maximum.reduceat(values, starts)
+    counts = np.diff(np.append(starts, len(values)))
+    hits = np.flatnonzero(values == np.repeat(segment_max, counts))
+    segment_of_hit = np.searchsorted(starts, hits, side="right") - 1
+    _, first_hit = np.unique(segment_of_hit, return_index=True)
+    return hits[first_hit]
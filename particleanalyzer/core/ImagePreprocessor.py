@@ -1,3 +1,5 @@
+"""Подготовка изображения перед анализом"""
+
 import os
 import pandas as pd
 import cv2
@@ -7,8 +9,6 @@ import gradio as gr
 from datetime import datetime
 from particleanalyzer.core.languages import translations
 
-"""Подготовка изображения перед анализом"""
-
 
 class ImagePreprocessor:
     processing_profiles = {
@@ -60,8 +60,7 @@ class ImagePreprocessor:
             image, scale_factor_glob = self.resize_image(image, solution, sahi_mode)
 
             # Конвертация цветовых пространств
-            orig_image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
-            gray_image = cv2.cvtColor(orig_image, cv2.COLOR_BGR2GRAY)
+            orig_image, gray_image = self.convert_colors(image)
             pbar.update(1)
             return image, orig_image, gray_image, scale, scale_factor_glob
 
@@ -69,6 +68,49 @@ class ImagePreprocessor:
             print(f"Ошибка при обработке изображения: {e}")
             return None, None, None, None, None
 
+    def restore(
+        self,
+        image: np.ndarray,
+        prepared: np.ndarray,
+        scale: float,
+        request: gr.Request,
+        pbar: tqdm,
+        pr: tqdm,
+        lang: str,
+    ):
+        """
+        То же, что preprocess_image, для подготовленного ранее изображения
+        (из кэша): без изменения размера. Возвращает те же значения.
+        """
+        self.lang = lang
+        pbar.set_description(self._get_translation("Загрузка изображения..."))
+        pr(0.25, desc=self._get_translation("Загрузка изображения..."))
+        self._save_image_metadata(image, request)
+        orig_image, gray_image = self.convert_colors(prepared)
+        pbar.update(1)
+        return (
+            prepared,
+            orig_image,
+            gray_image,
+            scale,
+            self.scale_factor(image.shape, prepared.shape),
+        )
+
+    @staticmethod
+    def convert_colors(image: np.ndarray):
+        """Изображение в BGR и в оттенках серого"""
+        orig_image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+        return orig_image, cv2.cvtColor(orig_image, cv2.COLOR_BGR2GRAY)
+
+    @staticmethod
+    def scale_factor(original_shape, resized_shape) -> float:
+        """Коэффициент масштабирования по размерам до и после изменения"""
+        if tuple(original_shape[:2]) == tuple(resized_shape[:2]):
+            return 1
+        h, w = original_shape[:2]
+        new_h, new_w = resized_shape[:2]
+        return (w / new_w + h / new_h) / 2
+
     @staticmethod
     def resize_image(
         image: np.ndarray,
@@ -93,7 +135,9 @@ class ImagePreprocessor:
                 assert (
                     abs(scale_x - scale_y) < 0.01
                 ), "Изображение масштабировалось с изменением пропорций"
-                scale_factor_glob = (scale_x + scale_y) / 2
+                scale_factor_glob = ImagePreprocessor.scale_factor(
+                    (h, w), new_size[::-1]
+                )
 
                 # print(f"Изменение размера: {w}x{h} → {new_size[0]}x{new_size[1]}")
                 return (
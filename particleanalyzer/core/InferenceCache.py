@@ -0,0 +1,245 @@
+"""Кэш результатов обнаружения по содержимому изображения и параметрам"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from particleanalyzer.core.MaskTile import MaskTile
+
+
+class InferenceCache:
+    """
+    LRU-кэш найденных частиц: контуры, маски, именованные изображения
+    (подготовленное и, если было улучшение, улучшенное) и сведения об
+    обнаружении (info, значения JSON).
+
+    Ключ — хэш пикселей исходного изображения и параметров подготовки и
+    модели, от которых зависит результат; повторная обработка того же
+    снимка с теми же параметрами (например, после смены параметров
+    отрисовки) не запускает ни подготовку, ни улучшение, ни модель.
+    Память ограничена max_bytes; directory — дополнительный дисковый
+    уровень (npz), переживающий перезапуск, с ограничением
+    max_disk_bytes (None — без ограничения).
+    max_bytes=0 и directory=None — кэш отключен.
+    """
+
+    # Входит в ключ: записи другого формата на диске не находятся
+    FORMAT_VERSION = 2
+
+    def __init__(
+        self,
+        max_bytes: int = 256 * 2**20,
+        directory: str = None,
+        max_disk_bytes: int = None,
+    ):
+        self._entries = OrderedDict()  # ключ -> (запись, размер)
+        self._used_bytes = 0
+        self._lock = threading.Lock()
+        self.configure(max_bytes, directory, max_disk_bytes)
+
+    def configure(
+        self,
+        max_bytes: int = 256 * 2**20,
+        directory: str = None,
+        max_disk_bytes: int = None,
+    ):
+        if max_bytes < 0:
+            raise ValueError("Размер кэша не может быть отрицательным")
+        self.max_bytes = int(max_bytes)
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            self._evict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0 or bool(self.directory)
+
+    @property
+    def used_bytes(self) -> int:
+        return self._used_bytes
+
+    def __len__(self):
+        return len(self._entries)
+
+    @classmethod
+    def key(cls, image: np.ndarray, **params) -> str:
+        """
+        Ключ записи: хэш версии формата, пикселей, формы и типа изображения
+        и параметров
+        """
+        image = np.ascontiguousarray(image)
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(f"{cls.FORMAT_VERSION}{image.shape}{image.dtype}".encode())
+        digest.update(memoryview(image).cast("B"))
+        digest.update(json.dumps(params, sort_keys=True, default=str).encode())
+        return digest.hexdigest()
+
+    def get(self, key: str):
+        """(контуры, маски, словарь изображений, info) либо None при промахе"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                entry = entry[0]
+        if entry is None and self.directory:
+            entry = self._load(key)
+            if entry is not None:
+                self._remember(key, entry)
+        if entry is None:
+            return None
+        # Списки копируются: запись в кэше не меняется вызывающим кодом
+        contours, masks, images, info = entry
+        return list(contours), list(masks), dict(images), dict(info)
+
+    def put(
+        self,
+        key: str,
+        contours: list,
+        masks: list,
+        images: dict = None,
+        info: dict = None,
+    ):
+        if not self.enabled:
+            return
+        entry = (list(contours), list(masks), dict(images or {}), dict(info or {}))
+        self._remember(key, entry)
+        if self.directory:
+            self._store(key, entry)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._used_bytes = 0
+
+    def _remember(self, key: str, entry):
+        size = self._entry_size(entry)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._used_bytes -= previous[1]
+            self._entries[key] = (entry, size)
+            self._used_bytes += size
+            self._evict()
+
+    def _evict(self):
+        """Вытеснение по LRU (вызывается под self._lock)"""
+        while self._entries and self._used_bytes > self.max_bytes:
+            _, (_, size) = self._entries.popitem(last=False)
+            self._used_bytes -= size
+
+    @staticmethod
+    def _entry_size(entry) -> int:
+        contours, masks, images, _ = entry
+        size = sum(np.asarray(contour).nbytes for contour in contours)
+        size += sum(
+            mask.mask.nbytes if isinstance(mask, MaskTile) else np.asarray(mask).nbytes
+            for mask in masks
+        )
+        return size + sum(image.nbytes for image in images.values())
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.npz")
+
+    def _store(self, key: str, entry):
+        """
+        Запись на диск: контуры — общий массив точек и смещения, маски —
+        фрагменты по рамкам (полные маски сохраняются как фрагмент на весь
+        кадр) в упакованных битах, изображения — под именами image_<имя>,
+        info — строкой JSON. Файл заменяется атомарно.
+        """
+        contours, masks, images, info = entry
+        contours = [np.asarray(contour) for contour in contours]
+        tiles = [
+            mask if isinstance(mask, MaskTile) else MaskTile(mask, 0, 0, mask.shape)
+            for mask in masks
+        ]
+        arrays = {
+            "points": (
+                np.concatenate(contours).reshape(-1, 2)
+                if contours
+                else np.empty((0, 2), dtype=np.int32)
+            ),
+            "offsets": np.cumsum([0] + [len(contour) for contour in contours]),
+            "boxes": np.array(
+                [(t.x, t.y, *t.mask.shape, *t.image_shape) for t in tiles],
+                dtype=np.int64,
+            ).reshape(-1, 6),
+            "bits": np.packbits(
+                np.concatenate([t.mask.reshape(-1) for t in tiles])
+                if tiles
+                else np.empty(0, dtype=bool)
+            ),
+            "info": np.array(json.dumps(info)),
+        }
+        arrays.update({f"image_{name}": image for name, image in images.items()})
+
+        descriptor, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "wb") as file:
+                np.savez_compressed(file, **arrays)
+            os.replace(temp_path, self._path(key))
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return
+        self._trim_disk()
+
+    def _load(self, key: str):
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                points, offsets = data["points"], data["offsets"]
+                boxes, bits = data["boxes"], data["bits"]
+                info = json.loads(str(data["info"]))
+                images = {
+                    name[len("image_") :]: data[name]
+                    for name in data.files
+                    if name.startswith("image_")
+                }
+            # Отметка использования для вытеснения на диске
+            os.utime(path)
+        except (OSError, KeyError, ValueError):
+            return None
+
+        contours = [points[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+        sizes = boxes[:, 2] * boxes[:, 3]
+        flat = np.unpackbits(bits, count=int(sizes.sum())).astype(bool)
+        masks = [
+            MaskTile(piece.reshape(height, width), x, y, (image_h, image_w))
+            for piece, (x, y, height, width, image_h, image_w) in zip(
+                np.split(flat, np.cumsum(sizes)[:-1]), boxes
+            )
+        ]
+        return contours, masks, images, info
+
+    def _trim_disk(self):
+        """
+        Удаление давно использованных файлов сверх max_disk_bytes
+        (последний записанный файл остается всегда)
+        """
+        if self.max_disk_bytes is None:
+            return
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".npz"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files)[:-1]:
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
@@ -0,0 +1,144 @@
+"""Объединение параллельных запросов инференса в пакеты"""
+
+import threading
+import numpy as np
+
+
+class InferenceScheduler:
+    """
+    Микропакетирование запросов разных пользователей между
+    ParticleAnalyzer и ModelManager.
+
+    Первый запрос к модели с данным профилем входа открывает окно на
+    max_wait секунд; запросы с тем же профилем и теми же параметрами
+    модели, пришедшие за это время, проходят через
+    ModelManager.predict_batch одним прямым проходом. Пакет запускается
+    раньше, если набралось max_batch_size изображений. Инференс выполняет
+    поток, открывший окно, результаты возвращаются каждому запросу.
+
+    Прямые проходы одной модели идут по очереди: пока модель занята,
+    окно остается открытым и пополняется. max_batch_size=1 или
+    max_wait=0 — без пакетирования.
+    """
+
+    def __init__(self, model_manager, max_batch_size: int = 8, max_wait: float = 0.015):
+        self.model_manager = model_manager
+        self.configure(max_batch_size, max_wait)
+        self._lock = threading.Lock()
+        self._pending = {}  # ключ -> открытый _Batch
+        self._model_locks = {}
+
+    def configure(self, max_batch_size: int = 8, max_wait: float = 0.015):
+        if max_batch_size < 1:
+            raise ValueError("Размер пакета должен быть не меньше 1")
+        if max_wait < 0:
+            raise ValueError("Время ожидания пакета не может быть отрицательным")
+        self.max_batch_size = int(max_batch_size)
+        self.max_wait = float(max_wait)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_batch_size > 1 and self.max_wait > 0
+
+    def predict(self, model_name: str, image: np.ndarray, **kwargs):
+        """
+        Предсказание для одного изображения (как один элемент
+        ModelManager.predict_batch); kwargs — параметры модели.
+        """
+        if not self.enabled:
+            with self._model_lock(model_name):
+                return self.model_manager.predict_batch(
+                    model_name, [image], batch_size=1, **kwargs
+                )[0]
+
+        key = (model_name, self._profile(model_name, image), _freeze(kwargs))
+        request = _Request(image)
+        with self._lock:
+            batch = self._pending.get(key)
+            leader = batch is None
+            if leader:
+                batch = self._pending[key] = _Batch()
+            batch.requests.append(request)
+            if len(batch.requests) >= self.max_batch_size:
+                # Пакет заполнен: новые запросы открывают следующее окно
+                del self._pending[key]
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(self.max_wait)
+            with self._model_lock(model_name):
+                with self._lock:
+                    if self._pending.get(key) is batch:
+                        del self._pending[key]
+                self._run(model_name, batch.requests, kwargs)
+
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def predict_batch(
+        self, model_name: str, images: list, batch_size: int = 8, **kwargs
+    ) -> list:
+        """
+        Готовый пакет одного запроса (например, фрагменты изображения):
+        без окна ожидания, в очереди прямых проходов модели.
+        """
+        with self._model_lock(model_name):
+            return self.model_manager.predict_batch(
+                model_name, images, batch_size=batch_size, **kwargs
+            )
+
+    def _model_lock(self, model_name: str) -> threading.Lock:
+        with self._lock:
+            return self._model_locks.setdefault(model_name, threading.Lock())
+
+    def _profile(self, model_name: str, image: np.ndarray):
+        """
+        Профиль входа: изображения одного профиля дают одинаковый тензор.
+        ONNX-модели приводят любое изображение к размеру входа модели,
+        YOLO — только изображения одного размера (общий letterbox).
+        """
+        if model_name in self.model_manager.onnx_loader.MODEL_MAPPING:
+            return None
+        return image.shape
+
+    def _run(self, model_name: str, requests: list, kwargs: dict):
+        try:
+            results = self.model_manager.predict_batch(
+                model_name,
+                [request.image for request in requests],
+                batch_size=len(requests),
+                **kwargs,
+            )
+            for request, result in zip(requests, results):
+                request.result = result
+        except Exception as e:
+            for request in requests:
+                request.error = e
+        finally:
+            for request in requests:
+                request.done.set()
+
+
+class _Request:
+    """Изображение запроса и место для его результата"""
+
+    def __init__(self, image: np.ndarray):
+        self.image = image
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class _Batch:
+    """Запросы одного окна; full — пакет заполнен до max_batch_size"""
+
+    def __init__(self):
+        self.requests = []
+        self.full = threading.Event()
+
+
+def _freeze(kwargs: dict):
+    """Параметры модели в виде ключа словаря"""
+    return tuple(sorted((name, str(value)) for name, value in kwargs.items()))
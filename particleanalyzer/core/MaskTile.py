@@ -0,0 +1,109 @@
+"""Маска объекта, обрезанная по рамке детекции"""
+
+import cv2
+import numpy as np
+
+
+class MaskTile:
+    """
+    Бинарная маска объекта в пределах рамки и ее положение на изображении.
+
+    Память пропорциональна площади рамки, а не кадра; полноразмерная маска
+    строится только по запросу (to_full).
+    """
+
+    __slots__ = ("mask", "x", "y", "image_shape")
+
+    def __init__(self, mask: np.ndarray, x: int, y: int, image_shape):
+        self.mask = np.asarray(mask, dtype=bool)
+        self.x = int(x)
+        self.y = int(y)
+        self.image_shape = tuple(image_shape[:2])
+
+    @classmethod
+    def from_boxes(cls, masks, boxes, padding: int = 1):
+        """
+        Фрагменты масок (N, H, W) по рамкам (N, 4) в координатах масок.
+
+        masks — массив NumPy или тензор torch (в том числе на GPU): фрагменты
+        вырезаются на месте, склеиваются в один плоский буфер и копируются в
+        память процесса одним переносом. Полная маска N x H x W не копируется.
+        """
+        image_shape = tuple(masks.shape[1:])
+        height, width = image_shape
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        if len(boxes) == 0:
+            return []
+
+        x1 = np.clip(np.floor(boxes[:, 0]) - padding, 0, width - 1).astype(int)
+        y1 = np.clip(np.floor(boxes[:, 1]) - padding, 0, height - 1).astype(int)
+        x2 = np.clip(np.ceil(boxes[:, 2]) + padding, x1 + 1, width).astype(int)
+        y2 = np.clip(np.ceil(boxes[:, 3]) + padding, y1 + 1, height).astype(int)
+
+        pieces = [
+            masks[i, y1[i] : y2[i], x1[i] : x2[i]].reshape(-1)
+            for i in range(len(boxes))
+        ]
+        if hasattr(masks, "cpu"):
+            import torch
+
+            flat = (torch.cat(pieces) > 0.5).cpu().numpy()
+        else:
+            flat = np.concatenate(pieces) > 0.5
+
+        sizes = (y2 - y1) * (x2 - x1)
+        return [
+            cls(piece.reshape(bottom - top, right - left), left, top, image_shape)
+            for piece, left, top, right, bottom in zip(
+                np.split(flat, np.cumsum(sizes)[:-1]), x1, y1, x2, y2
+            )
+        ]
+
+    @property
+    def bbox(self):
+        """Рамка (x1, y1, x2, y2) в координатах изображения"""
+        height, width = self.mask.shape
+        return self.x, self.y, self.x + width, self.y + height
+
+    @property
+    def area(self) -> int:
+        return int(np.count_nonzero(self.mask))
+
+    def to_full(self) -> np.ndarray:
+        """Полноразмерная маска (H, W) bool"""
+        full = np.zeros(self.image_shape, dtype=bool)
+        x1, y1, x2, y2 = self.bbox
+        full[y1:y2, x1:x2] = self.mask
+        return full
+
+    def main_contour(self):
+        """Внешний контур наибольшей площади (k, 2) в координатах изображения"""
+        found = self._external_contours()
+        if not found:
+            return None
+        return max(found, key=cv2.contourArea).reshape(-1, 2)
+
+    def merged_contour(self):
+        """
+        Все внешние контуры, соединенные в один (как masks.xy в ultralytics):
+        (k, 2) в координатах изображения
+        """
+        found = self._external_contours()
+        if not found:
+            return None
+        if len(found) == 1:
+            return found[0].reshape(-1, 2)
+        from ultralytics.data.converter import merge_multi_segment
+
+        return np.concatenate(
+            merge_multi_segment([contour.reshape(-1, 2) for contour in found])
+        )
+
+    def _external_contours(self):
+        found, _ = cv2.findContours(
+            self.mask.astype(np.uint8),
+            cv2.RETR_EXTERNAL,
+            cv2.CHAIN_APPROX_SIMPLE,
+            offset=(self.x, self.y),
+        )
+        return found
@@ -0,0 +1,112 @@
+"""Общий кэш загруженных моделей с вытеснением по бюджету памяти"""
+
+import gc
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+
+class ModelCache:
+    """
+    LRU-кэш моделей всех загрузчиков (YOLO, ONNX, Detectron2).
+
+    Модель загружается при первом обращении. Размер модели оценивается по
+    файлу весов; когда сумма размеров превышает budget_bytes, вытесняются
+    давно не использованные модели (последняя запрошенная остается всегда).
+    budget_bytes=None — без ограничения.
+    """
+
+    def __init__(self, budget_bytes: int = None):
+        self.budget_bytes = budget_bytes
+        self._entries = OrderedDict()  # ключ -> (модель, размер)
+        self._lock = threading.RLock()
+        self._key_locks = {}
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def used_bytes(self) -> int:
+        return sum(size for _, size in self._entries.values())
+
+    def keys(self):
+        """Ключи загруженных моделей, от давно использованных к недавним"""
+        with self._lock:
+            return list(self._entries)
+
+    def get(self, key, load, size: int = 0):
+        """
+        Модель по ключу; при отсутствии вызывается load().
+
+        Загрузка идет под блокировкой ключа, поэтому параллельные запросы
+        одной модели не загружают ее дважды, а разные модели не ждут друг друга.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key][0]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    return self._entries[key][0]
+            model = load()
+            with self._lock:
+                self._entries[key] = (model, int(size))
+                evicted = self._evict()
+            if evicted:
+                self._release()
+            return model
+
+    def discard(self, key):
+        """Выгрузка модели из кэша"""
+        with self._lock:
+            removed = self._entries.pop(key, None) is not None
+        if removed:
+            self._release()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        self._release()
+
+    def set_budget(self, budget_bytes: int = None):
+        """Новый бюджет памяти с немедленным вытеснением лишнего"""
+        with self._lock:
+            self.budget_bytes = budget_bytes
+            evicted = self._evict()
+        if evicted:
+            self._release()
+
+    @staticmethod
+    def file_size(*paths) -> int:
+        """Оценка размера модели по файлам весов"""
+        return sum(
+            os.path.getsize(path) for path in paths if path and os.path.exists(path)
+        )
+
+    def _evict(self) -> bool:
+        """Вытеснение по LRU (вызывается под self._lock)"""
+        evicted = False
+        while (
+            self.budget_bytes is not None
+            and len(self._entries) > 1
+            and self.used_bytes > self.budget_bytes
+        ):
+            self._entries.popitem(last=False)
+            evicted = True
+        return evicted
+
+    @staticmethod
+    def _release():
+        """Освобождение памяти вытесненных моделей (в том числе видеопамяти)"""
+        gc.collect()
+        torch = sys.modules.get("torch")
+        if torch is not None and torch.cuda.is_available():
+            torch.cuda.empty_cache()
@@ -2,11 +2,11 @@ import os
 import requests
 import numpy as np
 from tqdm import tqdm
+from .ModelCache import ModelCache
 from .YOLOLoader import YOLOLoader
 from .ONNXLoader import ONNXLoader
 
 try:
-    from detectron2.engine import DefaultPredictor
     from .Detectron2Loader import Detectron2Loader
 
     DETECTRON2_AVAILABLE = True
@@ -15,7 +15,20 @@ except ImportError:
 
 
 class ModelManager:
-    def __init__(self, device=None):
+    def __init__(
+        self,
+        device=None,
+        memory_budget: int = None,
+        preload=(),
+        onnx_options: dict = None,
+    ):
+        """
+        Модели загружаются при первом использовании в общий LRU-кэш.
+
+        memory_budget — бюджет памяти моделей в байтах (None — без ограничения),
+        preload — модели, загружаемые сразу при старте, onnx_options —
+        настройки сессий ONNX Runtime (см. ONNXLoader.configure).
+        """
         self.device = device
         self.SERVER_URL = "https://rybakov-k.ru/model/"
 
@@ -25,7 +38,12 @@ class ModelManager:
         os.makedirs(self.MODELS_DIR, exist_ok=True)
 
         yolo_files = list(YOLOLoader.MODEL_MAPPING.values())
-        onnx_files = list(ONNXLoader.MODEL_MAPPING.values())
+        # Квантованные и экспортированные модели создаются локально и не скачиваются
+        onnx_files = [
+            file_name
+            for model_name, file_name in ONNXLoader.MODEL_MAPPING.items()
+            if not ONNXLoader.is_local(model_name)
+        ]
 
         detectron_files = []
         if DETECTRON2_AVAILABLE:
@@ -36,12 +54,41 @@ class ModelManager:
         # Проверяем и загружаем модели
         self._ensure_models_available(yolo_files + onnx_files + detectron_files)
 
-        # Инициализация загрузчиков
-        self.yolo_loader = YOLOLoader()
-        self.onnx_loader = ONNXLoader(device=self.device)
+        # Инициализация загрузчиков с общим кэшем моделей
+        self.cache = ModelCache(memory_budget)
+        self.yolo_loader = YOLOLoader(cache=self.cache)
+        self.onnx_loader = ONNXLoader(
+            device=self.device, cache=self.cache, **(onnx_options or {})
+        )
         self.detectron_loader = (
-            Detectron2Loader(device=self.device) if DETECTRON2_AVAILABLE else None
+            Detectron2Loader(device=self.device, cache=self.cache)
+            if DETECTRON2_AVAILABLE
+            else None
         )
+        self.preload(preload)
+
+    def preload(self, model_names):
+        """Загружает модели заранее (для Detectron2 — готовый predictor)"""
+        for model_name in model_names or ():
+            if (
+                DETECTRON2_AVAILABLE
+                and model_name in self.detectron_loader.MODEL_MAPPING
+            ):
+                self.detectron_loader.get_predictor(model_name)
+            elif self.get_model(model_name) is None:
+                raise ValueError(f"Model {model_name} could not be loaded")
+
+    def loaded_models(self) -> list:
+        """Имена загруженных моделей, от давно использованных к недавним"""
+        return [
+            key[1]
+            for key in self.cache.keys()
+            if key[0] in ("yolo", "onnx", "detectron2")
+        ]
+
+    def set_memory_budget(self, memory_budget: int = None):
+        """Бюджет памяти моделей в байтах (None — без ограничения)"""
+        self.cache.set_budget(memory_budget)
 
     def _ensure_models_available(self, required_files):
         """Проверяет и загружает необходимые файлы моделей"""
@@ -97,17 +144,51 @@ class ModelManager:
     def get_predictor(self, model_name: str):
         """Для Detectron возвращает готовый predictor"""
         if DETECTRON2_AVAILABLE and model_name in self.detectron_loader.MODEL_MAPPING:
-            cfg = self.detectron_loader.get_config(model_name)
-            return DefaultPredictor(cfg)
+            return self.detectron_loader.get_predictor(model_name)
         return None
 
     def predict(self, model_name: str, image_np: np.ndarray, **kwargs):
         """Универсальный метод для предсказания из numpy массива"""
         if model_name in self.onnx_loader.MODEL_MAPPING:
             return self.onnx_loader.predict_from_numpy(model_name, image_np, **kwargs)
+        if DETECTRON2_AVAILABLE and model_name in self.detectron_loader.MODEL_MAPPING:
+            return self.detectron_loader.predict(model_name, image_np, **kwargs)
 
         raise ValueError(f"Model {model_name} doesn't support predict method")
 
+    def predict_batch(
+        self, model_name: str, images: list, batch_size: int = 8, **kwargs
+    ) -> list:
+        """
+        Предсказание для списка изображений, результаты — по изображениям.
+
+        Для YOLO изображения одного размера объединяются в пакеты до
+        batch_size и проходят через модель одним прямым проходом (letterbox
+        внутри пакета тот же, что и для одиночного изображения). kwargs
+        передаются модели. ONNX-модели собирают пакет в переиспользуемом
+        входном тензоре, остальные модели обрабатываются по одному.
+        """
+        if model_name in self.onnx_loader.MODEL_MAPPING:
+            return self.onnx_loader.predict_batch(
+                model_name, images, batch_size=batch_size, **kwargs
+            )
+        if model_name not in self.yolo_loader.MODEL_MAPPING:
+            return [self.predict(model_name, image, **kwargs) for image in images]
+
+        model = self.yolo_loader.get_model(model_name)
+        groups = {}
+        for index, image in enumerate(images):
+            groups.setdefault(image.shape, []).append(index)
+
+        results = [None] * len(images)
+        for indices in groups.values():
+            for start in range(0, len(indices), max(1, batch_size)):
+                chunk = indices[start : start + max(1, batch_size)]
+                batch = model([images[i] for i in chunk], verbose=False, **kwargs)
+                for index, result in zip(chunk, batch):
+                    results[index] = result
+        return results
+
     def get_model_path(self, model_name: str) -> str:
         """Возвращает путь к модели по её имени"""
         if model_name in self.yolo_loader.MODEL_MAPPING:
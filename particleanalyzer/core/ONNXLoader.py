@@ -1,48 +1,228 @@
+import json
+import math
 import os
+import threading
 import onnxruntime as ort
 import numpy as np
 import cv2
 import supervision as sv
 
+from particleanalyzer.core.MaskTile import MaskTile
+from particleanalyzer.core.ModelCache import ModelCache
+
+# Нормализация ImageNet: (x / 255 - mean) / std = x * scale - shift
+_INPUT_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+_INPUT_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+_INPUT_SCALE = (1 / (255 * _INPUT_STD)).reshape(3, 1, 1).astype(np.float32)
+_INPUT_SHIFT = (_INPUT_MEAN / _INPUT_STD).reshape(3, 1, 1).astype(np.float32)
+
 
 class ONNXLoader:
     MODEL_MAPPING = {
         "RF-DETR Seg (Preview)": "rf_detr_model.onnx",
+        "RF-DETR Seg INT8 (Preview)": "rf_detr_model_int8.onnx",
+        "Yolo11 ONNX (dataset 9)": "Yolo11_d10_batch45.onnx",
+        "Yolo12 ONNX (dataset 9)": "Yolo12_d10_batch45.onnx",
+    }
+    # Модели, создаваемые локально квантованием (ONNXQuantizer) и не
+    # скачиваемые с сервера: имя -> исходная FP32-модель
+    QUANTIZED_MODELS = {
+        "RF-DETR Seg INT8 (Preview)": "RF-DETR Seg (Preview)",
+    }
+    # Модели YOLO-seg, экспортированные из .pt (YOLOLoader.export_onnx):
+    # имя -> модель YOLOLoader
+    EXPORTED_MODELS = {
+        "Yolo11 ONNX (dataset 9)": "Yolo11 (dataset 9)",
+        "Yolo12 ONNX (dataset 9)": "Yolo12 (dataset 9)",
+    }
+    # Цвет полей letterbox и максимум кандидатов NMS, как в ultralytics
+    LETTERBOX_COLOR = 114
+    MAX_NMS_CANDIDATES = 30000
+    MODELS_DIR = os.path.join(os.path.dirname(__file__), "..", "model")
+    # Запас вокруг рамки при увеличении маски (доля размера рамки)
+    MASK_PADDING = 0.1
+    EXECUTION_MODES = {
+        "sequential": ort.ExecutionMode.ORT_SEQUENTIAL,
+        "parallel": ort.ExecutionMode.ORT_PARALLEL,
+    }
+    OPTIMIZATION_LEVELS = {
+        "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+        "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+        "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+        "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
     }
 
-    def __init__(self, device="cpu"):
-        self._base_path = os.path.join(os.path.dirname(__file__), "..", "model")
+    def __init__(
+        self,
+        device="cpu",
+        cache: ModelCache = None,
+        intra_op_threads: int = 0,
+        inter_op_threads: int = 0,
+        execution_mode: str = "sequential",
+        optimization_level: str = "all",
+        cache_optimized: bool = True,
+    ):
+        """
+        Потоки 0 — выбор ONNX Runtime. cache_optimized — сохранять
+        оптимизированный граф на диск и загружать его при следующих запусках.
+        """
+        self._base_path = self.MODELS_DIR
+        self.optimized_dir = os.path.join(self._base_path, "onnx_cache")
         self.device = device
-        self.models = {}
+        # Сессии создаются при первом обращении
+        self.cache = cache if cache is not None else ModelCache()
+        # Свободные входные буферы по (модель, размер пакета, размер входа)
+        self._buffers = {}
+        self._buffers_lock = threading.Lock()
+        self.configure(
+            intra_op_threads,
+            inter_op_threads,
+            execution_mode,
+            optimization_level,
+            cache_optimized,
+        )
 
-        for display_name, file_name in self.MODEL_MAPPING.items():
-            model_path = self._model_path(file_name)
-            if os.path.exists(model_path):
-                try:
-                    providers = ["CPUExecutionProvider"]
-                    if (
-                        device == "cuda"
-                        and "CUDAExecutionProvider" in ort.get_available_providers()
-                    ):
-                        providers = ["CUDAExecutionProvider", "CPUExecutionProvider"]
-
-                    session = ort.InferenceSession(model_path, providers=providers)
-                    self.models[display_name] = {
-                        "session": session,
-                        "input_name": session.get_inputs()[0].name,
-                        "output_names": [
-                            output.name for output in session.get_outputs()
-                        ],
-                    }
-                    # print(f"ONNX модель {display_name} загружена")
-                except Exception as e:
-                    print(f"❌ Ошибка загрузки ONNX модели {display_name}: {e}")
+    def configure(
+        self,
+        intra_op_threads: int = 0,
+        inter_op_threads: int = 0,
+        execution_mode: str = "sequential",
+        optimization_level: str = "all",
+        cache_optimized: bool = True,
+    ):
+        """Новые настройки сессий; уже созданные сессии выгружаются"""
+        if execution_mode not in self.EXECUTION_MODES:
+            raise ValueError(f"Неизвестный режим выполнения: {execution_mode}")
+        if optimization_level not in self.OPTIMIZATION_LEVELS:
+            raise ValueError(f"Неизвестный уровень оптимизации: {optimization_level}")
+        self.intra_op_threads = int(intra_op_threads)
+        self.inter_op_threads = int(inter_op_threads)
+        self.execution_mode = execution_mode
+        self.optimization_level = optimization_level
+        self.cache_optimized = cache_optimized
+        for model_name in self.MODEL_MAPPING:
+            self.cache.discard(("onnx", model_name))
 
     def _model_path(self, name: str) -> str:
         return os.path.join(self._base_path, name)
 
+    @classmethod
+    def is_local(cls, model_name: str) -> bool:
+        """Модель создается локально (квантование, экспорт) и не скачивается"""
+        return model_name in cls.QUANTIZED_MODELS or model_name in cls.EXPORTED_MODELS
+
+    @classmethod
+    def is_available(cls, model_name: str) -> bool:
+        """Модель известна, а локально создаваемая модель еще и создана"""
+        if model_name not in cls.MODEL_MAPPING:
+            return False
+        if not cls.is_local(model_name):
+            return True
+        return os.path.exists(
+            os.path.join(cls.MODELS_DIR, cls.MODEL_MAPPING[model_name])
+        )
+
+    def _providers(self):
+        if (
+            self.device == "cuda"
+            and "CUDAExecutionProvider" in ort.get_available_providers()
+        ):
+            return ["CUDAExecutionProvider", "CPUExecutionProvider"]
+        return ["CPUExecutionProvider"]
+
+    def session_options(self, optimization_level: str = None) -> ort.SessionOptions:
+        """SessionOptions с настройками загрузчика"""
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = self.intra_op_threads
+        options.inter_op_num_threads = self.inter_op_threads
+        options.execution_mode = self.EXECUTION_MODES[self.execution_mode]
+        options.graph_optimization_level = self.OPTIMIZATION_LEVELS[
+            optimization_level or self.optimization_level
+        ]
+        return options
+
+    def optimized_model_path(self, model_name: str, providers=None) -> str:
+        """
+        Путь к сохраненному оптимизированному графу.
+
+        Граф уровня "all" зависит от провайдера и версии ONNX Runtime,
+        поэтому они входят в имя файла.
+        """
+        providers = providers or self._providers()
+        stem = os.path.splitext(self.MODEL_MAPPING[model_name])[0]
+        provider = providers[0].replace("ExecutionProvider", "").lower()
+        return os.path.join(
+            self.optimized_dir,
+            f"{stem}.{self.optimization_level}.{provider}.ort{ort.__version__}.onnx",
+        )
+
+    def _load_model(self, model_name: str):
+        providers = self._providers()
+        model_path = self.get_model_path(model_name)
+        session = None
+
+        if self.cache_optimized and self.optimization_level != "disable":
+            optimized_path = self.optimized_model_path(model_name, providers)
+            if os.path.exists(optimized_path) and os.path.getmtime(
+                optimized_path
+            ) >= os.path.getmtime(model_path):
+                # Граф уже оптимизирован: повторная оптимизация не нужна
+                try:
+                    session = ort.InferenceSession(
+                        optimized_path,
+                        self.session_options("disable"),
+                        providers=providers,
+                    )
+                except Exception as e:
+                    print(f"Оптимизированный граф {optimized_path} не загружен: {e}")
+            if session is None:
+                session = self._create_and_save_optimized(
+                    model_path, optimized_path, providers
+                )
+
+        if session is None:
+            session = ort.InferenceSession(
+                model_path, self.session_options(), providers=providers
+            )
+        return {
+            "session": session,
+            "input_name": session.get_inputs()[0].name,
+            "output_names": [output.name for output in session.get_outputs()],
+            "input_size": self._session_input_size(session, model_name),
+        }
+
+    def _create_and_save_optimized(self, model_path, optimized_path, providers):
+        """Сессия по исходной модели с сохранением оптимизированного графа"""
+        os.makedirs(self.optimized_dir, exist_ok=True)
+        # Запись во временный файл: недописанный граф не попадет в кэш
+        temporary_path = f"{optimized_path}.{os.getpid()}.tmp"
+        options = self.session_options()
+        options.optimized_model_filepath = temporary_path
+        try:
+            session = ort.InferenceSession(model_path, options, providers=providers)
+        except Exception as e:
+            # Например, граф со скомпилированными узлами нельзя сохранить
+            print(f"Оптимизированный граф не сохранен: {e}")
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            return None
+        if os.path.exists(temporary_path):
+            os.replace(temporary_path, optimized_path)
+        return session
+
     def get_model(self, model_name: str):
-        return self.models.get(model_name)
+        model_path = self.get_model_path(model_name)
+        if model_path is None or not os.path.exists(model_path):
+            return None
+        try:
+            return self.cache.get(
+                ("onnx", model_name),
+                lambda: self._load_model(model_name),
+                ModelCache.file_size(model_path),
+            )
+        except Exception as e:
+            print(f"❌ Ошибка загрузки ONNX модели {model_name}: {e}")
+            return None
 
     def get_model_path(self, model_name: str):
         if model_name in self.MODEL_MAPPING:
@@ -55,52 +235,329 @@ class ONNXLoader:
         image_np: np.ndarray,
         confidence_threshold=0.3,
         max_detections=300,
+        iou_threshold=0.7,
     ):
         """Предсказание из numpy массива"""
+        return self.predict_batch(
+            model_name,
+            [image_np],
+            confidence_threshold,
+            max_detections,
+            iou_threshold=iou_threshold,
+        )[0]
+
+    def predict_batch(
+        self,
+        model_name: str,
+        images: list,
+        confidence_threshold=0.3,
+        max_detections=300,
+        batch_size: int = 8,
+        io_binding: bool = None,
+        iou_threshold=0.7,
+    ) -> list:
+        """
+        Предсказание для списка изображений (BGR), результат — по изображениям.
+
+        Изображения нормализуются прямо в переиспользуемый входной тензор
+        (N, 3, H, W) и проходят через модель пакетами; при статической
+        размерности пакета в модели используется она. io_binding=None —
+        IO binding включается для CUDA. iou_threshold — порог NMS для
+        моделей YOLO-seg (RF-DETR не использует NMS).
+        """
         model_info = self.get_model(model_name)
         if not model_info:
             raise ValueError(f"Модель {model_name} не найдена")
 
-        # Препроцессинг
-        input_tensor, original_size = self._preprocess_numpy(image_np, model_name)
+        session = model_info["session"]
+        if io_binding is None:
+            io_binding = session.get_providers()[0] == "CUDAExecutionProvider"
+        batch_dim = session.get_inputs()[0].shape[0]
+        static_batch = isinstance(batch_dim, int)
+        capacity = batch_dim if static_batch else max(1, min(batch_size, len(images)))
+        input_size = model_info["input_size"]
+        if model_name in self.EXPORTED_MODELS:
+            preprocess, postprocess = self._letterbox_into, self._postprocess_yolo
+        else:
+            preprocess, postprocess = self._preprocess_into, self._postprocess_rfdetr
 
-        # Инференс
-        outputs = model_info["session"].run(
-            model_info["output_names"], {model_info["input_name"]: input_tensor}
-        )
+        results = []
+        buffer = self._acquire_buffer(model_name, capacity, input_size)
+        try:
+            for start in range(0, len(images), capacity):
+                chunk = images[start : start + capacity]
+                # Статический пакет модели подается целиком
+                count = capacity if static_batch else len(chunk)
+                # Параметры обратного преобразования для каждого изображения
+                transforms = [
+                    preprocess(image, buffer.host[i], input_size)
+                    for i, image in enumerate(chunk)
+                ]
+                outputs = self._run(model_info, buffer, count, io_binding)
+                results.extend(
+                    postprocess(
+                        [output[i : i + 1] for output in outputs],
+                        transform,
+                        confidence_threshold,
+                        max_detections,
+                        iou_threshold,
+                    )
+                    for i, transform in enumerate(transforms)
+                )
+        finally:
+            self._release_buffer(model_name, capacity, input_size, buffer)
+        return results
 
-        # Постпроцессинг
-        return self._postprocess_rfdetr(
-            outputs, original_size, confidence_threshold, max_detections
-        )
+    def _run(self, model_info, buffer, count: int, io_binding: bool):
+        """Инференс над первыми count изображениями буфера"""
+        session = model_info["session"]
+        batch = buffer.host[:count]
+        if not io_binding:
+            return session.run(
+                model_info["output_names"], {model_info["input_name"]: batch}
+            )
+
+        binding = session.io_binding()
+        if session.get_providers()[0] == "CUDAExecutionProvider":
+            # Предвыделенный тензор на GPU обновляется на месте
+            value = buffer.device_value(count, "cuda")
+        else:
+            # На CPU OrtValue ссылается на память буфера без копирования
+            value = ort.OrtValue.ortvalue_from_numpy(batch)
+        binding.bind_ortvalue_input(model_info["input_name"], value)
+        for name in model_info["output_names"]:
+            binding.bind_output(name, "cpu")
+        session.run_with_iobinding(binding)
+        return binding.copy_outputs_to_cpu()
+
+    def _acquire_buffer(self, model_name: str, capacity: int, input_size):
+        key = (model_name, capacity, input_size)
+        with self._buffers_lock:
+            free = self._buffers.setdefault(key, [])
+            if free:
+                return free.pop()
+        return _InputBuffer(capacity, input_size)
+
+    def _release_buffer(self, model_name: str, capacity: int, input_size, buffer):
+        with self._buffers_lock:
+            self._buffers[(model_name, capacity, input_size)].append(buffer)
+
+    @staticmethod
+    def _default_input_size(model_name: str):
+        """Размер входа модели (ширина, высота), если модель его не задает"""
+        return (432, 432) if "RF-DETR" in model_name else (640, 640)
+
+    @classmethod
+    def _session_input_size(cls, session, model_name: str):
+        """
+        Размер входа (ширина, высота): статические оси входа или, для
+        динамических, imgsz из метаданных экспорта ultralytics ([h, w])
+        """
+        height, width = session.get_inputs()[0].shape[2:4]
+        if isinstance(height, int) and isinstance(width, int):
+            return width, height
+        imgsz = session.get_modelmeta().custom_metadata_map.get("imgsz")
+        if imgsz:
+            try:
+                size = json.loads(imgsz)
+            except ValueError:
+                size = None
+            if isinstance(size, int):
+                return size, size
+            if isinstance(size, list) and len(size) == 2:
+                return int(size[1]), int(size[0])
+        return cls._default_input_size(model_name)
+
+    def _input_size(self, model_name: str):
+        """Размер входа модели (ширина, высота)"""
+        model_info = self.get_model(model_name)
+        if model_info is None:
+            return self._default_input_size(model_name)
+        return model_info["input_size"]
 
     def _preprocess_numpy(self, image_np: np.ndarray, model_name: str):
         """Препроцессинг numpy массива"""
+        input_size = self._input_size(model_name)
+        image_processed = np.empty((1, 3, input_size[1], input_size[0]), np.float32)
+        original_size = self._preprocess_into(image_np, image_processed[0], input_size)
+        return image_processed, original_size
+
+    @staticmethod
+    def _preprocess_into(image_np: np.ndarray, out: np.ndarray, input_size):
+        """
+        Нормализованное изображение (3, H, W) RGB записывается в out.
+
+        BGR -> RGB — перестановкой каналов, (x / 255 - mean) / std — одним
+        умножением и вычитанием на месте, без промежуточных float-массивов.
+        """
         original_size = (image_np.shape[1], image_np.shape[0])
+        image_resized = cv2.resize(image_np, input_size, interpolation=cv2.INTER_LINEAR)
+        if image_resized.ndim == 2:
+            image_resized = cv2.cvtColor(image_resized, cv2.COLOR_GRAY2BGR)
+        np.multiply(image_resized.transpose(2, 0, 1)[::-1], _INPUT_SCALE, out=out)
+        np.subtract(out, _INPUT_SHIFT, out=out)
+        return original_size
 
-        if "RF-DETR" in model_name:
-            target_size = (432, 432)
-        else:
-            target_size = (640, 640)
+    @classmethod
+    def _letterbox_into(cls, image_np: np.ndarray, out: np.ndarray, input_size):
+        """
+        Letterbox для YOLO (как ultralytics LetterBox): изображение с
+        сохранением пропорций по центру входа, поля цвета 114, RGB / 255.
+        Возвращает (исходный размер, коэффициенты (x, y), сдвиг рамок (x, y)).
+        """
+        height, width = image_np.shape[:2]
+        target_width, target_height = input_size
+        gain = min(target_height / height, target_width / width)
+        new_width, new_height = round(width * gain), round(height * gain)
+        pad_x = (target_width - new_width) / 2
+        pad_y = (target_height - new_height) / 2
+        left, top = round(pad_x - 0.1), round(pad_y - 0.1)
 
-        image_resized = cv2.resize(
-            image_np, target_size, interpolation=cv2.INTER_LINEAR
+        if (width, height) != (new_width, new_height):
+            image_np = cv2.resize(
+                image_np, (new_width, new_height), interpolation=cv2.INTER_LINEAR
+            )
+        if image_np.ndim == 2:
+            image_np = cv2.cvtColor(image_np, cv2.COLOR_GRAY2BGR)
+        out[...] = np.float32(cls.LETTERBOX_COLOR) / np.float32(255)
+        np.divide(
+            image_np.transpose(2, 0, 1)[::-1],
+            np.float32(255),
+            out=out[:, top : top + new_height, left : left + new_width],
         )
+        # Рамки возвращаются по округленному размеру (как ultralytics scale_boxes)
+        return (width, height), (new_width / width, new_height / height), (left, top)
+
+    def _postprocess_yolo(
+        self, outputs, transform, confidence_threshold, max_detections, iou_threshold
+    ):
+        """
+        Постпроцессинг YOLO-seg (как ultralytics с retina_masks=True): отбор
+        по уверенности, NMS по классам, маски из прототипов — только внутри
+        рамок, с той же билинейной интерполяцией, что и на весь кадр.
+        """
+        (width, height), (gain_x, gain_y), (shift_x, shift_y) = transform
+        predictions = outputs[0][0].T  # [8400, 4 + классы + 32]
+        protos = outputs[1][0]  # [32, 160, 160]
+        class_count = predictions.shape[1] - 4 - protos.shape[0]
 
-        if len(image_resized.shape) == 3 and image_resized.shape[2] == 3:
-            image_resized = cv2.cvtColor(image_resized, cv2.COLOR_BGR2RGB)
+        class_scores = predictions[:, 4 : 4 + class_count]
+        class_ids = class_scores.argmax(axis=1)
+        confidences = class_scores[np.arange(len(class_scores)), class_ids]
+        candidates = np.flatnonzero(confidences > confidence_threshold)
+        if len(candidates) == 0:
+            return sv.Detections.empty()
+        candidates = candidates[np.argsort(-confidences[candidates], kind="stable")]
+        candidates = candidates[: self.MAX_NMS_CANDIDATES]
 
-        image_processed = image_resized.astype(np.float32) / 255.0
-        image_processed = (
-            image_processed - np.array([0.485, 0.456, 0.406], dtype=np.float32)
-        ) / np.array([0.229, 0.224, 0.225], dtype=np.float32)
-        image_processed = image_processed.transpose(2, 0, 1)
-        image_processed = np.expand_dims(image_processed, axis=0)
+        centers, sizes = predictions[candidates, :2], predictions[candidates, 2:4]
+        boxes = np.concatenate([centers - sizes / 2, centers + sizes / 2], axis=1)
+        # Смещение рамок по классу: NMS не подавляет рамки разных классов
+        offsets = class_ids[candidates, None].astype(boxes.dtype) * 7680
+        keep = _nms(boxes + offsets, iou_threshold)[:max_detections]
+        selected = candidates[keep]
+        boxes = boxes[keep].astype(np.float32)
+        coefficients = predictions[selected, 4 + class_count :]
 
-        return image_processed, original_size
+        # Рамки из координат letterbox в координаты изображения
+        boxes[:, [0, 2]] = (boxes[:, [0, 2]] - shift_x) / gain_x
+        boxes[:, [1, 3]] = (boxes[:, [1, 3]] - shift_y) / gain_y
+        boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, width)
+        boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, height)
+
+        tiles = [
+            self._prototype_mask_tile(protos, coefficient, box, (width, height))
+            for coefficient, box in zip(coefficients, boxes)
+        ]
+        return sv.Detections(
+            xyxy=boxes,
+            confidence=confidences[selected],
+            class_id=class_ids[selected].astype(int),
+            data={"mask_tiles": tiles},
+        )
+
+    @staticmethod
+    def _prototype_mask_tile(protos, coefficients, box, original_size) -> MaskTile:
+        """
+        Маска YOLO-seg внутри рамки (как ultralytics process_mask_native):
+        прототипы увеличиваются в factor раз, чтобы поля letterbox срезались
+        по целым пикселям, область без полей увеличивается до размера кадра
+        (оба раза bilinear, align_corners=False), пиксели вне рамки
+        отбрасываются, порог логита — 0.
+        """
+        width, height = original_size
+        mask_height, mask_width = protos.shape[1:]
+        # Поля letterbox на входе модели (прототипы в 4 раза меньше входа)
+        gain = min(4 * mask_height / height, 4 * mask_width / width)
+        pad = (4 * mask_height - round(height * gain)) | (
+            4 * mask_width - round(width * gain)
+        )
+        factor = 4 // math.gcd(4, pad | pad // 2)
+        # Область увеличенных прототипов без полей (как ultralytics scale_masks)
+        up_height, up_width = factor * mask_height, factor * mask_width
+        scale = min(up_height / height, up_width / width)
+        top = round((up_height - round(height * scale)) / 2 - 0.1)
+        left = round((up_width - round(width * scale)) / 2 - 0.1)
+        bottom, right = top + round(height * scale), left + round(width * scale)
+
+        # Пиксели c с x1 <= c < x2 (как ultralytics crop_mask)
+        x1 = int(np.clip(np.ceil(box[0]), 0, width))
+        y1 = int(np.clip(np.ceil(box[1]), 0, height))
+        x2 = int(np.clip(np.ceil(box[2]), x1, width))
+        y2 = int(np.clip(np.ceil(box[3]), y1, height))
+        if x2 == x1 or y2 == y1:
+            return MaskTile(
+                np.zeros((1, 1), dtype=bool),
+                min(x1, width - 1),
+                min(y1, height - 1),
+                (height, width),
+            )
+
+        # Ячейки увеличенных прототипов, нужные для пикселей рамки
+        left_index, right_index, wx = _linear_coefficients(right - left, width, x1, x2)
+        upper, lower, wy = _linear_coefficients(bottom - top, height, y1, y2)
+        up_x1, up_x2 = left + left_index[0], left + right_index[-1] + 1
+        up_y1, up_y2 = top + upper[0], top + lower[-1] + 1
+        # ... и ячейки исходных прототипов для них
+        up_left, up_right, up_wx = _linear_coefficients(
+            mask_width, up_width, up_x1, up_x2
+        )
+        up_upper, up_lower, up_wy = _linear_coefficients(
+            mask_height, up_height, up_y1, up_y2
+        )
+        rows = np.unique(np.concatenate([up_upper, up_lower]))
+        columns = np.unique(np.concatenate([up_left, up_right]))
+        # Логиты маски только в нужных ячейках прототипов
+        source = np.tensordot(
+            coefficients.astype(np.float32), protos[:, rows][:, :, columns], axes=1
+        )
+        upsampled = _bilinear(
+            source,
+            np.searchsorted(rows, up_upper),
+            np.searchsorted(rows, up_lower),
+            up_wy,
+            np.searchsorted(columns, up_left),
+            np.searchsorted(columns, up_right),
+            up_wx,
+        )
+        values = _bilinear(
+            upsampled,
+            upper - (up_y1 - top),
+            lower - (up_y1 - top),
+            wy,
+            left_index - (up_x1 - left),
+            right_index - (up_x1 - left),
+            wx,
+        )
+        return MaskTile(values > 0, x1, y1, (height, width))
 
     def _postprocess_rfdetr(
-        self, outputs, original_size, confidence_threshold, max_detections
+        self,
+        outputs,
+        original_size,
+        confidence_threshold,
+        max_detections,
+        iou_threshold=None,
     ):
         """Постпроцессинг для RF-DETR"""
         dets = outputs[0][0]  # [200, 4]
@@ -139,16 +596,104 @@ class ONNXLoader:
         bboxes[:, [0, 2]] *= scale_x
         bboxes[:, [1, 3]] *= scale_y
 
-        scaled_masks = []
-        for mask in filtered_masks:
-            mask_resized = cv2.resize(
-                mask, original_size, interpolation=cv2.INTER_LINEAR
-            )
-            scaled_masks.append(mask_resized > 0.5)
+        # Маски увеличиваются только внутри расширенной рамки объекта
+        tiles = [
+            self._mask_tile(mask, box, original_size)
+            for mask, box in zip(filtered_masks, bboxes)
+        ]
 
         return sv.Detections(
             xyxy=bboxes,
             confidence=filtered_confidences,
             class_id=filtered_class_ids.astype(int),
-            mask=np.array(scaled_masks),
+            data={"mask_tiles": tiles},
         )
+
+    @classmethod
+    def _mask_tile(cls, mask: np.ndarray, box: np.ndarray, original_size) -> MaskTile:
+        """Фрагмент маски, совпадающий с cv2.resize на весь кадр в пределах рамки"""
+        width, height = original_size
+        mask_height, mask_width = mask.shape
+        # Запас: доля размера рамки и две ячейки исходной маски
+        pad_x = (box[2] - box[0]) * cls.MASK_PADDING + 2 * width / mask_width
+        pad_y = (box[3] - box[1]) * cls.MASK_PADDING + 2 * height / mask_height
+        x1 = int(np.clip(np.floor(box[0] - pad_x), 0, width - 1))
+        y1 = int(np.clip(np.floor(box[1] - pad_y), 0, height - 1))
+        x2 = int(np.clip(np.ceil(box[2] + pad_x), x1 + 1, width))
+        y2 = int(np.clip(np.ceil(box[3] + pad_y), y1 + 1, height))
+
+        left, right, wx = _linear_coefficients(mask_width, width, x1, x2)
+        upper, lower, wy = _linear_coefficients(mask_height, height, y1, y2)
+        # Горизонтальный, затем вертикальный проход (порядок cv2.resize)
+        rows = np.unique(np.concatenate([upper, lower]))
+        source = mask[rows].astype(np.float32)
+        horizontal = source[:, left] * (1 - wx) + source[:, right] * wx
+        upper, lower = np.searchsorted(rows, upper), np.searchsorted(rows, lower)
+        values = horizontal[upper] * (1 - wy)[:, None] + horizontal[lower] * wy[:, None]
+        return MaskTile(values > 0.5, x1, y1, (height, width))
+
+
+def _linear_coefficients(source_size: int, target_size: int, start: int, stop: int):
+    """
+    Индексы соседей и веса билинейной интерполяции для отсчетов start..stop-1
+    (та же привязка пикселей и обработка краев, что у cv2.INTER_LINEAR)
+    """
+    scale = 1.0 / (target_size / source_size)
+    position = (np.arange(start, stop) + 0.5) * scale - 0.5
+    first = np.floor(position).astype(np.int64)
+    weight = (position - first).astype(np.float32)
+    before = first < 0
+    weight[before], first[before] = 0, 0
+    after = first >= source_size - 1
+    weight[after], first[after] = 0, source_size - 1
+    return first, np.minimum(first + 1, source_size - 1), weight
+
+
+def _bilinear(source, upper, lower, wy, left, right, wx):
+    """Билинейная выборка source по индексам соседей и весам строк и столбцов"""
+    horizontal = source[:, left] * (1 - wx) + source[:, right] * wx
+    return horizontal[upper] * (1 - wy)[:, None] + horizontal[lower] * wy[:, None]
+
+
+def _nms(boxes: np.ndarray, iou_threshold: float) -> np.ndarray:
+    """
+    Жадный NMS для рамок (x1, y1, x2, y2), уже упорядоченных по убыванию
+    уверенности; возвращает позиции оставленных рамок (как torchvision.ops.nms)
+    """
+    boxes = boxes.astype(np.float32)
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    remaining = np.arange(len(boxes))
+    keep = []
+    while len(remaining):
+        current, rest = remaining[0], remaining[1:]
+        keep.append(current)
+        width = np.minimum(boxes[current, 2], boxes[rest, 2]) - np.maximum(
+            boxes[current, 0], boxes[rest, 0]
+        )
+        height = np.minimum(boxes[current, 3], boxes[rest, 3]) - np.maximum(
+            boxes[current, 1], boxes[rest, 1]
+        )
+        intersection = np.clip(width, 0, None) * np.clip(height, 0, None)
+        iou = intersection / (areas[current] + areas[rest] - intersection)
+        remaining = rest[~(iou > iou_threshold)]
+    return np.asarray(keep, dtype=np.int64)
+
+
+class _InputBuffer:
+    """Переиспользуемый входной тензор (N, 3, H, W) float32 и его копии на GPU"""
+
+    def __init__(self, capacity: int, input_size):
+        width, height = input_size
+        self.host = np.empty((capacity, 3, height, width), dtype=np.float32)
+        self._device_values = {}
+
+    def device_value(self, count: int, device: str):
+        """Тензор на устройстве для первых count изображений (обновляется на месте)"""
+        value = self._device_values.get((count, device))
+        if value is None:
+            value = ort.OrtValue.ortvalue_from_shape_and_type(
+                self.host[:count].shape, np.float32, device, 0
+            )
+            self._device_values[(count, device)] = value
+        value.update_inplace(self.host[:count])
+        return value
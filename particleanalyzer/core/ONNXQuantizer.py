@@ -0,0 +1,236 @@
+"""INT8-квантование ONNX-моделей для CPU с проверкой точности"""
+
+import os
+import time
+import cv2
+import numpy as np
+
+from particleanalyzer.core.ONNXLoader import ONNXLoader
+
+
+class ONNXQuantizer:
+    """
+    Создает INT8-версию модели из ONNXLoader.QUANTIZED_MODELS.
+
+    Статическое квантование калибруется на изображениях СЭМ (диапазоны
+    активаций), динамическое квантует только веса. Перед регистрацией
+    модель проходит проверку точности: число частиц и распределение
+    эквивалентных диаметров сравниваются с FP32-моделью на снимках, которые
+    не участвовали в калибровке.
+    """
+
+    METHODS = ("static", "dynamic")
+    # Операции, которые квантуются; нормализации и softmax остаются в FP32
+    OP_TYPES = ("Conv", "MatMul", "Gemm")
+    # Допустимые отклонения от FP32: относительное изменение числа частиц,
+    # статистика Колмогорова-Смирнова и сдвиг медианы диаметров
+    MAX_COUNT_DRIFT = 0.05
+    MAX_KS_STATISTIC = 0.1
+    MAX_MEDIAN_DRIFT = 0.03
+
+    def __init__(self, loader: ONNXLoader = None):
+        self.loader = loader if loader is not None else ONNXLoader(device="cpu")
+
+    def quantize(
+        self,
+        model_name: str = "RF-DETR Seg INT8 (Preview)",
+        images: list = (),
+        method: str = "static",
+        per_channel: bool = False,
+        gate: bool = True,
+        confidence_threshold: float = 0.5,
+        validation_images: list = None,
+    ) -> dict:
+        """
+        Квантование, проверка точности и сохранение модели.
+
+        images — изображения BGR для калибровки и проверки. Проверка идет
+        на изображениях, не входивших в калибровку: validation_images или,
+        если они не заданы, каждое второе из images (split_images; при
+        gate=False калибровка идет по всем images). Если проверка не
+        пройдена, файл модели удаляется и выбрасывается ValueError.
+        Возвращает метрики проверки (пустой словарь при gate=False).
+        """
+        from onnxruntime.quantization import (
+            CalibrationDataReader,
+            QuantType,
+            quantize_dynamic,
+            quantize_static,
+        )
+        from onnxruntime.quantization.shape_inference import quant_pre_process
+
+        if method not in self.METHODS:
+            raise ValueError(f"Неизвестный метод квантования: {method}")
+        if model_name not in ONNXLoader.QUANTIZED_MODELS:
+            raise ValueError(f"Модель {model_name} не создается квантованием")
+        images = list(images)
+        if validation_images is not None:
+            calibration_images, validation_images = images, list(validation_images)
+        elif method == "static" and gate:
+            calibration_images, validation_images = self.split_images(images)
+        elif method == "static":
+            calibration_images, validation_images = images, []
+        else:
+            # Динамическое квантование не калибруется: проверка на всех
+            calibration_images, validation_images = [], images
+        if method == "static" and not calibration_images:
+            raise ValueError("Для калибровки нужны изображения")
+        if gate and not validation_images:
+            raise ValueError(
+                "Для проверки точности нужны изображения, не входящие в "
+                "калибровку: передайте не меньше двух изображений или "
+                "отдельный набор для проверки"
+            )
+
+        source_name = ONNXLoader.QUANTIZED_MODELS[model_name]
+        source_path = self.loader.get_model_path(source_name)
+        output_path = self.loader.get_model_path(model_name)
+        if not os.path.exists(source_path):
+            raise FileNotFoundError(f"Исходная модель не найдена: {source_path}")
+
+        # Подготовка графа (вывод форм и оптимизации) перед квантованием
+        prepared_path = f"{output_path}.prepared.onnx"
+        quant_pre_process(source_path, prepared_path)
+        try:
+            if method == "static":
+                input_name = self.loader.get_model(source_name)["input_name"]
+                loader = self.loader
+
+                class SEMCalibrationReader(CalibrationDataReader):
+                    def __init__(self):
+                        self._images = iter(calibration_images)
+
+                    def get_next(self):
+                        image = next(self._images, None)
+                        if image is None:
+                            return None
+                        tensor, _ = loader._preprocess_numpy(image, source_name)
+                        return {input_name: tensor}
+
+                quantize_static(
+                    prepared_path,
+                    output_path,
+                    SEMCalibrationReader(),
+                    op_types_to_quantize=list(self.OP_TYPES),
+                    per_channel=per_channel,
+                    activation_type=QuantType.QUInt8,
+                    weight_type=QuantType.QInt8,
+                )
+            else:
+                quantize_dynamic(
+                    prepared_path,
+                    output_path,
+                    op_types_to_quantize=list(self.OP_TYPES),
+                    per_channel=per_channel,
+                    weight_type=QuantType.QInt8,
+                )
+        finally:
+            if os.path.exists(prepared_path):
+                os.remove(prepared_path)
+
+        # Ранее загруженная сессия этой модели устарела
+        self.loader.cache.discard(("onnx", model_name))
+        if not gate:
+            return {}
+
+        report = self.evaluate(
+            source_name, model_name, validation_images, confidence_threshold
+        )
+        if not report["passed"]:
+            os.remove(output_path)
+            self.loader.cache.discard(("onnx", model_name))
+            raise ValueError(
+                f"INT8-модель не прошла проверку точности: {report['reason']}"
+            )
+        return report
+
+    @staticmethod
+    def split_images(images: list):
+        """
+        Деление на калибровочные и проверочные изображения: четные и
+        нечетные по порядку, чтобы оба набора охватывали одни и те же серии
+        """
+        return list(images[0::2]), list(images[1::2])
+
+    def evaluate(
+        self,
+        reference_name: str,
+        model_name: str,
+        images: list,
+        confidence_threshold: float = 0.5,
+    ) -> dict:
+        """
+        Задержка и дрейф числа и размеров частиц относительно эталона.
+        reason — причина непрохождения проверки (None, если пройдена).
+        """
+        results = {}
+        for name in (reference_name, model_name):
+            self.loader.predict_batch(name, images[:1], confidence_threshold)
+            start = time.perf_counter()
+            detections = self.loader.predict_batch(name, images, confidence_threshold)
+            results[name] = {
+                "latency": (time.perf_counter() - start) / len(images),
+                "diameters": np.concatenate(
+                    [self.equivalent_diameters(d) for d in detections]
+                ),
+            }
+
+        reference = results[reference_name]["diameters"]
+        candidate = results[model_name]["diameters"]
+        count_drift = (len(candidate) - len(reference)) / max(len(reference), 1)
+        report = {
+            "reference_latency": results[reference_name]["latency"],
+            "latency": results[model_name]["latency"],
+            "reference_count": len(reference),
+            "count": len(candidate),
+            "count_drift": float(count_drift),
+            "ks_statistic": None,
+            "median_drift": None,
+        }
+        # Без частиц распределения не сравниваются: проверка не пройдена
+        if not len(reference) or not len(candidate):
+            empty = reference_name if not len(reference) else model_name
+            report.update(
+                passed=False,
+                reason=f"модель {empty} не нашла частиц на изображениях проверки",
+            )
+            return report
+
+        ks_statistic = self.ks_statistic(reference, candidate)
+        median_drift = np.median(candidate) / np.median(reference) - 1
+        passed = bool(
+            abs(count_drift) <= self.MAX_COUNT_DRIFT
+            and ks_statistic <= self.MAX_KS_STATISTIC
+            and abs(median_drift) <= self.MAX_MEDIAN_DRIFT
+        )
+        report.update(
+            ks_statistic=float(ks_statistic),
+            median_drift=float(median_drift),
+            passed=passed,
+            reason=(
+                None
+                if passed
+                else f"число частиц {count_drift:+.1%}, KS {ks_statistic:.3f}, "
+                f"медиана D {median_drift:+.1%}"
+            ),
+        )
+        return report
+
+    @staticmethod
+    def equivalent_diameters(detections) -> np.ndarray:
+        """Эквивалентные диаметры (пиксели) по площадям контуров масок"""
+        areas = []
+        for tile in detections.data.get("mask_tiles", []):
+            contour = tile.main_contour()
+            if contour is not None:
+                areas.append(cv2.contourArea(contour.reshape(-1, 1, 2)))
+        return np.sqrt(4 * np.asarray(areas, dtype=np.float64) / np.pi)
+
+    @staticmethod
+    def ks_statistic(a: np.ndarray, b: np.ndarray) -> float:
+        """Двухвыборочная статистика Колмогорова-Смирнова"""
+        a, b = np.sort(a), np.sort(b)
+        values = np.concatenate([a, b])
+        cdf_a = np.searchsorted(a, values, side="right") / len(a)
+        cdf_b = np.searchsorted(b, values, side="right") / len(b)
+        return float(np.abs(cdf_a - cdf_b).max())
@@ -0,0 +1,185 @@
+"""Отрисовка заливки, контуров и Feret-линий всех частиц за один проход"""
+
+import random
+import cv2
+import numpy as np
+
+
+class OverlayRenderer:
+    """
+    Накладывает разметку частиц на изображение (BGR, на месте).
+
+    Все заливки рисуются в один буфер и смешиваются с изображением одним
+    cv2.addWeighted, контуры и Feret-линии — пакетными вызовами cv2.polylines.
+    Контуры передаются в рваном формате: points (N, 2) int32, offsets (n + 1,).
+    """
+
+    FERET_MAX_COLOR = (0, 255, 255)  # Желтый - Feret max
+    FERET_MIN_COLOR = (255, 0, 0)  # Синий - Feret min
+    FERET_THICKNESS = 2
+
+    def __init__(
+        self,
+        show_fill: bool = True,
+        show_outline: bool = True,
+        show_feret: bool = False,
+        fill_color=None,
+        fill_alpha: float = 0.5,
+        outline_color=(0, 255, 0),
+        thickness: int = 1,
+    ):
+        """fill_color=None — случайный цвет для каждой частицы"""
+        self.show_fill = show_fill
+        self.show_outline = show_outline
+        self.show_feret = show_feret
+        self.fill_color = fill_color
+        self.fill_alpha = fill_alpha
+        self.outline_color = outline_color
+        self.thickness = thickness
+
+    def render(
+        self,
+        image: np.ndarray,
+        points: np.ndarray,
+        offsets: np.ndarray,
+        angle_max=None,
+        angle_min=None,
+        centers=None,
+    ) -> np.ndarray:
+        """
+        Отрисовка всех частиц.
+
+        Для Feret-линий нужны углы (градусы) и центры частиц (n, 2); частицы
+        с центром NaN пропускаются.
+        """
+        contours = self.split_contours(points, offsets)
+        if not contours:
+            return image
+
+        if self.show_fill:
+            overlay = image.copy()
+            for contour in contours:
+                # Отдельный вызов на контур: один fillPoly со списком
+                # контуров вырезает области их пересечения
+                cv2.fillPoly(
+                    overlay,
+                    [contour],
+                    (
+                        self._random_color()
+                        if self.fill_color is None
+                        else self.fill_color
+                    ),
+                )
+            cv2.addWeighted(
+                overlay, self.fill_alpha, image, 1 - self.fill_alpha, 0, image
+            )
+
+        if self.show_outline:
+            cv2.polylines(
+                image,
+                contours,
+                isClosed=True,
+                color=self.outline_color,
+                thickness=self.thickness,
+            )
+
+        if self.show_feret and centers is not None:
+            for angles, color in (
+                (angle_max, self.FERET_MAX_COLOR),
+                (angle_min, self.FERET_MIN_COLOR),
+            ):
+                if angles is None:
+                    continue
+                segments = self.feret_segments(points, offsets, angles, centers)
+                if len(segments):
+                    cv2.polylines(
+                        image,
+                        list(segments),
+                        isClosed=False,
+                        color=color,
+                        thickness=self.FERET_THICKNESS,
+                    )
+        return image
+
+    @staticmethod
+    def split_contours(points: np.ndarray, offsets: np.ndarray):
+        """Список контуров (k, 1, 2) int32 для функций отрисовки OpenCV"""
+        points = np.asarray(points, dtype=np.int32).reshape(-1, 2)
+        return [
+            points[start:end].reshape(-1, 1, 2)
+            for start, end in zip(offsets[:-1], offsets[1:])
+            if end > start
+        ]
+
+    @staticmethod
+    def feret_segments(points, offsets, angles, centers) -> np.ndarray:
+        """
+        Концы Feret-линий всех частиц (m, 2, 2) int32.
+
+        Контур поворачивается на угол вокруг целочисленного центра (как
+        cv2.getRotationMatrix2D и cv2.transform с округлением), линия проходит
+        между крайними точками по x на средней высоте повернутого контура.
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        offsets = np.asarray(offsets, dtype=np.int64)
+        centers = np.asarray(centers, dtype=np.float64).reshape(-1, 2)
+        valid = (np.diff(offsets) > 0) & np.isfinite(centers).all(axis=1)
+        if not valid.any():
+            return np.empty((0, 2, 2), dtype=np.int32)
+
+        starts = offsets[:-1][valid]
+        lengths = np.diff(offsets)[valid]
+        index = np.concatenate([np.arange(s, s + k) for s, k in zip(starts, lengths)])
+        local_starts = np.zeros(len(starts), dtype=np.int64)
+        np.cumsum(lengths[:-1], out=local_starts[1:])
+
+        radians = np.radians(np.asarray(angles, dtype=np.float64)[valid])
+        alpha, beta = np.cos(radians), np.sin(radians)
+        cx, cy = np.trunc(centers[valid]).T
+
+        # Матрица поворота вокруг центра, как cv2.getRotationMatrix2D
+        shift_x = (1 - alpha) * cx - beta * cy
+        shift_y = beta * cx + (1 - alpha) * cy
+        a, b = np.repeat(alpha, lengths), np.repeat(beta, lengths)
+        x, y = points[index, 0], points[index, 1]
+        x_rotated = np.rint(a * x + b * y + np.repeat(shift_x, lengths))
+        y_rotated = np.rint(-b * x + a * y + np.repeat(shift_y, lengths))
+
+        x_min = np.minimum.reduceat(x_rotated, local_starts)
+        x_max = np.maximum.reduceat(x_rotated, local_starts)
+        y_center = np.add.reduceat(y_rotated, local_starts) / lengths
+
+        # Обратный поворот концов линии в float32 (как cv2.transform)
+        inverse = np.stack(
+            [
+                alpha,
+                -beta,
+                (1 - alpha) * cx + beta * cy,
+                beta,
+                alpha,
+                -beta * cx + (1 - alpha) * cy,
+            ],
+            axis=1,
+        ).astype(np.float32)
+        y_center = y_center.astype(np.float32)
+        ends = []
+        for x_end in (x_min.astype(np.float32), x_max.astype(np.float32)):
+            ends.append(
+                np.stack(
+                    [
+                        inverse[:, 0] * x_end
+                        + inverse[:, 1] * y_center
+                        + inverse[:, 2],
+                        inverse[:, 3] * x_end
+                        + inverse[:, 4] * y_center
+                        + inverse[:, 5],
+                    ],
+                    axis=1,
+                )
+            )
+        return np.stack(ends, axis=1).astype(np.int32)
+
+    @staticmethod
+    def _random_color():
+        """Случайный цвет в BGR формате"""
+        return (random.randint(0, 255), random.randint(0, 255), random.randint(0, 255))
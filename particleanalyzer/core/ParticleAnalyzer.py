@@ -6,25 +6,18 @@ import torch
 from torch import device as torch_device
 import os
 import gc
+import time
 from tqdm import tqdm
 from typing import Optional, Tuple, Dict
-from scipy.spatial.distance import pdist
 import random
 import re
 from PIL import Image
 import io
 
-try:
-    from detectron2.engine import DefaultPredictor
-    from particleanalyzer.core.CustomDetectron2Model import CustomDetectron2Model
-
-    DETECTRON2_AVAILABLE = True
-except ImportError:
-    DETECTRON2_AVAILABLE = False
-from sahi import AutoDetectionModel
-from sahi.predict import get_sliced_prediction
-
 from particleanalyzer.core.ModelManager import ModelManager
+from particleanalyzer.core.InferenceScheduler import InferenceScheduler
+from particleanalyzer.core.InferenceCache import InferenceCache
+from particleanalyzer.core.TiledInference import TiledInference
 from particleanalyzer.core.ImagePreprocessor import ImagePreprocessor
 from particleanalyzer.core.StatisticsBuilder import StatisticsBuilder
 from particleanalyzer.core.languages import translations
@@ -32,6 +25,12 @@ from particleanalyzer.core.language_context import LanguageContext
 from particleanalyzer.core.PointManager import PointManager
 from particleanalyzer.core.EnhancementPipeline import EnhancementPipeline
 from particleanalyzer.core.ScaleProcessor import ScaleProcessor
+from particleanalyzer.core.FeretCalculator import FeretCalculator
+from particleanalyzer.core.ParticleMeasurement import ParticleMeasurement
+from particleanalyzer.core.OverlayRenderer import OverlayRenderer
+from particleanalyzer.core.ParticleResults import ParticleResults
+from particleanalyzer.core.MaskTile import MaskTile
+from particleanalyzer.core.AnnotationStore import AnnotationStore
 
 lang = "en"
 
@@ -60,18 +59,74 @@ class ParticleAnalyzer:
             "description": "Масштабирование в нанометрах (1 nm = 1e-9 m)",
         },
     }
+    MASK_MODES = ("tiles", "dense")
+    # Фрагментов в одном прямом проходе при обработке с разбиением
+    TILE_BATCH_SIZE = 8
+    # Профили обработки, прогреваемые при запуске (выбор в интерфейсе)
+    WARMUP_PROFILES = ("640x640", "1024x1024")
+    # Отрисовка в analyze_images по умолчанию (как в интерфейсе)
+    BATCH_RENDER_DEFAULTS = {
+        "show_fillPoly": False,
+        "show_polylines": True,
+        "show_Feret_diametr": False,
+        "fill_type_color": "Random",
+        "fill_color": "rgb(0, 255, 0, 1)",
+        "fill_alpha": 0.3,
+        "outline_color": "rgb(0, 255, 0, 1)",
+    }
 
-    def __init__(self, default_lang="en", device=None):
+    def __init__(
+        self,
+        default_lang="en",
+        device=None,
+        feret_mode="exact",
+        measurement_workers=1,
+        measurement_backend="thread",
+        mask_mode="tiles",
+        model_memory_budget=None,
+        preload_models=(),
+        inference_batch_size=8,
+        inference_max_wait=0.015,
+        inference_cache_size=256 * 2**20,
+        inference_cache_dir=None,
+    ):
         """Инициализация анализатора частиц с настройкой окружения"""
         self._setup_environment(device)
-        self.model_manager = ModelManager(device=self.device)
+        # Модели загружаются при первом использовании; model_memory_budget
+        # (байты) ограничивает суммарный размер загруженных моделей
+        self.model_manager = ModelManager(
+            device=self.device,
+            memory_budget=model_memory_budget,
+            preload=preload_models,
+        )
+        # Запросы разных пользователей за inference_max_wait секунд
+        # объединяются в пакеты до inference_batch_size изображений
+        self.scheduler = InferenceScheduler(
+            self.model_manager, inference_batch_size, inference_max_wait
+        )
+        # Найденные частицы по хэшу изображения и параметрам модели:
+        # inference_cache_size байт в памяти, inference_cache_dir — на диске
+        self.inference_cache = InferenceCache(inference_cache_size, inference_cache_dir)
         self.preprocessor = ImagePreprocessor()
         self.point_manager = PointManager()
         self.scale_processor = ScaleProcessor(
-            model=self.model_manager.get_model("ScaleProcessor"), device=self.device
+            model=None,
+            device=self.device,
+            model_provider=lambda: self.model_manager.get_model("ScaleProcessor"),
         )
         # Улучшение качетсва изображения
         self.enhancement_pipeline = EnhancementPipeline()
+        # Расчет диаметров Ферета ("exact" или "sampled" — перебор с шагом 1°),
+        # measurement_workers > 1 — параллельное измерение плотных изображений
+        self.measurement = ParticleMeasurement(
+            FeretCalculator(mode=feret_mode),
+            workers=measurement_workers,
+            backend=measurement_backend,
+        )
+        # Маски YOLO: "tiles" — фрагменты по рамкам, "dense" — полные маски
+        if mask_mode not in self.MASK_MODES:
+            raise ValueError(f"Неизвестный режим масок: {mask_mode}")
+        self.mask_mode = mask_mode
         self.error_return = self._create_error_return()
         self.default_lang = default_lang
         # Устанавливаем язык в контекст
@@ -200,26 +255,71 @@ class ParticleAnalyzer:
                 gr.Warning(self._get_translation("Ошибка: изображение отсутствует..."))
                 return self._create_error_return()
 
-            image, orig_image, gray_image, scale, scale_factor_glob = (
-                self.preprocessor.preprocess_image(
-                    image=selected_image,
-                    scale=scale,
-                    scale_selector=scale_selector,
-                    solution=solution,
-                    request=request,
-                    pbar=pbar,
-                    pr=pr,
-                    sahi_mode=sahi_mode,
-                    lang=self.lang,
-                )
+            # Повторная обработка того же снимка с теми же параметрами
+            # подготовки и модели не запускает ни подготовку, ни улучшение,
+            # ни модель
+            cache_key = self.inference_cache.key(
+                selected_image,
+                solution=solution,
+                pipelines=pipelines_enhancer,
+                model=model_change,
+                confidence=confidence_threshold,
+                iou=confidence_iou,
+                max_detections=number_detections,
+                mask_mode=self.mask_mode,
+                sahi=(
+                    (
+                        slice_height,
+                        slice_width,
+                        overlap_height_ratio,
+                        overlap_width_ratio,
+                    )
+                    if sahi_mode
+                    else None
+                ),
+            )
+            # Без шкалы подготовка сообщает об ошибке, кэш не проверяется
+            cached = (
+                self.inference_cache.get(cache_key)
+                if scale or not scale_selector["scale"]
+                else None
             )
-            if pipelines_enhancer:
-                image = self.enhancement_pipeline.apply_pipeline(
-                    image, pipelines_enhancer
+            if cached is not None:
+                contours, raw_masks, images, info = cached
+                image, orig_image, gray_image, scale, scale_factor_glob = (
+                    self.preprocessor.restore(
+                        image=selected_image,
+                        prepared=images["prepared"],
+                        scale=scale,
+                        request=request,
+                        pbar=pbar,
+                        pr=pr,
+                        lang=self.lang,
+                    )
                 )
-
-            if not scale and scale_selector["scale"]:
-                return self._create_error_return()
+                image = images.get("enhanced", image)
+            else:
+                image, orig_image, gray_image, scale, scale_factor_glob = (
+                    self.preprocessor.preprocess_image(
+                        image=selected_image,
+                        scale=scale,
+                        scale_selector=scale_selector,
+                        solution=solution,
+                        request=request,
+                        pbar=pbar,
+                        pr=pr,
+                        sahi_mode=sahi_mode,
+                        lang=self.lang,
+                    )
+                )
+                if not scale and scale_selector["scale"]:
+                    return self._create_error_return()
+                images = {"prepared": image}
+                if pipelines_enhancer:
+                    image = self.enhancement_pipeline.apply_pipeline(
+                        image, pipelines_enhancer
+                    )
+                    images["enhanced"] = image
 
             config = {
                 "image": image,
@@ -249,11 +349,27 @@ class ParticleAnalyzer:
                 "fill_alpha": fill_alpha,
             }
 
-            # Выбор стратегии обработки
-            processor = self._select_processor(model_change, sahi_mode)
-            output_image, particle_data, annotations = processor(**config)
-            if output_image is None:
-                return self._create_error_return()
+            if cached is None:
+                # Выбор стратегии обнаружения
+                detector = self._select_detector(model_change, sahi_mode)
+                detected = detector(**config)
+                if detected is None:
+                    return self._create_error_return()
+                contours, raw_masks, limit_reached = detected
+                self.inference_cache.put(
+                    cache_key,
+                    contours,
+                    raw_masks,
+                    images,
+                    {"limit_reached": limit_reached},
+                )
+            else:
+                self._notify_detection_limit(info.get("limit_reached", False))
+                pbar.update(1)
+
+            output_image, results, annotations = self._process_detections(
+                contours, raw_masks, **config
+            )
 
             output_image = cv2.cvtColor(output_image, cv2.COLOR_BGR2RGB)
             if scale_selector["scale"] and show_Scale_bar:
@@ -261,9 +377,8 @@ class ParticleAnalyzer:
                     output_image, scale_factor_glob, scale, *points_scale
                 )
 
-            df = pd.DataFrame(particle_data)
-            points_df = pd.DataFrame(df["points"])
-            df = df.drop(columns=["points"])
+            # Таблица интерфейса: локализация и округление только здесь
+            df = results.to_dataframe(self._get_translation, round_value)
 
             pbar.set_description(self._get_translation("Построение таблицы..."))
             pr(0.75, desc=self._get_translation("Построение таблицы..."))
@@ -289,7 +404,7 @@ class ParticleAnalyzer:
             return (
                 output_image,
                 df,
-                points_df,
+                results,
                 fig,
                 vector_fig,
                 stats_df,
@@ -349,20 +464,60 @@ class ParticleAnalyzer:
         finally:
             self._cleanup(pbar)
 
-    def _select_processor(self, model_name: str, sahi_mode: bool):
-        """Выбор стратегии обработки в зависимости от модели и режима"""
+    def _select_detector(self, model_name: str, sahi_mode: bool):
+        """Выбор стратегии обнаружения в зависимости от модели и режима"""
         if sahi_mode:
-            return self._process_with_sahi
+            return self._detect_tiled
         if model_name in self.model_manager.yolo_loader.MODEL_MAPPING:
-            return self._process_with_yolo
-        if model_name in self.model_manager.detectron_loader.MODEL_MAPPING:
-            return self._process_with_detectron
+            return self._detect_with_yolo
         if model_name in self.model_manager.onnx_loader.MODEL_MAPPING:
-            return self._process_with_onnx
+            return self._detect_with_onnx
+        if model_name in self.model_manager.detectron_loader.MODEL_MAPPING:
+            return self._detect_with_detectron
         raise ValueError(f"Неизвестная модель или неподдерживаемый тип: {model_name}")
 
-    def _process_with_onnx(self, **config):
-        """Обработка с использованием ONNX моделей"""
+    def _predict(
+        self,
+        model_name: str,
+        image: np.ndarray,
+        confidence_threshold: float,
+        iou_threshold: float,
+        max_detections: int,
+    ):
+        """
+        Прямой проход модели для одного изображения: YOLO и ONNX — через
+        планировщик пакетов, Detectron2 — через ModelManager.
+        """
+        if model_name in self.model_manager.yolo_loader.MODEL_MAPPING:
+            with torch.no_grad():
+                return self.scheduler.predict(
+                    model_name,
+                    image,
+                    imgsz=640,
+                    conf=confidence_threshold,
+                    retina_masks=True,
+                    iou=iou_threshold,
+                    max_det=max_detections,
+                    device=self.device,
+                )
+        if model_name in self.model_manager.onnx_loader.MODEL_MAPPING:
+            return self.scheduler.predict(
+                model_name,
+                image,
+                confidence_threshold=confidence_threshold,
+                max_detections=max_detections,
+                iou_threshold=iou_threshold,
+            )
+        return self.model_manager.predict(
+            model_name=model_name,
+            image_np=image,
+            confidence_threshold=confidence_threshold,
+            iou_threshold=iou_threshold,
+            max_detections=max_detections,
+        )
+
+    def _detect_with_onnx(self, **config):
+        """Обнаружение ONNX-моделью: (контуры, маски, достигнут ли предел) или None"""
         config["pbar"].set_description(
             self._get_translation("RF-DETR обрабатывает изображение...")
         )
@@ -372,68 +527,33 @@ class ParticleAnalyzer:
 
         try:
             # Просто передаем numpy массив
-            results = self.model_manager.predict(
-                model_name=config["model_change"],
-                image_np=config["image"],  # numpy массив
-                confidence_threshold=config["confidence_threshold"],
-                max_detections=config["number_detections"],
+            results = self._predict(
+                config["model_change"],
+                config["image"],  # numpy массив
+                config["confidence_threshold"],
+                config["confidence_iou"],
+                config["number_detections"],
             )
 
         except Exception as e:
             self._handle_error(e)
-            return None, None, None
+            return None
 
         if len(results) == 0:
             gr.Info(self._get_translation("Объекты не обнаружены."))
-            return None, None, None
-        elif len(results) == config["number_detections"]:
-            gr.Info(
-                self._get_translation(
-                    "Достигнут предел количества обнаружений. Увеличьте максимальное количество обнаружений в настройках."
-                )
-            )
+            return None
+        limit_reached = len(results) == config["number_detections"]
+        self._notify_detection_limit(limit_reached)
 
         config["pbar"].update(1)
-
-        config["pbar"].set_description(self._get_translation("Обработка частиц..."))
-        config["pr"](0.62, desc=self._get_translation("Обработка частиц..."))
-
-        output_image = config["orig_image"].copy()
-        thickness = self._get_scaled_thickness(
-            output_image.shape[1], output_image.shape[0]
+        # Контуры ищутся во фрагментах масок по рамкам
+        return (
+            *self._tile_contours(results.data.get("mask_tiles", [])),
+            limit_reached,
         )
-        particle_counter, particle_data, annotations = 1, [], []
-
-        # Обработка детекций
-        for i in range(len(results.xyxy)):
-            mask = results.mask[i] if results.mask is not None else None
-
-            if mask is not None:
-                contours, _ = cv2.findContours(
-                    mask.astype(np.uint8), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
-                )
-
-                if contours:
-                    main_contour = max(contours, key=cv2.contourArea)
-                    points = main_contour.reshape(-1, 2)
-
-                    particle_counter = self._analyze_particle(
-                        points=points,
-                        output_image=output_image,
-                        thickness=thickness,
-                        particle_data=particle_data,
-                        annotations=annotations,
-                        raw_mask=mask,
-                        particle_counter=particle_counter,
-                        **config,
-                    )
 
-        config["pbar"].update(1)
-        return output_image, particle_data, annotations
-
-    def _process_with_yolo(self, **config):
-        """Обработка с использованием YOLO"""
-        model = self.model_manager.get_model(config["model_change"])
+    def _detect_with_yolo(self, **config):
+        """Обнаружение YOLO: (контуры, маски, достигнут ли предел) или None"""
         config["pbar"].set_description(
             self._get_translation("YOLO обрабатывает изображение...")
         )
@@ -442,68 +562,214 @@ class ParticleAnalyzer:
         )
 
         try:
-            with torch.no_grad():
-                results = model(
+            results = [
+                self._predict(
+                    config["model_change"],
                     config["image"],
-                    imgsz=640,
-                    verbose=False,
-                    conf=config["confidence_threshold"],
-                    retina_masks=True,
-                    iou=config["confidence_iou"],
-                    max_det=config["number_detections"],
-                    device=self.device,
+                    config["confidence_threshold"],
+                    config["confidence_iou"],
+                    config["number_detections"],
                 )
+            ]
         except (torch.cuda.OutOfMemoryError, RuntimeError) as e:
             self._handle_gpu_error(e)
-            return None, None, None
+            return None
         except Exception as e:
             self._handle_error(e)
-            return None, None, None
+            return None
 
         if torch.cuda.is_available():
             torch.cuda.synchronize()
 
         if len(results[0].boxes) == 0:
             gr.Info(self._get_translation("Объекты не обнаружены."))
-            return None, None, None
-        elif len(results[0].boxes) == config["number_detections"]:
+            return None
+        limit_reached = len(results[0].boxes) == config["number_detections"]
+        self._notify_detection_limit(limit_reached)
+        config["pbar"].update(1)
+        return (*self._yolo_contours(results), limit_reached)
+
+    def _notify_detection_limit(self, limit_reached: bool):
+        """Сообщение о том, что модель вернула максимум обнаружений"""
+        if limit_reached:
             gr.Info(
                 self._get_translation(
                     "Достигнут предел количества обнаружений. Увеличьте максимальное количество обнаружений в настройках."
                 )
             )
-        config["pbar"].update(1)
 
-        config["pbar"].set_description(self._get_translation("Обработка частиц..."))
-        config["pr"](0.62, desc=self._get_translation("Обработка частиц..."))
-        output_image = config["orig_image"].copy()
-        thickness = self._get_scaled_thickness(
-            output_image.shape[1], output_image.shape[0]
-        )
-        particle_counter, particle_data, annotations = 1, [], []
+    @staticmethod
+    def _tile_contours(tiles):
+        """Контуры и маски частиц из фрагментов масок (без пустых масок)"""
+        contours, raw_masks = [], []
+        for tile in tiles:
+            main_contour = tile.main_contour()
+            if main_contour is not None:
+                contours.append(main_contour)
+                raw_masks.append(tile)
+        return contours, raw_masks
+
+    def _yolo_contours(self, results):
+        """Контуры и маски частиц из результатов YOLO одного изображения"""
+        contours, raw_masks = [], []
         for r in results:
-            if r.masks is not None and len(r.masks.xy) > 0:
-                for mask, mask2 in zip(r.masks.xy, r.masks.data.cpu().numpy()):
-                    particle_counter = self._analyze_particle(
-                        points=mask,
-                        output_image=output_image,
-                        thickness=thickness,
-                        particle_data=particle_data,
-                        annotations=annotations,
-                        raw_mask=mask2,
-                        particle_counter=particle_counter,
-                        **config,
-                    )
-        config["pbar"].update(1)
-        return output_image, particle_data, annotations
+            if r.masks is None or len(r.masks) == 0:
+                continue
+            if self.mask_mode == "dense":
+                contours.extend(r.masks.xy)
+                raw_masks.extend(r.masks.data.cpu().numpy())
+                continue
+            # Фрагменты масок по рамкам: на CPU копируются только пиксели рамок;
+            # части маски соединяются в один контур, как в masks.xy
+            for tile in MaskTile.from_boxes(r.masks.data, r.boxes.xyxy.cpu().numpy()):
+                contour = tile.merged_contour()
+                if contour is not None:
+                    contours.append(contour)
+                    raw_masks.append(tile)
+        return contours, raw_masks
+
+    def analyze_images(
+        self,
+        images: list,
+        model_change: str,
+        solution: str = "Оригинал",
+        confidence_threshold: float = 0.5,
+        confidence_iou: float = 0.5,
+        number_detections: int = 1000,
+        scale_selector: str = "Pixels",
+        scale: float = None,
+        scale_input: float = None,
+        batch_size: int = 8,
+        **render,
+    ) -> list:
+        """
+        Пакетный анализ изображений (RGB) моделью YOLO без интерфейса.
+
+        Изображения приводятся к профилю solution, изображения одного размера
+        проходят через модель общими пакетами, измерение выполняется для
+        каждого изображения отдельно. render — параметры отрисовки как в
+        интерфейсе (BATCH_RENDER_DEFAULTS). Возвращает список пар
+        (изображение с разметкой RGB, ParticleResults); для изображений без
+        частиц — (None, None).
+        """
+        if model_change not in self.model_manager.yolo_loader.MODEL_MAPPING:
+            raise ValueError(
+                f"Пакетный анализ поддерживает только модели YOLO: {model_change}"
+            )
+        scale_selector = self.__class__.SCALE_OPTIONS[scale_selector]
+        if scale_selector["scale"] and (scale is None or scale_input is None):
+            raise ValueError("Для масштабирования нужны scale и scale_input")
+
+        prepared = [
+            self.preprocessor.resize_image(image, solution, False) for image in images
+        ]
+        with torch.no_grad():
+            batch_results = self.model_manager.predict_batch(
+                model_change,
+                [image for image, _ in prepared],
+                batch_size=batch_size,
+                imgsz=640,
+                conf=confidence_threshold,
+                retina_masks=True,
+                iou=confidence_iou,
+                max_det=number_detections,
+                device=self.device,
+            )
+
+        outputs = []
+        for (image, scale_factor_glob), results in zip(prepared, batch_results):
+            contours, raw_masks = self._yolo_contours([results])
+            if not contours:
+                outputs.append((None, None))
+                continue
+            orig_image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+            output_image = orig_image.copy()
+            particle_results, _ = self._measure_particles(
+                contours=contours,
+                raw_masks=raw_masks,
+                output_image=output_image,
+                thickness=self._get_scaled_thickness(
+                    output_image.shape[1], output_image.shape[0]
+                ),
+                gray_image=cv2.cvtColor(orig_image, cv2.COLOR_BGR2GRAY),
+                scale_input=scale_input,
+                scale=scale,
+                scale_factor_glob=scale_factor_glob,
+                scale_selector=scale_selector,
+                **{**self.BATCH_RENDER_DEFAULTS, **render},
+            )
+            outputs.append(
+                (cv2.cvtColor(output_image, cv2.COLOR_BGR2RGB), particle_results)
+            )
+        return outputs
 
-    def _process_with_detectron(self, **config):
-        """Обработка с использованием Detectron2"""
-        cfg = self.model_manager.get_model(config["model_change"])
-        cfg.TEST.DETECTIONS_PER_IMAGE = config["number_detections"]
-        cfg.MODEL.ROI_HEADS.SCORE_THRESH_TEST = config["confidence_threshold"]
-        cfg.MODEL.ROI_HEADS.NMS_THRESH_TEST = config["confidence_iou"]
+    def warmup(
+        self, model_names=None, profiles=WARMUP_PROFILES, confidence_threshold=0.5
+    ) -> dict:
+        """
+        Прогрев перед первым запросом: синтетические изображения каждого
+        профиля проходят через каждую модель тем же путем, что и запросы
+        (автонастройка cuDNN, инициализация графа ONNX, fuse ultralytics),
+        затем через ScaleProcessor.process_image и EasyOCR.
 
+        model_names=None — загруженные модели. Возвращает время (с) первого
+        и повторного прохода для каждой пары модель/профиль.
+        """
+        if model_names is None:
+            model_names = self.model_manager.loaded_models()
+        model_names = [name for name in model_names if name != "ScaleProcessor"]
+
+        def timed(fn):
+            start = time.perf_counter()
+            fn()
+            if torch.cuda.is_available():
+                torch.cuda.synchronize()
+            return time.perf_counter() - start
+
+        timings = {}
+        for model_name in model_names:
+            for profile in profiles:
+                width, height = ImagePreprocessor.processing_profiles[profile]
+                image = self._warmup_image(width, height)
+
+                def run():
+                    self._predict(model_name, image, confidence_threshold, 0.5, 1000)
+
+                timings[f"{model_name} {profile}"] = {
+                    "first": timed(run),
+                    "steady": timed(run),
+                }
+
+        image = cv2.cvtColor(self._warmup_image(1024, 1024), cv2.COLOR_BGR2RGB)
+        text_region = np.full((48, 160, 3), 255, dtype=np.uint8)
+        cv2.putText(
+            text_region, "10um", (8, 36), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (0, 0, 0), 2
+        )
+
+        def run_scale():
+            self.scale_processor.process_image(image, 0.1)
+            self.scale_processor.extract_scale_text_from_region(text_region)
+
+        timings["ScaleProcessor"] = {
+            "first": timed(run_scale),
+            "steady": timed(run_scale),
+        }
+        return timings
+
+    @staticmethod
+    def _warmup_image(width: int, height: int) -> np.ndarray:
+        """Синтетический снимок: светлые размытые частицы на шумном фоне"""
+        rng = np.random.default_rng(0)
+        image = rng.normal(60, 12, (height, width)).clip(0, 255).astype(np.uint8)
+        for _ in range(max(1, width * height // 20000)):
+            center = (int(rng.integers(width)), int(rng.integers(height)))
+            radius = int(rng.integers(6, 30))
+            cv2.circle(image, center, radius, int(rng.integers(150, 230)), -1)
+        image = cv2.GaussianBlur(image, (5, 5), 0)
+        return cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+
+    def _detect_with_detectron(self, **config):
+        """Обнаружение Detectron2: (контуры, маски, достигнут ли предел) или None"""
         config["pbar"].set_description(
             self._get_translation("Detectron2 обрабатывает изображение...")
         )
@@ -511,70 +777,32 @@ class ParticleAnalyzer:
             0.5, desc=self._get_translation("Detectron2 обрабатывает изображение...")
         )
         try:
-            predictor = DefaultPredictor(cfg)
-            results = predictor(config["image"])
-            masks = results["instances"].pred_masks.to("cpu").numpy()
+            instances = self._predict(
+                config["model_change"],
+                config["image"],
+                config["confidence_threshold"],
+                config["confidence_iou"],
+                config["number_detections"],
+            )
+            # Маски вставляются в рамки объектов: на CPU копируются фрагменты
+            tiles = MaskTile.from_boxes(
+                instances.pred_masks,
+                instances.pred_boxes.tensor.cpu().numpy(),
+                padding=2,
+            )
         except Exception as e:
             self._handle_error(e)
-            return None, None, None
-        if len(masks) == 0:
+            return None
+        if len(tiles) == 0:
             gr.Info(self._get_translation("Объекты не обнаружены."))
-            return None, None, None
-        elif len(masks) == config["number_detections"]:
-            gr.Info(
-                self._get_translation(
-                    "Достигнут предел количества обнаружений. Увеличьте максимальное количество обнаружений в настройках."
-                )
-            )
-        config["pbar"].update(1)
-
-        config["pbar"].set_description(self._get_translation("Обработка частиц..."))
-        config["pr"](0.62, desc=self._get_translation("Обработка частиц..."))
-        output_image = config["orig_image"].copy()
-        thickness = self._get_scaled_thickness(
-            output_image.shape[1], output_image.shape[0]
-        )
-        particle_counter, particle_data, annotations = 1, [], []
-        for mask in masks:
-            contours, _ = cv2.findContours(
-                mask.astype(np.uint8), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
-            )
-            if not contours:
-                continue
-            contour = max(contours, key=cv2.contourArea)
-            points = contour.squeeze()
-            particle_counter = self._analyze_particle(
-                points=points,
-                output_image=output_image,
-                thickness=thickness,
-                particle_data=particle_data,
-                annotations=annotations,
-                raw_mask=mask,
-                particle_counter=particle_counter,
-                **config,
-            )
+            return None
+        limit_reached = len(tiles) == config["number_detections"]
+        self._notify_detection_limit(limit_reached)
         config["pbar"].update(1)
-        return output_image, particle_data, annotations
-
-    def _process_with_sahi(self, **config):
-        """Обработка с использованием SAHI"""
-        if config["model_change"] in self.model_manager.yolo_loader.MODEL_MAPPING:
-            detection_model = AutoDetectionModel.from_pretrained(
-                model_type="ultralytics",
-                model_path=self.model_manager.get_model_path(config["model_change"]),
-                confidence_threshold=config["confidence_threshold"],
-                device="cuda",
-            )
-        elif (
-            config["model_change"] in self.model_manager.detectron_loader.MODEL_MAPPING
-        ):
-            detection_model = CustomDetectron2Model(
-                model_path=self.model_manager.get_model_path(config["model_change"]),
-                config_path=self.model_manager.get_config_path(config["model_change"]),
-                confidence_threshold=config["confidence_threshold"],
-                device="cuda",
-            )
+        return (*self._tile_contours(tiles), limit_reached)
 
+    def _detect_tiled(self, **config):
+        """Обнаружение с разбиением на фрагменты: (контуры, маски, достигнут ли предел) или None"""
         config["pbar"].set_description(
             self._get_translation("SAHI обрабатывает изображение...")
         )
@@ -582,154 +810,127 @@ class ParticleAnalyzer:
             0.5, desc=self._get_translation("SAHI обрабатывает изображение...")
         )
         try:
-            results = get_sliced_prediction(
-                config["image"],
-                detection_model,
+            tiler = TiledInference(
                 slice_height=config["slice_height"],
                 slice_width=config["slice_width"],
                 overlap_height_ratio=config["overlap_height_ratio"],
                 overlap_width_ratio=config["overlap_width_ratio"],
-                postprocess_match_threshold=config["confidence_iou"],
-                verbose=0,
+                match_threshold=config["confidence_iou"],
+            )
+            tiles, _ = tiler.predict(
+                config["image"],
+                lambda images: self._predict_crops(
+                    config["model_change"],
+                    images,
+                    config["confidence_threshold"],
+                    config["confidence_iou"],
+                    config["number_detections"],
+                ),
             )
-        except torch.cuda.OutOfMemoryError as e:
+        except (torch.cuda.OutOfMemoryError, RuntimeError) as e:
             self._handle_gpu_error(e)
-            return None, None, None
-        if len(results.object_prediction_list) == 0:
+            return None
+        except Exception as e:
+            self._handle_error(e)
+            return None
+        if len(tiles) == 0:
             gr.Info(self._get_translation("Объекты не обнаружены."))
-            return None, None, None
+            return None
         config["pbar"].update(1)
+        # Предел задается на каждый фрагмент, а не на все изображение
+        return (*self._tile_contours(tiles), False)
 
+    def _predict_crops(
+        self,
+        model_name: str,
+        images: list,
+        confidence_threshold: float,
+        iou_threshold: float,
+        max_detections: int,
+    ) -> list:
+        """
+        Пакетный прямой проход по фрагментам для любой модели; для каждого
+        фрагмента — (MaskTile в его координатах, уверенности)
+        """
+        if model_name in self.model_manager.yolo_loader.MODEL_MAPPING:
+            with torch.no_grad():
+                results = self.scheduler.predict_batch(
+                    model_name,
+                    images,
+                    batch_size=self.TILE_BATCH_SIZE,
+                    imgsz=640,
+                    conf=confidence_threshold,
+                    retina_masks=True,
+                    iou=iou_threshold,
+                    max_det=max_detections,
+                    device=self.device,
+                )
+            return [
+                (
+                    (
+                        MaskTile.from_boxes(r.masks.data, r.boxes.xyxy.cpu().numpy()),
+                        r.boxes.conf.cpu().numpy(),
+                    )
+                    if r.masks is not None
+                    else ([], [])
+                )
+                for r in results
+            ]
+        if model_name in self.model_manager.onnx_loader.MODEL_MAPPING:
+            detections = self.scheduler.predict_batch(
+                model_name,
+                images,
+                batch_size=self.TILE_BATCH_SIZE,
+                confidence_threshold=confidence_threshold,
+                max_detections=max_detections,
+                iou_threshold=iou_threshold,
+            )
+            return [
+                (d.data.get("mask_tiles", []), d.confidence if len(d) else [])
+                for d in detections
+            ]
+        instances = self.scheduler.predict_batch(
+            model_name,
+            images,
+            confidence_threshold=confidence_threshold,
+            iou_threshold=iou_threshold,
+            max_detections=max_detections,
+        )
+        return [
+            (
+                MaskTile.from_boxes(
+                    i.pred_masks, i.pred_boxes.tensor.cpu().numpy(), padding=2
+                ),
+                i.scores.cpu().numpy(),
+            )
+            for i in instances
+        ]
+
+    def _process_detections(self, contours, raw_masks, **config):
+        """Измерение и отрисовка найденных частиц"""
         config["pbar"].set_description(self._get_translation("Обработка частиц..."))
         config["pr"](0.62, desc=self._get_translation("Обработка частиц..."))
         output_image = config["orig_image"].copy()
         thickness = self._get_scaled_thickness(
             output_image.shape[1], output_image.shape[0]
         )
-        particle_counter, particle_data, annotations = 1, [], []
-        for r in results.object_prediction_list:
-            mask = r.mask.segmentation
-            if isinstance(mask, list) and len(mask) > 0:
-                flat_coords = (
-                    np.concatenate(mask).astype(np.int32)
-                    if isinstance(mask[0], list)
-                    else np.array(mask, dtype=np.int32)
-                )
-                if flat_coords.shape[0] < 6:
-                    continue
-                points = flat_coords.reshape(-1, 1, 2)
-                particle_counter = self._analyze_particle(
-                    points=points,
-                    output_image=output_image,
-                    thickness=thickness,
-                    particle_data=particle_data,
-                    annotations=None,
-                    raw_mask=None,
-                    particle_counter=particle_counter,
-                    **config,
-                )
-        config["pbar"].update(1)
-        return output_image, particle_data, annotations
-
-    def _analyze_particle(self, **config) -> int:
-        """Анализ отдельной частицы с расчетом Feret-диаметров"""
-        if len(config["points"]) < 3:
-            return config["particle_counter"]
-
-        points = np.array(config["points"], dtype=np.int32).reshape((-1, 1, 2))
-
-        # Вычисление центроида (геометрического центра)
-        moments = cv2.moments(points)
-        if moments["m00"] != 0:
-            centroid_x = moments["m10"] / moments["m00"]
-            centroid_y = moments["m01"] / moments["m00"]
-        else:
-            centroid_x, centroid_y = np.mean(points[:, 0, :], axis=0)
-
-        # Вычисление базовых характеристик
-        area = cv2.contourArea(points)
-        perimeter = cv2.arcLength(points, closed=True)
-        distances = pdist(points[:, 0, :])
-        diameter = np.max(distances) if len(distances) > 0 else 0
-
-        # Эксцентриситет
-        eccentricity = 0
-        if len(points) >= 5:
-            ellipse = cv2.fitEllipse(points)
-            (xc, yc), (major_axis, minor_axis), angle = ellipse
-            a, b = max(major_axis, minor_axis) / 2, min(major_axis, minor_axis) / 2
-            eccentricity = np.sqrt(1 - (b**2 / a**2)) if a > b else 0
-
-        # Расчет Feret-диаметров и углов
-        def get_feret(contour, angles=np.arange(0, 180, 1)):
-            feret_values = []
-            feret_angles = []
-
-            for angle in angles:
-                M = cv2.getRotationMatrix2D((0, 0), angle, 1)
-                rotated = cv2.transform(contour, M)
-                x_coords = rotated[:, 0, 0]
-                feret = x_coords.max() - x_coords.min()
-                feret_values.append(feret)
-                feret_angles.append(angle)
-
-            feret_max = max(feret_values)
-            feret_min = min(feret_values)
-            feret_mean = np.mean(feret_values)
-            angle_max = feret_angles[feret_values.index(feret_max)]
-            angle_min = feret_angles[feret_values.index(feret_min)]
-
-            return feret_max, feret_min, feret_mean, angle_max, angle_min
-
-        feret_max, feret_min, feret_mean, angle_max, angle_min = get_feret(points)
-
-        # Средняя интенсивность
-        mask_img = np.zeros_like(config["gray_image"], dtype=np.uint8)
-        cv2.fillPoly(mask_img, [points], 255)
-        mean_intensity = cv2.mean(config["gray_image"], mask=mask_img)[0]
-        # Отрисовка контура и Feret-линий (опционально)
-        if config["show_fillPoly"]:
-            overlay = config["output_image"].copy()
-            cv2.fillPoly(
-                overlay,
-                [points],
-                (
-                    self.get_random_color()
-                    if config["fill_type_color"] == "Random"
-                    else self.rgba_to_bgr(config["fill_color"])
-                ),
-            )
-            alpha = config["fill_alpha"]
-            cv2.addWeighted(
-                overlay,
-                alpha,
-                config["output_image"],
-                1 - alpha,
-                0,
-                config["output_image"],
-            )
-        if config["show_polylines"]:
-            cv2.polylines(
-                config["output_image"],
-                [points],
-                isClosed=True,
-                color=self.rgba_to_bgr(config["outline_color"]),
-                thickness=config["thickness"],
-            )
-
-        if config["show_Feret_diametr"]:
-            self._draw_feret_lines(
-                config["output_image"], points, angle_max, (0, 255, 255)
-            )  # Желтый - Feret max
-            self._draw_feret_lines(
-                config["output_image"], points, angle_min, (255, 0, 0)
-            )  # Синий - Feret min
-
-        # Сохранение аннотации
-        if config["annotations"] is not None and config["raw_mask"] is not None:
-            config["annotations"].append(
-                (config["raw_mask"], f"Particle {config['particle_counter']}")
-            )
+        results, annotations = self._measure_particles(
+            contours=contours,
+            raw_masks=raw_masks,
+            output_image=output_image,
+            thickness=thickness,
+            **config,
+        )
+        return output_image, results, annotations
+
+    def _measure_particles(self, **config):
+        """Пакетный анализ всех частиц изображения с расчетом Feret-диаметров"""
+        points, offsets, kept = ParticleMeasurement.pack_contours(config["contours"])
+        measurements = self.measurement.measure(points, offsets)
+        # Яркость всех частиц по одному изображению меток
+        intensity, label_image = self.measurement.measure_intensity(
+            config["gray_image"], points, offsets, measurements["area"]
+        )
 
         # Масштабирование
         scale_factor = (
@@ -740,75 +941,67 @@ class ParticleAnalyzer:
             if config["scale_selector"]["scale"]
             else 1 * config["scale_factor_glob"]
         )
-        scale_area = scale_factor**2
-
-        # Добавление данных частицы
-        unit = self._get_translation(
-            config["scale_selector"]["unit"]
-        )  # Переводим единицу измерения
-
-        config["particle_data"].append(
-            {
-                "№": round(config["particle_counter"], config["round_value"]),
-                "D [{}]".format(unit): round(
-                    diameter * scale_factor, config["round_value"]
-                ),
-                "Dₘₐₓ [{}]".format(unit): round(
-                    feret_max * scale_factor, config["round_value"]
-                ),
-                "Dₘᵢₙ [{}]".format(unit): round(
-                    feret_min * scale_factor, config["round_value"]
-                ),
-                "Dₘₑₐₙ [{}]".format(unit): round(
-                    feret_mean * scale_factor, config["round_value"]
-                ),
-                "θₘₐₓ [°]": round(angle_max, config["round_value"]),
-                "θₘᵢₙ [°]": round(angle_min, config["round_value"]),
-                "S [{}²]".format(unit): round(area * scale_area, config["round_value"]),
-                "P [{}]".format(unit): round(
-                    perimeter * scale_factor, config["round_value"]
-                ),
-                "e": round(eccentricity, config["round_value"]),
-                f'I [{self._get_translation("ед.")}]': round(
-                    mean_intensity, config["round_value"]
-                ),
-                "centroid_x": round(centroid_x, config["round_value"]),
-                "centroid_y": round(centroid_y, config["round_value"]),
-                "points": points.tolist(),
-            }
-        )
 
-        return config["particle_counter"] + 1
-
-    def _draw_feret_lines(self, image, contour, angle, color=(0, 255, 0), thickness=2):
-        """Отрисовка Feret-линий"""
-        moments = cv2.moments(contour)
-        if moments["m00"] == 0:
-            return
-        cx = int(moments["m10"] / moments["m00"])
-        cy = int(moments["m01"] / moments["m00"])
-        center = (cx, cy)
-
-        M = cv2.getRotationMatrix2D(center, angle, 1.0)
-
-        rotated = cv2.transform(contour, M)
-
-        x_coords = rotated[:, 0, 0]
-        if len(x_coords) == 0:
-            return
-
-        x_min, x_max = np.min(x_coords), np.max(x_coords)
-        y_center = np.mean(rotated[:, 0, 1])
+        # Сохранение аннотаций (RLE по рамке объекта)
+        annotations = AnnotationStore(config["output_image"].shape)
+        if config["raw_masks"] is not None:
+            for number, source_index in enumerate(kept, start=1):
+                annotations.add(
+                    config["raw_masks"][source_index], f"Particle {number}", number
+                )
 
-        pt1_rotated = np.array([[[x_min, y_center]]], dtype=np.float32)
-        pt2_rotated = np.array([[[x_max, y_center]]], dtype=np.float32)
+        results = ParticleResults.from_measurements(
+            measurements,
+            intensity,
+            points,
+            offsets,
+            scale_factor=scale_factor,
+            unit=config["scale_selector"]["unit"],
+            label_image=label_image,
+            annotations=annotations,
+        )
+        self.render_results(config["output_image"], results, **config)
+        return results, annotations
 
-        M_inv = cv2.getRotationMatrix2D(center, -angle, 1.0)
-        pt1 = cv2.transform(pt1_rotated, M_inv)[0][0]
-        pt2 = cv2.transform(pt2_rotated, M_inv)[0][0]
+    @classmethod
+    def render_results(cls, image: np.ndarray, results: ParticleResults, /, **config):
+        """
+        Заливка, контуры и Feret-линии всех частиц за один проход по
+        сохраненным контурам, углам и центрам (без повторного измерения).
+        config — параметры отрисовки интерфейса; толщина линий по умолчанию
+        подбирается по размеру изображения.
+        """
+        if "thickness" not in config:
+            config["thickness"] = cls._get_scaled_thickness(
+                image.shape[1], image.shape[0]
+            )
+        columns = results.columns
+        centers = np.stack([columns["centroid_x"], columns["centroid_y"]], axis=1)
+        centers[columns["area"] == 0] = np.nan
+        return cls.create_renderer(**config).render(
+            image,
+            results.points,
+            results.offsets,
+            columns["angle_max"],
+            columns["angle_min"],
+            centers,
+        )
 
-        cv2.line(
-            image, tuple(pt1.astype(int)), tuple(pt2.astype(int)), color, thickness
+    @classmethod
+    def create_renderer(cls, **config) -> OverlayRenderer:
+        """Настройки отрисовки из параметров интерфейса"""
+        return OverlayRenderer(
+            show_fill=config["show_fillPoly"],
+            show_outline=config["show_polylines"],
+            show_feret=config.get("show_Feret_diametr", False),
+            fill_color=(
+                None
+                if config["fill_type_color"] == "Random"
+                else cls.rgba_to_bgr(config["fill_color"])
+            ),
+            fill_alpha=config["fill_alpha"],
+            outline_color=cls.rgba_to_bgr(config["outline_color"]),
+            thickness=config["thickness"],
         )
 
     @staticmethod
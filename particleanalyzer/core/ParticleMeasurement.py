@@ -0,0 +1,333 @@
+"""Пакетное измерение геометрии частиц по всем контурам изображения"""
+
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from particleanalyzer.core.FeretCalculator import FeretCalculator
+
+
+class ParticleMeasurement:
+    """
+    Измеряет все частицы изображения за несколько векторизованных проходов.
+
+    Контуры передаются в рваном формате: points — все точки подряд (N, 2) int32,
+    offsets — границы контуров (n + 1,). Результат — словарь столбцов float64.
+
+    При workers > 1 (0 — по числу ядер) большие наборы контуров делятся на
+    части, которые измеряются параллельно: в потоках ("thread", OpenCV и
+    NumPy отпускают GIL) или в процессах ("process"). Результаты частей
+    склеиваются в исходном порядке частиц; меньше min_parallel_particles
+    контуров всегда измеряются последовательно.
+    """
+
+    BACKENDS = ("thread", "process")
+    # Частей на одного исполнителя — для выравнивания нагрузки
+    SHARDS_PER_WORKER = 4
+
+    COLUMNS = (
+        "D",
+        "feret_max",
+        "feret_min",
+        "feret_mean",
+        "angle_max",
+        "angle_min",
+        "area",
+        "perimeter",
+        "eccentricity",
+        "centroid_x",
+        "centroid_y",
+    )
+
+    # Предел числа меток для гистограммного расчета яркости (n x 256 счетчиков)
+    _HISTOGRAM_MAX_LABELS = 1 << 14
+
+    def __init__(
+        self,
+        feret_calculator: FeretCalculator = None,
+        workers: int = 1,
+        backend: str = "thread",
+        min_parallel_particles: int = 2000,
+    ):
+        if backend not in self.BACKENDS:
+            raise ValueError(f"Неизвестный способ распараллеливания: {backend}")
+        self.feret_calculator = feret_calculator or FeretCalculator()
+        self.workers = workers
+        self.backend = backend
+        self.min_parallel_particles = min_parallel_particles
+        self._executor = None
+        self._executor_key = None
+        self._executor_lock = threading.Lock()
+
+    @staticmethod
+    def pack_contours(contours, min_points: int = 3):
+        """
+        Упаковка контуров в рваный формат.
+
+        Координаты приводятся к int32 (как при отрисовке), контуры короче
+        min_points пропускаются. Возвращает points, offsets и индексы
+        исходных контуров, попавших в результат.
+        """
+        arrays, kept = [], []
+        for i, contour in enumerate(contours):
+            if contour is None:
+                continue
+            points = np.asarray(contour).reshape(-1, 2).astype(np.int32)
+            if len(points) >= min_points:
+                arrays.append(points)
+                kept.append(i)
+
+        offsets = np.zeros(len(arrays) + 1, dtype=np.int64)
+        np.cumsum([len(a) for a in arrays], out=offsets[1:])
+        points = np.concatenate(arrays) if arrays else np.empty((0, 2), np.int32)
+        return points, offsets, np.array(kept, dtype=np.int64)
+
+    def measure(self, points: np.ndarray, offsets: np.ndarray) -> dict:
+        """Геометрические характеристики всех контуров (словарь столбцов)"""
+        points = np.asarray(points, dtype=np.int32).reshape(-1, 2)
+        offsets = np.asarray(offsets, dtype=np.int64)
+        workers = self._resolve_workers()
+        if workers <= 1 or len(offsets) - 1 < self.min_parallel_particles:
+            return self._measure_serial(points, offsets)
+
+        shards = self.split_shards(offsets, workers * self.SHARDS_PER_WORKER)
+        executor = self._get_executor(workers)
+        futures = [
+            executor.submit(
+                _measure_shard,
+                self.feret_calculator.mode,
+                points[offsets[first] : offsets[last]],
+                offsets[first : last + 1] - offsets[first],
+            )
+            for first, last in shards
+        ]
+        parts = [future.result() for future in futures]
+        return {
+            name: np.concatenate([part[name] for part in parts])
+            for name in self.COLUMNS
+        }
+
+    @staticmethod
+    def split_shards(offsets: np.ndarray, count: int):
+        """Деление контуров на части с примерно равным числом точек"""
+        n = len(offsets) - 1
+        targets = np.linspace(offsets[0], offsets[-1], count + 1)[1:-1]
+        bounds = np.unique(
+            np.concatenate([[0], np.searchsorted(offsets, targets), [n]])
+        )
+        bounds = bounds[(bounds >= 0) & (bounds <= n)]
+        return [(int(a), int(b)) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+    def close(self):
+        """Остановка пула исполнителей"""
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+            self._executor, self._executor_key = None, None
+
+    def _resolve_workers(self) -> int:
+        if self.workers is None or self.workers <= 0:
+            return os.cpu_count() or 1
+        return self.workers
+
+    def _get_executor(self, workers: int):
+        """Пул создается один раз и пересоздается при смене настроек"""
+        with self._executor_lock:
+            key = (self.backend, workers)
+            if self._executor_key != key:
+                if self._executor is not None:
+                    self._executor.shutdown(wait=False)
+                executor_class = (
+                    ProcessPoolExecutor
+                    if self.backend == "process"
+                    else ThreadPoolExecutor
+                )
+                self._executor = executor_class(max_workers=workers)
+                self._executor_key = key
+            return self._executor
+
+    def _measure_serial(self, points: np.ndarray, offsets: np.ndarray) -> dict:
+        n = len(offsets) - 1
+        if n == 0:
+            return {name: np.zeros(0, dtype=np.float64) for name in self.COLUMNS}
+
+        starts = offsets[:-1]
+        counts = np.diff(offsets)
+
+        # Следующая точка замкнутого контура
+        nxt = np.arange(len(points)) + 1
+        nxt[offsets[1:] - 1] = starts
+
+        x = points[:, 0].astype(np.float64)
+        y = points[:, 1].astype(np.float64)
+        x_next, y_next = x[nxt], y[nxt]
+
+        # Площадь и центроид по формуле шнурования (как cv2.moments)
+        cross = x * y_next - x_next * y
+        double_area = np.add.reduceat(cross, starts)
+        area = np.abs(double_area) / 2
+        with np.errstate(divide="ignore", invalid="ignore"):
+            centroid_x = np.add.reduceat((x + x_next) * cross, starts) / (
+                3 * double_area
+            )
+            centroid_y = np.add.reduceat((y + y_next) * cross, starts) / (
+                3 * double_area
+            )
+        # Вырожденный контур — среднее по точкам
+        degenerate = double_area == 0
+        if degenerate.any():
+            centroid_x[degenerate] = (np.add.reduceat(x, starts) / counts)[degenerate]
+            centroid_y[degenerate] = (np.add.reduceat(y, starts) / counts)[degenerate]
+
+        # Периметр (как cv2.arcLength для замкнутого контура)
+        perimeter = np.add.reduceat(np.hypot(x_next - x, y_next - y), starts)
+
+        # Диаметры Ферета и D считаются по одной выпуклой оболочке
+        hulls, hull_offsets = FeretCalculator.convex_hulls(points, offsets)
+        feret_max, feret_min, feret_mean, angle_max, angle_min = (
+            self.feret_calculator.compute_from_hulls(hulls, hull_offsets)
+        )
+
+        # Максимальное расстояние между точками контура (в точном режиме
+        # совпадает с Dmax)
+        if self.feret_calculator.mode == "exact":
+            diameter = feret_max
+        else:
+            diameter = FeretCalculator.diameters(hulls, hull_offsets)
+
+        return {
+            "D": diameter,
+            "feret_max": feret_max,
+            "feret_min": feret_min,
+            "feret_mean": feret_mean,
+            "angle_max": angle_max,
+            "angle_min": angle_min,
+            "area": area,
+            "perimeter": perimeter,
+            "eccentricity": self._eccentricity(points, offsets),
+            "centroid_x": centroid_x,
+            "centroid_y": centroid_y,
+        }
+
+    def measure_intensity(
+        self, gray_image: np.ndarray, points: np.ndarray, offsets: np.ndarray, area
+    ):
+        """
+        Статистика яркости всех частиц за один проход по изображению.
+
+        Возвращает словарь столбцов и изображение меток int32 (0 — фон,
+        i + 1 — частица i). Частицы растрируются по убыванию площади, поэтому
+        на перекрытиях пиксель достается меньшей частице.
+        """
+        labels = self.rasterize(
+            points, offsets, gray_image.shape, order=np.argsort(-np.asarray(area))
+        )
+        return self.intensity_stats(gray_image, labels, len(offsets) - 1), labels
+
+    @staticmethod
+    def rasterize(points: np.ndarray, offsets: np.ndarray, shape, order=None):
+        """Изображение меток частиц (как cv2.fillPoly для каждого контура)"""
+        labels = np.zeros(shape[:2], dtype=np.int32)
+        if order is None:
+            order = range(len(offsets) - 1)
+        for i in order:
+            contour = points[offsets[i] : offsets[i + 1]].reshape(-1, 1, 2)
+            cv2.fillPoly(labels, [contour], int(i) + 1)
+        return labels
+
+    @classmethod
+    def intensity_stats(
+        cls, gray_image: np.ndarray, labels: np.ndarray, n: int
+    ) -> dict:
+        """Среднее, СКО, минимум и максимум яркости по меткам (bincount)"""
+        if gray_image.dtype == np.uint8 and n < cls._HISTOGRAM_MAX_LABELS:
+            counts, sums, squares, minimum, maximum = cls._histogram_moments(
+                gray_image, labels, n
+            )
+        else:
+            counts, sums, squares, minimum, maximum = cls._weighted_moments(
+                gray_image, labels, n
+            )
+
+        # Частица без пикселей (как cv2.mean с пустой маской) — нули
+        filled = counts > 0
+        mean = np.zeros(n, dtype=np.float64)
+        std = np.zeros(n, dtype=np.float64)
+        mean[filled] = sums[filled] / counts[filled]
+        std[filled] = np.sqrt(
+            np.maximum(squares[filled] / counts[filled] - mean[filled] ** 2, 0)
+        )
+        return {
+            "intensity_mean": mean,
+            "intensity_std": std,
+            "intensity_min": np.where(filled, minimum, 0.0),
+            "intensity_max": np.where(filled, maximum, 0.0),
+        }
+
+    @staticmethod
+    def _histogram_moments(gray_image: np.ndarray, labels: np.ndarray, n: int):
+        """Гистограмма яркости каждой частицы одним целочисленным bincount (uint8)"""
+        histogram = np.bincount(
+            (labels * 256 + gray_image).ravel(), minlength=(n + 1) * 256
+        ).reshape(n + 1, 256)[1:]
+        levels = np.arange(256, dtype=np.float64)
+        present = histogram > 0
+        return (
+            histogram.sum(axis=1),
+            histogram @ levels,
+            histogram @ levels**2,
+            np.argmax(present, axis=1).astype(np.float64),
+            255.0 - np.argmax(present[:, ::-1], axis=1),
+        )
+
+    @staticmethod
+    def _weighted_moments(gray_image: np.ndarray, labels: np.ndarray, n: int):
+        """Взвешенные bincount по пикселям частиц (произвольный тип изображения)"""
+        flat_labels = labels.ravel()
+        inside = np.flatnonzero(flat_labels)
+        particle_labels = flat_labels[inside]
+        values = gray_image.ravel()[inside].astype(np.float64)
+
+        minimum = np.full(n + 1, np.inf)
+        maximum = np.full(n + 1, -np.inf)
+        np.minimum.at(minimum, particle_labels, values)
+        np.maximum.at(maximum, particle_labels, values)
+        return (
+            np.bincount(particle_labels, minlength=n + 1)[1:],
+            np.bincount(particle_labels, weights=values, minlength=n + 1)[1:],
+            np.bincount(particle_labels, weights=values**2, minlength=n + 1)[1:],
+            minimum[1:],
+            maximum[1:],
+        )
+
+    @staticmethod
+    def _eccentricity(points: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+        """
+        Эксцентриситет эллипса cv2.fitEllipse.
+
+        Алгебраическая аппроксимация OpenCV не имеет пакетного варианта,
+        поэтому выполняется один вызов C-функции на контур из 5+ точек.
+        """
+        n = len(offsets) - 1
+        axes = np.zeros((n, 2), dtype=np.float64)
+        fitted = np.flatnonzero(np.diff(offsets) >= 5)
+        for i in fitted:
+            contour = points[offsets[i] : offsets[i + 1]].reshape(-1, 1, 2)
+            axes[i] = cv2.fitEllipse(contour)[1]
+
+        a = axes.max(axis=1) / 2
+        b = axes.min(axis=1) / 2
+        eccentricity = np.zeros(n, dtype=np.float64)
+        valid = a > b
+        eccentricity[valid] = np.sqrt(1 - b[valid] ** 2 / a[valid] ** 2)
+        return eccentricity
+
+
+def _measure_shard(mode: str, points: np.ndarray, offsets: np.ndarray) -> dict:
+    """Измерение части контуров (на уровне модуля — для пула процессов)"""
+    return ParticleMeasurement(FeretCalculator(mode=mode))._measure_serial(
+        points, offsets
+    )
@@ -0,0 +1,143 @@
+"""Хранилище результатов измерения частиц в виде столбцов NumPy"""
+
+import numpy as np
+import pandas as pd
+
+from particleanalyzer.core.ParticleMeasurement import ParticleMeasurement
+
+
+class ParticleResults:
+    """
+    Результаты анализа одного изображения.
+
+    Столбцы — массивы float64 с постоянными (не зависящими от языка) именами,
+    длины и площади уже переведены в единицы масштаба. Контуры хранятся в
+    рваном формате: points (N, 2) int32, offsets (n + 1,). Округление и
+    локализованные заголовки применяются только в to_dataframe.
+    """
+
+    INTENSITY_COLUMNS = (
+        "intensity_mean",
+        "intensity_std",
+        "intensity_min",
+        "intensity_max",
+    )
+    COLUMNS = ParticleMeasurement.COLUMNS + INTENSITY_COLUMNS
+    LENGTH_COLUMNS = ("D", "feret_max", "feret_min", "feret_mean", "perimeter")
+    AREA_COLUMNS = ("area",)
+
+    # Столбцы таблицы интерфейса: (столбец, шаблон заголовка)
+    DISPLAY_COLUMNS = (
+        ("D", "D [{unit}]"),
+        ("feret_max", "Dₘₐₓ [{unit}]"),
+        ("feret_min", "Dₘᵢₙ [{unit}]"),
+        ("feret_mean", "Dₘₑₐₙ [{unit}]"),
+        ("angle_max", "θₘₐₓ [°]"),
+        ("angle_min", "θₘᵢₙ [°]"),
+        ("area", "S [{unit}²]"),
+        ("perimeter", "P [{unit}]"),
+        ("eccentricity", "e"),
+        ("intensity_mean", "I [{intensity_unit}]"),
+        ("centroid_x", "centroid_x"),
+        ("centroid_y", "centroid_y"),
+    )
+
+    def __init__(
+        self,
+        numbers: np.ndarray,
+        columns: dict,
+        points: np.ndarray,
+        offsets: np.ndarray,
+        unit: str = "px",
+        label_image: np.ndarray = None,
+        annotations=None,
+    ):
+        self.numbers = np.asarray(numbers, dtype=np.int64)
+        self.columns = {
+            name: np.asarray(columns[name], dtype=np.float64) for name in self.COLUMNS
+        }
+        self.points = np.asarray(points, dtype=np.int32).reshape(-1, 2)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.unit = unit
+        # Изображение меток: значение пикселя — номер частицы, 0 — фон
+        self.label_image = label_image
+        # AnnotationStore с масками частиц (может содержать удаленные номера)
+        self.annotations = annotations
+
+    @classmethod
+    def from_measurements(
+        cls,
+        measurements: dict,
+        intensity: dict,
+        points: np.ndarray,
+        offsets: np.ndarray,
+        scale_factor: float = 1.0,
+        unit: str = "px",
+        label_image: np.ndarray = None,
+        annotations=None,
+    ):
+        """Сборка результатов с переводом пикселей в единицы масштаба"""
+        columns = {**measurements, **intensity}
+        for name in cls.LENGTH_COLUMNS:
+            columns[name] = columns[name] * scale_factor
+        for name in cls.AREA_COLUMNS:
+            columns[name] = columns[name] * scale_factor**2
+        numbers = np.arange(1, len(offsets), dtype=np.int64)
+        return cls(numbers, columns, points, offsets, unit, label_image, annotations)
+
+    def __len__(self):
+        return len(self.numbers)
+
+    def contour(self, position: int) -> np.ndarray:
+        """Контур частицы (k, 1, 2) int32 по позиции в результатах"""
+        start, end = self.offsets[position], self.offsets[position + 1]
+        return self.points[start:end].reshape(-1, 1, 2)
+
+    def positions(self, numbers) -> np.ndarray:
+        """Позиции частиц с указанными номерами (в порядке хранения)"""
+        return np.flatnonzero(
+            np.isin(self.numbers, np.asarray(numbers, dtype=np.int64))
+        )
+
+    def take(self, positions) -> "ParticleResults":
+        """Подмножество частиц по позициям"""
+        positions = np.asarray(positions, dtype=np.int64)
+        lengths = np.diff(self.offsets)[positions]
+        offsets = np.zeros(len(positions) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        index = (
+            np.concatenate(
+                [np.arange(self.offsets[p], self.offsets[p + 1]) for p in positions]
+            )
+            if len(positions)
+            else np.empty(0, dtype=np.int64)
+        )
+        return ParticleResults(
+            self.numbers[positions],
+            {name: values[positions] for name, values in self.columns.items()},
+            self.points[index],
+            offsets,
+            self.unit,
+            self.label_image,
+            self.annotations,
+        )
+
+    def select(self, numbers) -> "ParticleResults":
+        """Частицы с указанными номерами"""
+        return self.take(self.positions(numbers))
+
+    def drop(self, numbers) -> "ParticleResults":
+        """Результаты без частиц с указанными номерами"""
+        keep = ~np.isin(self.numbers, np.asarray(numbers, dtype=np.int64))
+        return self.take(np.flatnonzero(keep))
+
+    def to_dataframe(self, translate=None, round_value: int = 2) -> pd.DataFrame:
+        """Таблица для интерфейса: локализованные заголовки и округление"""
+        translate = translate or (lambda text: text)
+        unit = translate(self.unit)
+        intensity_unit = translate("ед.")
+        data = {"№": self.numbers}
+        for name, header in self.DISPLAY_COLUMNS:
+            header = header.format(unit=unit, intensity_unit=intensity_unit)
+            data[header] = np.round(self.columns[name], round_value)
+        return pd.DataFrame(data)
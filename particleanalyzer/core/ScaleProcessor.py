@@ -4,19 +4,33 @@ import easyocr
 from PIL import Image, ImageDraw, ImageFont
 import re
 
+from particleanalyzer.core.ScaleTemplates import ScaleTemplates
+
 
 class ScaleProcessor:
     """
     Класс инкапсулирует логику: предобработка, OCR, безопасные вырезки и обработку изображения моделью YOLO.
     """
 
-    def __init__(self, model, device) -> None:
+    def __init__(self, model, device, model_provider=None) -> None:
         # Инициализация OCR и модели детекции
         self.device = device
         self.reader = easyocr.Reader(
             ["en"], gpu=self.device.type == "cuda", verbose=False
         )
-        self.model = model
+        self._model = model
+        # model_provider — функция, возвращающая модель при каждом обращении
+        # (модель загружается лениво и может быть вытеснена из кэша)
+        self._model_provider = model_provider
+        # Раскладки панелей микроскопов: на знакомых снимках шкала
+        # находится без модели (и без OCR для уже встречавшихся подписей)
+        self.templates = ScaleTemplates()
+
+    @property
+    def model(self):
+        if self._model_provider is not None:
+            return self._model_provider()
+        return self._model
 
     def preprocess_text_region(self, image_region, method: str = "adaptive"):
         if image_region.size == 0:
@@ -364,13 +378,14 @@ class ScaleProcessor:
 
         original_image = image.copy()
 
-        results = self.model(image, conf=confidence_threshold, device=self.device)
+        elements, scale_text_value = self.find_scale(
+            original_image, confidence_threshold
+        )
         # annotated_image = results[0].plot()
         annotated_image = image
 
         info_bar_height = None
         scale_bar_width = None
-        scale_text_value = "Not detected"
 
         info_bar_image = None
         scale_bar_image = None
@@ -379,32 +394,16 @@ class ScaleProcessor:
         scale_bar_left_mid = None
         scale_bar_right_mid = None
 
-        detected_elements = {
-            "info_bar": [],
-            "scale_bar": [],
-            "scale_text": [],
-        }
-
-        for result in results:
-            boxes = result.boxes
-            for box in boxes:
-                class_id = int(box.cls[0])
-                class_name = self.model.names[class_id]
-                confidence = float(box.conf[0])
-                bbox = box.xyxy[0].cpu().numpy()
-                if class_name in ["info_bar", "scale_bar", "scale_text"]:
-                    detected_elements[class_name].append((bbox, confidence))
-
-        if detected_elements["info_bar"]:
-            bbox, confidence = max(detected_elements["info_bar"], key=lambda x: x[1])
+        if elements.get("info_bar") is not None:
+            bbox = elements["info_bar"]
             height_pixels = bbox[3] - bbox[1]
             info_bar_height = int(height_pixels)
             info_bar_region = self.safe_crop(original_image, bbox)
             if info_bar_region is not None:
                 info_bar_image = cv2.cvtColor(info_bar_region, cv2.COLOR_BGR2RGB)
 
-        if detected_elements["scale_bar"]:
-            bbox, confidence = max(detected_elements["scale_bar"], key=lambda x: x[1])
+        if elements.get("scale_bar") is not None:
+            bbox = elements["scale_bar"]
             width_pixels = bbox[2] - bbox[0]
             scale_bar_width = int(width_pixels)
 
@@ -418,13 +417,8 @@ class ScaleProcessor:
             if scale_bar_region is not None:
                 scale_bar_image = cv2.cvtColor(scale_bar_region, cv2.COLOR_BGR2RGB)
 
-        if detected_elements["scale_text"]:
-            bbox, confidence = max(detected_elements["scale_text"], key=lambda x: x[1])
-            scale_text_region_ocr = self.safe_crop(original_image, bbox, padding=10)
-            if scale_text_region_ocr is not None:
-                scale_text_value = self.extract_scale_text_from_region(
-                    scale_text_region_ocr
-                )
+        if elements.get("scale_text") is not None:
+            bbox = elements["scale_text"]
             scale_text_region_display = self.safe_crop(original_image, bbox)
             if scale_text_region_display is not None:
                 scale_text_image = cv2.cvtColor(
@@ -480,6 +474,65 @@ class ScaleProcessor:
             (scale_bar_left_mid, scale_bar_right_mid),
         )
 
+    def find_scale(self, image, confidence_threshold):
+        """
+        Рамки info_bar, scale_bar, scale_text и подпись шкалы для снимка BGR.
+
+        Сначала снимок сравнивается с известными раскладками панелей;
+        модель и OCR всей подписи запускаются только при промахе, после
+        чего найденная шкала запоминается как шаблон.
+        """
+        found = self.templates.match(image)
+        if found is not None:
+            elements, scale_text_value = found["boxes"], found["text"]
+            if scale_text_value is not None:
+                return elements, scale_text_value
+            # Знакомая панель, новая подпись: OCR только фрагмента подписи
+            scale_text_value = self._read_scale_text(image, elements["scale_text"])
+            if ScaleTemplates.is_scale_text(scale_text_value):
+                self.templates.learn(image, elements, scale_text_value, found["layout"])
+                return elements, scale_text_value
+
+        elements = self.detect_elements(image, confidence_threshold)
+        scale_text_value = "Not detected"
+        if elements.get("scale_text") is not None:
+            scale_text_value = self._read_scale_text(image, elements["scale_text"])
+        self.templates.learn(image, elements, scale_text_value)
+        return elements, scale_text_value
+
+    def detect_elements(self, image, confidence_threshold) -> dict:
+        """Рамки элементов панели с наибольшей уверенностью модели"""
+        model = self.model
+        results = model(image, conf=confidence_threshold, device=self.device)
+
+        detected_elements = {
+            "info_bar": [],
+            "scale_bar": [],
+            "scale_text": [],
+        }
+
+        for result in results:
+            boxes = result.boxes
+            for box in boxes:
+                class_id = int(box.cls[0])
+                class_name = model.names[class_id]
+                confidence = float(box.conf[0])
+                bbox = box.xyxy[0].cpu().numpy()
+                if class_name in ["info_bar", "scale_bar", "scale_text"]:
+                    detected_elements[class_name].append((bbox, confidence))
+
+        return {
+            name: max(candidates, key=lambda x: x[1])[0]
+            for name, candidates in detected_elements.items()
+            if candidates
+        }
+
+    def _read_scale_text(self, image, bbox):
+        region = self.safe_crop(image, bbox, padding=10)
+        if region is None:
+            return "Not detected"
+        return self.extract_scale_text_from_region(region)
+
     def draw_scale_overlay_pil_cv2(
         self,
         rgb_image: np.ndarray,
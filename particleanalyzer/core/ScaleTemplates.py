@@ -0,0 +1,293 @@
+"""Шаблоны информационных панелей микроскопов для быстрого поиска шкалы"""
+
+import re
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+
+class ScaleTemplates:
+    """
+    Реестр раскладок информационной панели снимков СЭМ.
+
+    После распознавания шкалы моделью и OCR запоминается раскладка:
+    размер снимка, панель в оттенках серого и рамки панели, шкалы и
+    подписи. Снимок того же размера сравнивается с панелью
+    (cv2.matchTemplate в окне ±SEARCH_MARGIN пикселей) без области шкалы
+    и подписи, которые меняются с увеличением; при совпадении рамки
+    берутся из шаблона со сдвигом, модель не запускается.
+
+    Для каждой раскладки хранятся распознанные подписи (фрагменты подписи
+    и шкалы с результатом): если фрагменты нового снимка совпадают с одной
+    из них, результат берется без OCR. Иначе длина шкалы измеряется по ее
+    строкам, а OCR выполняется только для фрагмента подписи.
+    """
+
+    # Порог корреляции панели и фрагментов подписи/шкалы
+    LAYOUT_THRESHOLD = 0.8
+    READING_THRESHOLD = 0.97
+    SEARCH_MARGIN = 8
+    # Пиксель шкалы отличается от ее яркости не более чем на BAR_TOLERANCE;
+    # столбец принадлежит шкале, если таких пикселей не меньше BAR_FILL
+    BAR_TOLERANCE = 40
+    BAR_FILL = 0.8
+    MAX_READINGS = 32
+    SCALE_TEXT = re.compile(r"^\d+([.,]\d+)?(µm|nm|mm)$")
+
+    def __init__(self, max_layouts: int = 16):
+        self.max_layouts = max_layouts
+        self._layouts = OrderedDict()  # номер -> _Layout
+        self._next_key = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._layouts)
+
+    @classmethod
+    def is_scale_text(cls, text) -> bool:
+        """Подпись шкалы распознана (число и единицы измерения)"""
+        return isinstance(text, str) and cls.SCALE_TEXT.match(text) is not None
+
+    def match(self, image: np.ndarray):
+        """
+        Поиск раскладки для снимка (BGR). Возвращает None или словарь:
+        boxes — рамки info_bar, scale_bar, scale_text; text — подпись
+        (None, если подпись новая и ее нужно распознать в рамке
+        scale_text); layout — ключ раскладки для learn.
+        """
+        with self._lock:
+            candidates = [
+                (key, layout)
+                for key, layout in reversed(self._layouts.items())
+                if layout.shape == image.shape[:2]
+            ]
+        if not candidates:
+            return None
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+        for key, layout in candidates:
+            shift = self._locate(gray, layout)
+            if shift is None:
+                continue
+            with self._lock:
+                if key in self._layouts:
+                    self._layouts.move_to_end(key)
+
+            offset = np.tile(shift, 2)
+            info_box = layout.info_box + offset
+            for text_box, text_crop, bar_box, bar_crop, text in reversed(
+                layout.readings
+            ):
+                text_box, bar_box = text_box + offset, bar_box + offset
+                text_match = self._similar(_crop(gray, text_box), text_crop)
+                if text_match and self._similar(_crop(gray, bar_box), bar_crop):
+                    return {
+                        "boxes": {
+                            "info_bar": info_box,
+                            "scale_bar": bar_box,
+                            "scale_text": text_box,
+                        },
+                        "text": text,
+                        "layout": key,
+                    }
+
+            text_box, _, bar_box, _, _ = layout.readings[-1]
+            text_box, bar_box = text_box + offset, bar_box + offset
+            new_bar_box = self._measure_bar(gray, bar_box, info_box, layout.bar_value)
+            if new_bar_box is None:
+                continue
+            # Подпись следует за началом, концом или центром шкалы и меняет
+            # длину: окно OCR покрывает все варианты
+            start_shift = new_bar_box[0] - bar_box[0]
+            end_shift = new_bar_box[2] - bar_box[2]
+            x1, y1, x2, y2 = text_box
+            width = x2 - x1
+            text_box = np.array(
+                [
+                    max(info_box[0], x1 + min(start_shift, end_shift) - width // 2),
+                    y1,
+                    min(info_box[2], x2 + max(start_shift, end_shift) + width // 2),
+                    y2,
+                ]
+            )
+            bar_box = new_bar_box
+            return {
+                "boxes": {
+                    "info_bar": info_box,
+                    "scale_bar": bar_box,
+                    "scale_text": text_box,
+                },
+                "text": None,
+                "layout": key,
+            }
+        return None
+
+    def learn(self, image: np.ndarray, boxes: dict, text, layout=None):
+        """
+        Запоминание распознанной шкалы: новая раскладка или, если указан
+        layout (ключ из match), новая подпись известной раскладки.
+        """
+        if not self.is_scale_text(text) or any(
+            boxes.get(name) is None for name in ("info_bar", "scale_bar", "scale_text")
+        ):
+            return
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        info_box, bar_box, text_box = (
+            _clip_box(boxes[name], gray.shape)
+            for name in ("info_bar", "scale_bar", "scale_text")
+        )
+        panel, bar_crop, text_crop = (
+            _crop(gray, box) for box in (info_box, bar_box, text_box)
+        )
+        if panel is None or bar_crop is None or text_crop is None:
+            return
+        # Копии: шаблон не держит в памяти весь снимок
+        panel, bar_crop, text_crop = panel.copy(), bar_crop.copy(), text_crop.copy()
+        reading = (text_box, text_crop, bar_box, bar_crop, text)
+
+        with self._lock:
+            if layout in self._layouts:
+                readings = self._layouts[layout].readings
+                readings.append(reading)
+                del readings[: -self.MAX_READINGS]
+                return
+            # Однородная панель не отличает одну раскладку от другой
+            if panel.std() < 1:
+                return
+            self._layouts[self._next_key] = _Layout(
+                gray.shape,
+                info_box,
+                panel,
+                _static_mask(info_box, bar_box, text_box),
+                _bar_value(bar_crop),
+                [reading],
+            )
+            self._next_key += 1
+            while len(self._layouts) > self.max_layouts:
+                self._layouts.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._layouts.clear()
+
+    def _locate(self, gray: np.ndarray, layout):
+        """Сдвиг (dx, dy) панели на снимке или None, если панель не найдена"""
+        x1, y1, x2, y2 = layout.info_box
+        margin = self.SEARCH_MARGIN
+        left, top = max(0, x1 - margin), max(0, y1 - margin)
+        region = gray[top : y2 + margin, left : x2 + margin]
+        height, width = layout.panel.shape
+        if region.shape[0] < height or region.shape[1] < width:
+            return None
+        scores = cv2.matchTemplate(
+            region, layout.panel, cv2.TM_CCOEFF_NORMED, mask=layout.mask
+        )
+        # Участки без текстуры дают NaN и бесконечности
+        scores[~np.isfinite(scores)] = -1
+        _, score, _, (x, y) = cv2.minMaxLoc(scores)
+        if not score >= self.LAYOUT_THRESHOLD:
+            return None
+        return np.array([left + x - x1, top + y - y1])
+
+    def _similar(self, crop, reference) -> bool:
+        """Фрагменты одного размера совпадают"""
+        if crop is None or crop.shape != reference.shape:
+            return False
+        if reference.std() < 1 or crop.std() < 1:
+            return np.array_equal(crop, reference)
+        score = cv2.matchTemplate(crop, reference, cv2.TM_CCOEFF_NORMED)[0, 0]
+        return bool(score >= self.READING_THRESHOLD)
+
+    def _measure_bar(self, gray, bar_box, info_box, bar_value):
+        """
+        Рамка шкалы на строках известной шкалы: самая длинная серия
+        столбцов цвета шкалы, пересекающаяся с прежней рамкой.
+        """
+        x1, y1, x2, y2 = bar_box
+        left, right = info_box[0], info_box[2]
+        center, half = (y1 + y2) // 2, max(1, (y2 - y1) // 4)
+        band = gray[max(0, center - half) : center + half + 1, left:right]
+        if band.size == 0:
+            return None
+        filled = (np.abs(band.astype(np.int16) - bar_value) <= self.BAR_TOLERANCE).mean(
+            axis=0
+        ) >= self.BAR_FILL
+        edges = np.flatnonzero(np.diff(np.concatenate([[0], filled, [0]])))
+        starts, ends = edges[::2] + left, edges[1::2] + left
+        if len(starts) == 0:
+            return None
+        overlap = np.minimum(ends, x2) - np.maximum(starts, x1)
+        best = int(np.argmax(overlap))
+        length = ends[best] - starts[best]
+        # Серия во всю панель — фон цвета шкалы, а не шкала
+        if overlap[best] <= 0 or length >= 0.9 * (right - left):
+            return None
+        if not 0.2 * (x2 - x1) <= length <= 5 * (x2 - x1):
+            return None
+        return np.array([starts[best], y1, ends[best], y2])
+
+
+class _Layout:
+    """
+    Раскладка панели: размер снимка, панель и маска ее постоянной части,
+    яркость шкалы и распознанные подписи
+    """
+
+    __slots__ = ("shape", "info_box", "panel", "mask", "bar_value", "readings")
+
+    def __init__(self, shape, info_box, panel, mask, bar_value, readings):
+        self.shape = shape
+        self.info_box = info_box
+        self.panel = panel
+        self.mask = mask
+        self.bar_value = bar_value
+        self.readings = readings
+
+
+def _clip_box(box, shape) -> np.ndarray:
+    """Рамка (x1, y1, x2, y2) в целых пикселях в пределах снимка"""
+    height, width = shape[:2]
+    x1, y1, x2, y2 = (int(value) for value in box)
+    return np.array(
+        [
+            min(max(x1, 0), width),
+            min(max(y1, 0), height),
+            min(max(x2, 0), width),
+            min(max(y2, 0), height),
+        ]
+    )
+
+
+def _crop(gray: np.ndarray, box):
+    x1, y1, x2, y2 = _clip_box(box, gray.shape)
+    if x2 <= x1 or y2 <= y1:
+        return None
+    return gray[y1:y2, x1:x2]
+
+
+def _static_mask(info_box, bar_box, text_box) -> np.ndarray:
+    """
+    Маска постоянной части панели: без общей рамки шкалы и подписи,
+    расширенной по горизонтали на свою ширину в обе стороны (длина шкалы
+    и подписи меняется с увеличением)
+    """
+    left, top = info_box[0], info_box[1]
+    x1 = min(bar_box[0], text_box[0]) - left
+    x2 = max(bar_box[2], text_box[2]) - left
+    y1 = min(bar_box[1], text_box[1]) - top
+    y2 = max(bar_box[3], text_box[3]) - top
+    width = x2 - x1
+    mask = np.full(
+        (info_box[3] - info_box[1], info_box[2] - info_box[0]), 255, dtype=np.uint8
+    )
+    mask[max(0, y1) : max(0, y2), max(0, x1 - width) : max(0, x2 + width)] = 0
+    return mask
+
+
+def _bar_value(bar_crop: np.ndarray) -> float:
+    """Яркость шкалы: медиана средних строк ее рамки"""
+    height = bar_crop.shape[0]
+    center, half = height // 2, max(1, height // 4)
+    return float(np.median(bar_crop[max(0, center - half) : center + half + 1]))
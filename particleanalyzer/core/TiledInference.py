@@ -0,0 +1,339 @@
+"""Нарезанный инференс больших изображений для всех моделей"""
+
+import itertools
+import numpy as np
+
+from particleanalyzer.core.MaskTile import MaskTile
+
+
+class TiledInference:
+    """
+    Инференс по перекрывающимся фрагментам без SAHI.
+
+    Изображение режется той же сеткой, что и в SAHI (get_slice_bboxes):
+    шаг — размер фрагмента минус перекрытие, последние фрагменты
+    прижимаются к краю, поэтому все фрагменты одного размера и проходят
+    через модель общими пакетами. Дополнительно модель видит изображение
+    целиком (full_image, как perform_standard_pred в SAHI) — для крупных
+    частиц. Маски переводятся в координаты изображения; частицы,
+    разрезанные краем фрагмента, сливаются со своими частями из соседних
+    фрагментов, оставшиеся дубликаты удаляются жадным NMS по маскам.
+    Соседи ищутся по сетке, поэтому слияние линейно по числу частиц.
+
+    match_metric: "ios" — пересечение к меньшей маске (как
+    postprocess_match_metric в SAHI; частица, обрезанная краем фрагмента,
+    совпадает с целой), "iou" — пересечение к объединению.
+    """
+
+    MATCH_METRICS = ("ios", "iou")
+
+    def __init__(
+        self,
+        slice_height: int = 400,
+        slice_width: int = 400,
+        overlap_height_ratio: float = 0.2,
+        overlap_width_ratio: float = 0.2,
+        match_threshold: float = 0.5,
+        match_metric: str = "ios",
+        full_image: bool = True,
+    ):
+        if slice_height < 1 or slice_width < 1:
+            raise ValueError("Размер фрагмента должен быть положительным")
+        if not (0 <= overlap_height_ratio < 1 and 0 <= overlap_width_ratio < 1):
+            raise ValueError("Доля перекрытия фрагментов должна быть в [0, 1)")
+        if match_metric not in self.MATCH_METRICS:
+            raise ValueError(f"Неизвестная метрика совпадения: {match_metric}")
+        self.slice_height = int(slice_height)
+        self.slice_width = int(slice_width)
+        self.overlap_height_ratio = overlap_height_ratio
+        self.overlap_width_ratio = overlap_width_ratio
+        self.match_threshold = match_threshold
+        self.match_metric = match_metric
+        self.full_image = full_image
+
+    def slices(self, height: int, width: int) -> np.ndarray:
+        """Рамки фрагментов (n, 4) x1, y1, x2, y2 построчно"""
+        rows = _slice_starts(
+            height,
+            self.slice_height,
+            int(self.overlap_height_ratio * self.slice_height),
+        )
+        columns = _slice_starts(
+            width, self.slice_width, int(self.overlap_width_ratio * self.slice_width)
+        )
+        return np.array(
+            [
+                (
+                    x,
+                    y,
+                    min(x + self.slice_width, width),
+                    min(y + self.slice_height, height),
+                )
+                for y, x in itertools.product(rows, columns)
+            ],
+            dtype=np.int64,
+        )
+
+    def predict(self, image: np.ndarray, predict_batch):
+        """
+        Частицы всего изображения: (список MaskTile, уверенности).
+
+        predict_batch(изображения) возвращает для каждого изображения пару
+        (MaskTile в его координатах, уверенности) и сам делит их на пакеты.
+        """
+        image_shape = image.shape[:2]
+        boxes = self.slices(*image_shape)
+        crops = [image[y1:y2, x1:x2] for x1, y1, x2, y2 in boxes]
+        origins = [(x1, y1) for x1, y1, _, _ in boxes]
+        if self.full_image and len(boxes) > 1:
+            crops.append(image)
+            origins.append((0, 0))
+
+        tiles, scores, windows = [], [], []
+        for (x0, y0), crop, (crop_tiles, crop_scores) in zip(
+            origins, crops, predict_batch(crops)
+        ):
+            tiles.extend(
+                MaskTile(tile.mask, tile.x + x0, tile.y + y0, image_shape)
+                for tile in crop_tiles
+            )
+            scores.append(np.asarray(crop_scores, dtype=np.float32).reshape(-1))
+            window = (x0, y0, x0 + crop.shape[1], y0 + crop.shape[0])
+            windows.extend([window] * len(crop_tiles))
+        scores = np.concatenate(scores) if scores else np.empty(0, np.float32)
+        return self.merge(tiles, scores, np.array(windows, dtype=np.int64))
+
+    def merge(self, tiles: list, scores: np.ndarray, windows: np.ndarray):
+        """
+        Слияние частиц из фрагментов windows (n, 4) в координатах
+        изображения: (список MaskTile, уверенности).
+
+        Частица, касающаяся внутреннего края своего фрагмента, разрезана
+        швом. Ее маска объединяется с масками частиц из других фрагментов,
+        совпадающих с ней (match_metric выше match_threshold) в общей части
+        двух фрагментов, — половины не отбрасываются. Затем дубликаты целых
+        частиц удаляются NMS по маскам.
+        """
+        if len(tiles) == 0:
+            return [], np.empty(0, dtype=np.float32)
+        cut = np.array(
+            [_touches_seam(tile, window) for tile, window in zip(tiles, windows)]
+        )
+        groups = _seam_groups(
+            tiles, windows, cut, self.match_threshold, self.match_metric
+        )
+        tiles = [
+            tiles[members[0]] if len(members) == 1 else _union(tiles, members)
+            for members in groups
+        ]
+        scores = np.array([scores[members].max() for members in groups])
+        keep = mask_nms(tiles, scores, self.match_threshold, self.match_metric)
+        return [tiles[i] for i in keep], scores[keep]
+
+
+def mask_nms(
+    tiles: list, scores: np.ndarray, threshold: float = 0.5, metric: str = "ios"
+) -> np.ndarray:
+    """
+    Жадный NMS по маскам: частица подавляется более уверенной, если их
+    перекрытие (metric) больше threshold. Пары-кандидаты — маски с
+    пересекающимися рамками — отбираются векторно, пересечение масок
+    считается только в общей части рамок. Возвращает индексы оставленных
+    частиц по убыванию уверенности.
+    """
+    if len(tiles) == 0:
+        return np.empty(0, dtype=np.int64)
+    order = np.argsort(-np.asarray(scores), kind="stable")
+    tiles = [tiles[i] for i in order]
+    boxes = np.array([tile.bbox for tile in tiles], dtype=np.int64)
+    areas = np.array([tile.area for tile in tiles], dtype=np.int64)
+
+    first, second = _overlapping_pairs(boxes)
+    # Соседи каждой частицы среди менее уверенных
+    counts = np.bincount(first, minlength=len(tiles))
+    neighbours = np.split(second, np.cumsum(counts)[:-1])
+
+    suppressed = np.zeros(len(tiles), dtype=bool)
+    keep = []
+    for i, candidates in enumerate(neighbours):
+        if suppressed[i]:
+            continue
+        keep.append(i)
+        for j in candidates[~suppressed[candidates]]:
+            intersection = _mask_intersection(tiles[i], tiles[j])
+            if metric == "ios":
+                denominator = min(areas[i], areas[j])
+            else:
+                denominator = areas[i] + areas[j] - intersection
+            if denominator > 0 and intersection / denominator > threshold:
+                suppressed[j] = True
+    return order[np.asarray(keep, dtype=np.int64)]
+
+
+def _overlapping_pairs(boxes: np.ndarray):
+    """
+    Пары (i, j), i < j, с пересекающимися рамками; упорядочены по i.
+
+    Равномерная сетка с ячейкой в два типичных размера рамки: рамка
+    заносится во все задетые ячейки, сравниваются только рамки из общих
+    ячеек, поэтому число проверок растет линейно с числом рамок.
+    """
+    count = len(boxes)
+    empty = np.empty(0, dtype=np.int64)
+    if count < 2:
+        return empty, empty
+    boxes = np.asarray(boxes, dtype=np.int64)
+    extent = np.maximum(boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1])
+    cell = max(8, int(2 * np.median(extent)))
+    first_cell = boxes[:, :2] // cell
+    last_cell = np.maximum((boxes[:, 2:] - 1) // cell, first_cell)
+    columns, rows = (last_cell - first_cell + 1).T
+
+    # Записи (рамка, ячейка) для всех ячеек, задетых рамками
+    sizes = columns * rows
+    owner = np.repeat(np.arange(count), sizes)
+    local = np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    cell_x = first_cell[owner, 0] + local % columns[owner]
+    cell_y = first_cell[owner, 1] + local // columns[owner]
+    key = cell_y * (cell_x.max() + 1) + cell_x
+    order = np.lexsort((owner, key))
+    key, owner = key[order], owner[order]
+
+    # Записи одной ячейки идут подряд: пары на расстоянии 1, 2, ... записей
+    first, second = [], []
+    distance = 1
+    while distance < len(key):
+        same = key[distance:] == key[:-distance]
+        if not same.any():
+            break
+        first.append(owner[:-distance][same])
+        second.append(owner[distance:][same])
+        distance += 1
+    if not first:
+        return empty, empty
+    first, second = np.concatenate(first), np.concatenate(second)
+
+    overlaps = (
+        np.minimum(boxes[first, 2], boxes[second, 2])
+        > np.maximum(boxes[first, 0], boxes[second, 0])
+    ) & (
+        np.minimum(boxes[first, 3], boxes[second, 3])
+        > np.maximum(boxes[first, 1], boxes[second, 1])
+    )
+    pairs = np.unique(first[overlaps] * count + second[overlaps])
+    return pairs // count, pairs % count
+
+
+def _touches_seam(tile: MaskTile, window) -> bool:
+    """Маска касается края фрагмента, не совпадающего с краем изображения"""
+    x1, y1, x2, y2 = window
+    height, width = tile.image_shape
+    tile_x1, tile_y1, tile_x2, tile_y2 = tile.bbox
+    mask = tile.mask
+    return bool(
+        (x1 > 0 and tile_x1 == x1 and mask[:, 0].any())
+        or (y1 > 0 and tile_y1 == y1 and mask[0].any())
+        or (x2 < width and tile_x2 == x2 and mask[:, -1].any())
+        or (y2 < height and tile_y2 == y2 and mask[-1].any())
+    )
+
+
+def _seam_groups(
+    tiles: list, windows: np.ndarray, cut: np.ndarray, threshold, metric="ios"
+):
+    """
+    Группы частей одних частиц (списки индексов): пары соседей, из которых
+    хотя бы одна разрезана швом, объединяются, если перекрытие (metric)
+    их масок в общей части фрагментов выше threshold
+    """
+    parent = np.arange(len(tiles))
+
+    def root(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    boxes = np.array([tile.bbox for tile in tiles], dtype=np.int64)
+    first, second = _overlapping_pairs(boxes)
+    seam = cut[first] | cut[second]
+    for i, j in zip(first[seam], second[seam]):
+        window = (
+            max(windows[i, 0], windows[j, 0]),
+            max(windows[i, 1], windows[j, 1]),
+            min(windows[i, 2], windows[j, 2]),
+            min(windows[i, 3], windows[j, 3]),
+        )
+        a, b = _window_mask(tiles[i], window), _window_mask(tiles[j], window)
+        if a is None or b is None:
+            continue
+        intersection = np.count_nonzero(a & b)
+        if metric == "ios":
+            denominator = min(np.count_nonzero(a), np.count_nonzero(b))
+        else:
+            denominator = np.count_nonzero(a | b)
+        if denominator and intersection / denominator > threshold:
+            parent[root(i)] = root(j)
+
+    groups = {}
+    for i in range(len(tiles)):
+        groups.setdefault(root(i), []).append(i)
+    return list(groups.values())
+
+
+def _window_mask(tile: MaskTile, window):
+    """Маска частицы в пределах окна (x1, y1, x2, y2) или None вне окна"""
+    x1, y1, x2, y2 = window
+    if x2 <= x1 or y2 <= y1:
+        return None
+    full = np.zeros((y2 - y1, x2 - x1), dtype=bool)
+    tile_x1, tile_y1, tile_x2, tile_y2 = tile.bbox
+    left, top = max(x1, tile_x1), max(y1, tile_y1)
+    right, bottom = min(x2, tile_x2), min(y2, tile_y2)
+    if right > left and bottom > top:
+        full[top - y1 : bottom - y1, left - x1 : right - x1] = tile.mask[
+            top - tile_y1 : bottom - tile_y1, left - tile_x1 : right - tile_x1
+        ]
+    return full
+
+
+def _union(tiles: list, members: list) -> MaskTile:
+    """Объединение масок частей одной частицы"""
+    boxes = np.array([tiles[i].bbox for i in members])
+    x1, y1 = boxes[:, :2].min(axis=0)
+    x2, y2 = boxes[:, 2:].max(axis=0)
+    mask = np.zeros((y2 - y1, x2 - x1), dtype=bool)
+    for i in members:
+        tile = tiles[i]
+        height, width = tile.mask.shape
+        mask[
+            tile.y - y1 : tile.y - y1 + height, tile.x - x1 : tile.x - x1 + width
+        ] |= tile.mask
+    return MaskTile(mask, x1, y1, tiles[members[0]].image_shape)
+
+
+def _mask_intersection(a: MaskTile, b: MaskTile) -> int:
+    """Число общих пикселей двух масок (только в пересечении рамок)"""
+    ax1, ay1, ax2, ay2 = a.bbox
+    bx1, by1, bx2, by2 = b.bbox
+    x1, y1 = max(ax1, bx1), max(ay1, by1)
+    x2, y2 = min(ax2, bx2), min(ay2, by2)
+    if x2 <= x1 or y2 <= y1:
+        return 0
+    return int(
+        np.count_nonzero(
+            a.mask[y1 - ay1 : y2 - ay1, x1 - ax1 : x2 - ax1]
+            & b.mask[y1 - by1 : y2 - by1, x1 - bx1 : x2 - bx1]
+        )
+    )
+
+
+def _slice_starts(size: int, slice_size: int, overlap: int) -> list:
+    """Начала фрагментов по одной оси (последний прижат к краю)"""
+    step = max(1, slice_size - overlap)
+    starts, start = [], 0
+    while True:
+        starts.append(max(0, min(start, size - slice_size)))
+        if start + slice_size >= size:
+            return starts
+        start += step
@@ -1,6 +1,8 @@
 import os
 from ultralytics import YOLO, RTDETR
 
+from particleanalyzer.core.ModelCache import ModelCache
+
 
 class YOLOLoader:
     MODEL_MAPPING = {
@@ -9,23 +11,48 @@ class YOLOLoader:
         "ScaleProcessor": "ScaleProcessor_dataset9_RT-DETR.pt",
     }
 
-    def __init__(self):
+    def __init__(self, cache: ModelCache = None):
         self._base_path = os.path.join(os.path.dirname(__file__), "..", "model")
-
-        self.models = {
-            display_name: (
-                YOLO(self._model_path(file_name))
-                if file_name != "ScaleProcessor"
-                else RTDETR(self._model_path(file_name))
-            )
-            for display_name, file_name in self.__class__.MODEL_MAPPING.items()
-        }
+        # Модели загружаются при первом обращении
+        self.cache = cache if cache is not None else ModelCache()
 
     def _model_path(self, name: str) -> str:
         return os.path.join(self._base_path, name)
 
+    def _load_model(self, model_name: str):
+        file_name = self.__class__.MODEL_MAPPING[model_name]
+        return (
+            YOLO(self._model_path(file_name))
+            if file_name != "ScaleProcessor"
+            else RTDETR(self._model_path(file_name))
+        )
+
     def get_model(self, model_name: str):
-        return self.models.get(model_name)
+        if model_name not in self.__class__.MODEL_MAPPING:
+            return None
+        return self.cache.get(
+            ("yolo", model_name),
+            lambda: self._load_model(model_name),
+            ModelCache.file_size(self.get_model_path(model_name)),
+        )
+
+    def export_onnx(
+        self, model_name: str, imgsz: int = 640, dynamic: bool = True
+    ) -> str:
+        """
+        Экспорт сегментационной модели в ONNX рядом с весами .pt.
+
+        dynamic=True — динамические размеры пакета и входа. Возвращает путь
+        к файлу ONNX; ScaleProcessor (RT-DETR) не экспортируется.
+        """
+        if (
+            model_name not in self.__class__.MODEL_MAPPING
+            or model_name == "ScaleProcessor"
+        ):
+            raise ValueError(f"Модель {model_name} не экспортируется в ONNX")
+        model = YOLO(self.get_model_path(model_name))
+        path = model.export(format="onnx", imgsz=imgsz, dynamic=dynamic)
+        return str(path)
 
     def get_model_path(self, model_name: str):
         if model_name in self.__class__.MODEL_MAPPING:
@@ -0,0 +1,1375 @@
+"""Бенчмарки вычислительных этапов анализа частиц"""
+
+import os
+import time
+import cv2
+import numpy as np
+
+from particleanalyzer.core.FeretCalculator import FeretCalculator
+from particleanalyzer.core.ParticleMeasurement import ParticleMeasurement
+from particleanalyzer.core.OverlayRenderer import OverlayRenderer
+from particleanalyzer.core.MaskTile import MaskTile
+from particleanalyzer.core.AnnotationStore import AnnotationStore
+
+EXAMPLE_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "example")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".tif", ".tiff", ".bmp", ".webp")
+
+
+def load_example_images(image_dir: str = EXAMPLE_DIR):
+    """Загружает изображения (BGR) из каталога с примерами"""
+    if not os.path.isdir(image_dir):
+        raise FileNotFoundError(f"Каталог с изображениями не найден: {image_dir}")
+    images = {}
+    for name in sorted(os.listdir(image_dir)):
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        image = cv2.imread(os.path.join(image_dir, name))
+        if image is not None:
+            images[name] = image
+    return images
+
+
+def extract_contours(
+    image: np.ndarray,
+    min_points: int = 3,
+    approximation: int = cv2.CHAIN_APPROX_SIMPLE,
+):
+    """Реальные контуры частиц без модели: порог Оцу и внешние контуры"""
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    gray = cv2.GaussianBlur(gray, (5, 5), 0)
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, approximation)
+    return [c.reshape(-1, 2) for c in contours if len(c) >= min_points]
+
+
+def load_example_contours(
+    image_dir: str = EXAMPLE_DIR,
+    min_points: int = 3,
+    approximation: int = cv2.CHAIN_APPROX_SIMPLE,
+):
+    """Контуры частиц со всех изображений из каталога с примерами"""
+    contours = []
+    for image in load_example_images(image_dir).values():
+        contours.extend(extract_contours(image, min_points, approximation))
+    return contours
+
+
+def _best_time(fn, repeats: int) -> float:
+    """Лучшее время из нескольких запусков, в секундах"""
+    timings = []
+    for _ in range(max(1, repeats)):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def _legacy_feret(points: np.ndarray):
+    """Прежний расчет: поворот контура cv2.transform для 180 углов"""
+    contour = np.asarray(points, dtype=np.int32).reshape(-1, 1, 2)
+    feret_values = []
+    for angle in np.arange(0, 180, 1):
+        M = cv2.getRotationMatrix2D((0, 0), angle, 1)
+        x_coords = cv2.transform(contour, M)[:, 0, 0]
+        feret_values.append(x_coords.max() - x_coords.min())
+    feret_max, feret_min = max(feret_values), min(feret_values)
+    return (
+        feret_max,
+        feret_min,
+        np.mean(feret_values),
+        feret_values.index(feret_max),
+        feret_values.index(feret_min),
+    )
+
+
+def _legacy_measure(points: np.ndarray):
+    """Прежний расчет геометрии одной частицы (без интенсивности и отрисовки)"""
+    from scipy.spatial.distance import pdist
+
+    points = np.array(points, dtype=np.int32).reshape((-1, 1, 2))
+    moments = cv2.moments(points)
+    if moments["m00"] != 0:
+        centroid_x = moments["m10"] / moments["m00"]
+        centroid_y = moments["m01"] / moments["m00"]
+    else:
+        centroid_x, centroid_y = np.mean(points[:, 0, :], axis=0)
+    area = cv2.contourArea(points)
+    perimeter = cv2.arcLength(points, closed=True)
+    distances = pdist(points[:, 0, :])
+    diameter = np.max(distances) if len(distances) > 0 else 0
+    eccentricity = 0
+    if len(points) >= 5:
+        _, (major_axis, minor_axis), _ = cv2.fitEllipse(points)
+        a, b = max(major_axis, minor_axis) / 2, min(major_axis, minor_axis) / 2
+        eccentricity = np.sqrt(1 - (b**2 / a**2)) if a > b else 0
+    return (
+        diameter,
+        *_legacy_feret(points),
+        area,
+        perimeter,
+        eccentricity,
+        centroid_x,
+        centroid_y,
+    )
+
+
+def benchmark_feret(image_dir: str = EXAMPLE_DIR, repeats: int = 3):
+    """Сравнение прежнего цикла, режима совместимости и вращающихся калиперов"""
+    contours = load_example_contours(image_dir)
+    points, offsets, _ = ParticleMeasurement.pack_contours(contours)
+    exact = FeretCalculator("exact")
+    sampled = FeretCalculator("sampled")
+
+    def run_legacy():
+        return np.array([_legacy_feret(c) for c in contours], dtype=np.float64)
+
+    def run_batch(calculator):
+        return np.stack(calculator.compute_batch(points, offsets), axis=1)
+
+    timings = {
+        "legacy": _best_time(run_legacy, repeats),
+        "sampled": _best_time(lambda: run_batch(sampled), repeats),
+        "exact": _best_time(lambda: run_batch(exact), repeats),
+    }
+    legacy_values = run_legacy()
+    sampled_values = run_batch(sampled)
+    exact_values = run_batch(exact)
+
+    report = {
+        "particles": len(contours),
+        "points": len(points),
+        "timings": timings,
+        # Режим совместимости должен повторять прежний расчет без расхождений
+        "sampled_vs_legacy_max_diff": float(
+            np.abs(sampled_values - legacy_values).max(initial=0)
+        ),
+        # Расхождение дискретного перебора с точным решением (Dmax, Dmin)
+        "exact_vs_sampled_max_diff": np.abs(exact_values[:, :2] - sampled_values[:, :2])
+        .max(axis=0, initial=0)
+        .tolist(),
+    }
+
+    print(f"Particles: {report['particles']}, contour points: {report['points']}")
+    _print_timings(timings, baseline="legacy")
+    print(f"  sampled vs legacy, max |diff|: {report['sampled_vs_legacy_max_diff']}")
+    print(
+        "  exact vs sampled, max |diff| (Dmax, Dmin): "
+        f"{report['exact_vs_sampled_max_diff']}"
+    )
+    return report
+
+
+def _print_timings(timings: dict, baseline: str):
+    """Печать времени и ускорения относительно базового варианта"""
+    for name, seconds in timings.items():
+        speedup = timings[baseline] / seconds if seconds > 0 else float("inf")
+        print(f"  {name:<12} {seconds * 1000:10.2f} ms  x{speedup:.1f}")
+
+
+def benchmark_measurement(image_dir: str = EXAMPLE_DIR, repeats: int = 3):
+    """Прежний поштучный расчет против пакетного ядра ParticleMeasurement"""
+    contours = load_example_contours(image_dir)
+    measurement = ParticleMeasurement(FeretCalculator("sampled"))
+
+    def run_legacy():
+        return np.array([_legacy_measure(c) for c in contours], dtype=np.float64)
+
+    def run_batch():
+        points, offsets, _ = ParticleMeasurement.pack_contours(contours)
+        columns = measurement.measure(points, offsets)
+        return np.stack([columns[name] for name in measurement.COLUMNS], axis=1)
+
+    timings = {
+        "per-particle": _best_time(run_legacy, repeats),
+        "batch": _best_time(run_batch, repeats),
+    }
+    # Эксцентриситет исключен: cv2.fitEllipse недетерминирован на вырожденных
+    # контурах из нескольких точек
+    compared = [
+        i for i, name in enumerate(measurement.COLUMNS) if name != "eccentricity"
+    ]
+    max_diff = np.abs(run_batch() - run_legacy())[:, compared].max(axis=0, initial=0)
+
+    report = {
+        "particles": len(contours),
+        "timings": timings,
+        "max_diff": dict(
+            zip([measurement.COLUMNS[i] for i in compared], max_diff.tolist())
+        ),
+    }
+    print(f"Particles: {report['particles']}")
+    _print_timings(timings, baseline="per-particle")
+    for name, value in report["max_diff"].items():
+        print(f"  max |diff| {name:<12} {value:.3g}")
+    return report
+
+
+def benchmark_diameter(image_dir: str = EXAMPLE_DIR, repeats: int = 3):
+    """
+    Проверка и замер D: pdist по всем точкам против диаметра оболочки.
+
+    Контуры берутся без аппроксимации (CHAIN_APPROX_NONE), как у полных
+    масок retina_masks. Значения D должны совпадать точно.
+    """
+    from scipy.spatial.distance import pdist
+
+    contours = load_example_contours(image_dir, approximation=cv2.CHAIN_APPROX_NONE)
+    points, offsets, _ = ParticleMeasurement.pack_contours(contours)
+
+    def run_pdist():
+        return np.array([pdist(c).max() for c in contours], dtype=np.float64)
+
+    def run_hull():
+        hulls, hull_offsets = FeretCalculator.convex_hulls(points, offsets)
+        return FeretCalculator.diameters(hulls, hull_offsets)
+
+    timings = {
+        "pdist": _best_time(run_pdist, repeats),
+        "hull": _best_time(run_hull, repeats),
+    }
+    expected, actual = run_pdist(), run_hull()
+    mismatches = int(np.count_nonzero(expected != actual))
+
+    print(
+        f"Particles: {len(contours)}, contour points: {len(points)}, "
+        f"largest contour: {max(len(c) for c in contours)}"
+    )
+    _print_timings(timings, baseline="pdist")
+    print(f"  D mismatches: {mismatches}")
+    if mismatches:
+        raise AssertionError(f"D differs from pdist for {mismatches} particles")
+    return {"particles": len(contours), "timings": timings, "mismatches": mismatches}
+
+
+def benchmark_intensity(image_dir: str = EXAMPLE_DIR, repeats: int = 3):
+    """
+    Средняя яркость: маска на весь кадр для каждой частицы против одного
+    изображения меток. Внешние контуры не перекрываются, значения совпадают.
+    """
+    measurement = ParticleMeasurement()
+    cases = []
+    for image in load_example_images(image_dir).values():
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        points, offsets, _ = ParticleMeasurement.pack_contours(extract_contours(image))
+        area = measurement.measure(points, offsets)["area"]
+        cases.append((gray, points, offsets, area))
+
+    def run_legacy():
+        values = []
+        for gray, points, offsets, _ in cases:
+            for i in range(len(offsets) - 1):
+                mask = np.zeros_like(gray, dtype=np.uint8)
+                contour = points[offsets[i] : offsets[i + 1]].reshape(-1, 1, 2)
+                cv2.fillPoly(mask, [contour], 255)
+                values.append(cv2.mean(gray, mask=mask)[0])
+        return np.array(values, dtype=np.float64)
+
+    def run_labels():
+        return np.concatenate(
+            [
+                measurement.measure_intensity(gray, points, offsets, area)[0][
+                    "intensity_mean"
+                ]
+                for gray, points, offsets, area in cases
+            ]
+        )
+
+    timings = {
+        "per-particle": _best_time(run_legacy, repeats),
+        "label-image": _best_time(run_labels, repeats),
+    }
+    max_diff = float(np.abs(run_labels() - run_legacy()).max(initial=0))
+
+    print(f"Images: {len(cases)}, particles: {sum(len(c[2]) - 1 for c in cases)}")
+    _print_timings(timings, baseline="per-particle")
+    print(f"  mean intensity max |diff|: {max_diff:.3g}")
+    return {"timings": timings, "max_diff": max_diff}
+
+
+def benchmark_render(image_dir: str = EXAMPLE_DIR, repeats: int = 3):
+    """Заливка с cv2.addWeighted на каждую частицу против OverlayRenderer"""
+    measurement = ParticleMeasurement()
+    renderer = OverlayRenderer(show_feret=True, fill_color=(0, 128, 255))
+    cases = []
+    for image in load_example_images(image_dir).values():
+        points, offsets, _ = ParticleMeasurement.pack_contours(extract_contours(image))
+        columns = measurement.measure(points, offsets)
+        centers = np.stack([columns["centroid_x"], columns["centroid_y"]], axis=1)
+        centers[columns["area"] == 0] = np.nan
+        cases.append((image, points, offsets, columns, centers))
+
+    def run_legacy():
+        for image, points, offsets, _, _ in cases:
+            output = image.copy()
+            for contour in OverlayRenderer.split_contours(points, offsets):
+                overlay = output.copy()
+                cv2.fillPoly(overlay, [contour], renderer.fill_color)
+                cv2.addWeighted(overlay, 0.5, output, 0.5, 0, output)
+                cv2.polylines(output, [contour], True, renderer.outline_color, 1)
+
+    def run_renderer():
+        for image, points, offsets, columns, centers in cases:
+            renderer.render(
+                image.copy(),
+                points,
+                offsets,
+                columns["angle_max"],
+                columns["angle_min"],
+                centers,
+            )
+
+    timings = {
+        "per-particle": _best_time(run_legacy, repeats),
+        # Включает Feret-линии, которых нет в прежнем варианте
+        "overlay": _best_time(run_renderer, repeats),
+    }
+    print(f"Images: {len(cases)}, particles: {sum(len(c[2]) - 1 for c in cases)}")
+    _print_timings(timings, baseline="per-particle")
+    return {"timings": timings}
+
+
+def benchmark_parallel(
+    image_dir: str = EXAMPLE_DIR, repeats: int = 3, copies: int = 64
+):
+    """
+    Последовательное и параллельное измерение плотного набора контуров.
+
+    Контуры примеров повторяются copies раз, имитируя склеенную мозаику нарезанного инференса
+    с десятками тысяч частиц. Результаты частей должны совпадать с
+    последовательным расчетом (кроме эксцентриситета, см. benchmark_measurement).
+    """
+    contours = load_example_contours(image_dir) * copies
+    points, offsets, _ = ParticleMeasurement.pack_contours(contours)
+    # Не меньше двух исполнителей, чтобы проверить склейку частей
+    workers = max(2, os.cpu_count() or 1)
+    variants = {
+        "serial": ParticleMeasurement(workers=1),
+        "thread": ParticleMeasurement(workers=workers, backend="thread"),
+        "process": ParticleMeasurement(workers=workers, backend="process"),
+    }
+    try:
+        # Первый вызов создает пул исполнителей
+        results = {name: m.measure(points, offsets) for name, m in variants.items()}
+        timings = {
+            name: _best_time(lambda m=m: m.measure(points, offsets), repeats)
+            for name, m in variants.items()
+        }
+    finally:
+        for measurement in variants.values():
+            measurement.close()
+
+    mismatches = {
+        name: [
+            column
+            for column in ParticleMeasurement.COLUMNS
+            if column != "eccentricity"
+            and not np.array_equal(values[column], results["serial"][column])
+        ]
+        for name, values in results.items()
+    }
+    print(f"Particles: {len(contours)}, workers: {workers}")
+    _print_timings(timings, baseline="serial")
+    for name, columns in mismatches.items():
+        print(f"  {name:<12} mismatching columns: {columns or 'none'}")
+    if any(mismatches.values()):
+        raise AssertionError(f"Parallel measurement differs: {mismatches}")
+    return {"particles": len(contours), "workers": workers, "timings": timings}
+
+
+def _synthetic_rfdetr_outputs(detections: int, seed: int = 0):
+    """Выходы RF-DETR (рамки, метки, маски 108x108) с эллипсами внутри рамок"""
+    rng = np.random.default_rng(seed)
+    grid = np.mgrid[0:108, 0:108].astype(np.float32) + 0.5
+    centers = rng.uniform(0.05, 0.95, (detections, 2))
+    sizes = rng.uniform(0.005, 0.03, (detections, 2))
+    boxes = np.concatenate([centers - sizes, centers + sizes], axis=1)
+    masks = np.empty((detections, 108, 108), dtype=np.float32)
+    for i, ((cx, cy), (sx, sy)) in enumerate(zip(centers * 108, sizes * 108)):
+        distance = ((grid[1] - cx) / sx) ** 2 + ((grid[0] - cy) / sy) ** 2
+        masks[i] = 2.0 - distance
+    labels = np.stack([np.zeros(detections), np.ones(detections)], axis=1)
+    return [boxes[None], labels[None], masks[None]]
+
+
+def benchmark_rfdetr_postprocess(
+    image_dir: str = EXAMPLE_DIR, repeats: int = 3, detections: int = 200
+):
+    """
+    Постобработка RF-DETR на кадре 4K: маска на весь кадр для каждой детекции
+    против увеличения маски только внутри рамки (пиковая память и время).
+    """
+    import tracemalloc
+    from particleanalyzer.core.ONNXLoader import ONNXLoader
+
+    outputs = _synthetic_rfdetr_outputs(detections)
+    original_size = (3840, 2160)
+    loader = ONNXLoader.__new__(ONNXLoader)
+
+    def run_full_frame():
+        contours = []
+        for mask in outputs[2][0]:
+            full = cv2.resize(mask, original_size, interpolation=cv2.INTER_LINEAR)
+            found, _ = cv2.findContours(
+                (full > 0.5).astype(np.uint8),
+                cv2.RETR_EXTERNAL,
+                cv2.CHAIN_APPROX_SIMPLE,
+            )
+            if found:
+                contours.append(max(found, key=cv2.contourArea).reshape(-1, 2))
+        return contours
+
+    def run_tiles():
+        results = loader._postprocess_rfdetr(outputs, original_size, 0.3, 300)
+        return [tile.main_contour() for tile in results.data["mask_tiles"]]
+
+    def peak_memory(fn):
+        tracemalloc.start()
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return peak
+
+    # Прежний вариант дополнительно держал все полноразмерные маски в
+    # sv.Detections (detections x H x W bool); здесь учтен только проход
+    timings = {
+        "full-frame": _best_time(run_full_frame, repeats),
+        "bbox-tiles": _best_time(run_tiles, repeats),
+    }
+    peaks = {
+        "full-frame": peak_memory(run_full_frame)
+        + detections * original_size[0] * original_size[1],
+        "bbox-tiles": peak_memory(run_tiles),
+    }
+    expected, actual = run_full_frame(), run_tiles()
+    mismatches = abs(len(expected) - len(actual)) + sum(
+        not np.array_equal(a, b) for a, b in zip(expected, actual)
+    )
+
+    print(f"Detections: {detections}, frame: {original_size[0]}x{original_size[1]}")
+    _print_timings(timings, baseline="full-frame")
+    for name, peak in peaks.items():
+        print(f"  {name:<12} peak memory {peak / 2**20:10.1f} MiB")
+    print(f"  contour mismatches: {mismatches}")
+    return {"timings": timings, "peak_bytes": peaks, "mismatches": mismatches}
+
+
+class _SyntheticMasks:
+    """
+    Маски N x H x W с одним эллипсом в каждой. Кадр маски строится при
+    обращении, поэтому весь набор не занимает N x H x W в памяти.
+    """
+
+    def __init__(self, ellipses: list, size: int):
+        self.ellipses = ellipses  # (x1, y1, эллипс float32)
+        self.shape = (len(ellipses), size, size)
+
+    def __getitem__(self, index):
+        i, rows, cols = index
+        frame = np.zeros(self.shape[1:], dtype=np.float32)
+        x1, y1, ellipse = self.ellipses[i]
+        height, width = ellipse.shape
+        frame[y1 : y1 + height, x1 : x1 + width] = ellipse
+        return frame[rows, cols].copy()
+
+
+def _yolo_masks_peak_rss(mode: str, detections: int, size: int, seed: int = 0):
+    """
+    Прирост пикового RSS (байты) и время переноса масок в дочернем процессе.
+
+    Источник масок — тензор torch на GPU (как retina_masks) или, без CUDA,
+    _SyntheticMasks, который строит кадр маски при обращении: в RSS
+    учитывается только то, что копирует сам перенос.
+    """
+    import resource
+
+    rng = np.random.default_rng(seed)
+    centers = rng.uniform(0.05, 0.95, (detections, 2)) * size
+    radii = rng.uniform(4, 40, (detections, 2))
+    boxes = np.concatenate([centers - radii, centers + radii], axis=1)
+
+    try:
+        import torch
+
+        use_torch = torch.cuda.is_available()
+    except ImportError:
+        use_torch = False
+
+    ellipses = []
+    for (cx, cy), (rx, ry) in zip(centers, radii):
+        ellipse = np.zeros((int(2 * ry) + 1, int(2 * rx) + 1), np.float32)
+        cv2.ellipse(ellipse, (int(rx), int(ry)), (int(rx), int(ry)), 0, 0, 360, 1.0, -1)
+        ellipses.append((int(cx - rx), int(cy - ry), ellipse))
+
+    if use_torch:
+        source = torch.zeros((detections, size, size), device="cuda")
+        for i, (x1, y1, ellipse) in enumerate(ellipses):
+            height, width = ellipse.shape
+            source[i, y1 : y1 + height, x1 : x1 + width] = torch.from_numpy(
+                ellipse
+            ).cuda()
+    else:
+        source = _SyntheticMasks(ellipses, size)
+
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    contours = []
+    if mode == "dense":
+        # Прежний путь: r.masks.data.cpu().numpy()
+        if use_torch:
+            dense = source.cpu().numpy()
+        else:
+            dense = np.empty(source.shape, dtype=np.float32)
+            for i in range(detections):
+                dense[i] = source[i, :, :]
+        for mask in dense:
+            found, _ = cv2.findContours(
+                (mask > 0.5).astype(np.uint8),
+                cv2.RETR_EXTERNAL,
+                cv2.CHAIN_APPROX_SIMPLE,
+            )
+            if found:
+                contours.append(max(found, key=cv2.contourArea).reshape(-1, 2))
+    else:
+        for tile in MaskTile.from_boxes(source, boxes):
+            contour = tile.main_contour()
+            if contour is not None:
+                contours.append(contour)
+    elapsed = time.perf_counter() - start
+    # ru_maxrss в Linux — в килобайтах
+    peak = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before) * 1024
+    return {"peak_rss": peak, "seconds": elapsed, "contours": contours}
+
+
+def _available_memory():
+    """Доступная оперативная память (байты) или None, если неизвестна"""
+    try:
+        with open("/proc/meminfo") as file:
+            for line in file:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def benchmark_yolo_masks(
+    image_dir: str = EXAMPLE_DIR,
+    repeats: int = 1,
+    detections: int = 1000,
+    size: int = 2048,
+):
+    """
+    Пиковый RSS при переносе масок YOLO: плотная копия N x H x W против
+    фрагментов по рамкам. Каждый режим — в отдельном процессе.
+
+    Плотная копия float32 занимает detections x size x size x 4 байт
+    (15.6 GiB по умолчанию): если столько памяти нет, плотный режим
+    пропускается и измеряются только фрагменты.
+    """
+    import multiprocessing
+
+    modes = ["dense", "tiles"]
+    dense_bytes = detections * size * size * np.dtype(np.float32).itemsize
+    available = _available_memory()
+    if available is not None and dense_bytes > available:
+        modes.remove("dense")
+        print(
+            f"Dense mode skipped: the {detections}x{size}x{size} float32 copy needs "
+            f"{dense_bytes / 2**30:.1f} GiB, {available / 2**30:.1f} GiB available "
+            "(pass fewer detections or a smaller size to benchmark_yolo_masks)"
+        )
+
+    context = multiprocessing.get_context("spawn")
+    runs = {}
+    for mode in modes:
+        with context.Pool(1) as pool:
+            runs[mode] = pool.apply(_yolo_masks_peak_rss, (mode, detections, size))
+
+    mismatches = None
+    if "dense" in runs:
+        mismatches = sum(
+            not np.array_equal(a, b)
+            for a, b in zip(runs["dense"]["contours"], runs["tiles"]["contours"])
+        ) + abs(len(runs["dense"]["contours"]) - len(runs["tiles"]["contours"]))
+
+    print(f"Detections: {detections}, masks: {size}x{size}")
+    _print_timings(
+        {mode: run["seconds"] for mode, run in runs.items()}, baseline=modes[0]
+    )
+    for mode, run in runs.items():
+        print(f"  {mode:<12} peak RSS +{run['peak_rss'] / 2**20:10.1f} MiB")
+    if mismatches is not None:
+        print(f"  contour mismatches: {mismatches}")
+    return {
+        mode: {"peak_rss": run["peak_rss"], "seconds": run["seconds"]}
+        for mode, run in runs.items()
+    } | {"mismatches": mismatches}
+
+
+def benchmark_annotations(
+    image_dir: str = EXAMPLE_DIR, repeats: int = 3, detections: int = 500
+):
+    """
+    Память аннотаций на кадре 4K: полноразмерные bool-маски (как в
+    gr.AnnotatedImage) против RLE по рамке объекта в AnnotationStore.
+    """
+    from particleanalyzer.core.ONNXLoader import ONNXLoader
+
+    outputs = _synthetic_rfdetr_outputs(detections)
+    image_shape = (2160, 3840)
+    loader = ONNXLoader.__new__(ONNXLoader)
+    tiles = loader._postprocess_rfdetr(
+        outputs, image_shape[::-1], 0.3, detections
+    ).data["mask_tiles"]
+    detections = len(tiles)
+
+    def build_store():
+        store = AnnotationStore(image_shape)
+        for number, tile in enumerate(tiles, 1):
+            store.add(tile, f"Particle {number}", number)
+        return store
+
+    store = build_store()
+    timings = {
+        "build": _best_time(build_store, repeats),
+        "to_coco": _best_time(store.to_coco, repeats),
+    }
+    dense_bytes = detections * image_shape[0] * image_shape[1]
+    mismatches = sum(
+        not np.array_equal(store.decode(i).to_full(), tile.to_full())
+        for i, tile in enumerate(tiles[:20])
+    )
+
+    print(f"Annotations: {detections}, frame: {image_shape[1]}x{image_shape[0]}")
+    for name, seconds in timings.items():
+        print(f"  {name:<12} {seconds * 1000:10.2f} ms")
+    print(f"  full-frame   {dense_bytes / 2**20:10.1f} MiB")
+    print(f"  rle-store    {store.nbytes / 2**20:10.3f} MiB")
+    print(f"  mask mismatches (first 20): {mismatches}")
+    return {
+        "timings": timings,
+        "dense_bytes": dense_bytes,
+        "store_bytes": store.nbytes,
+        "mismatches": mismatches,
+    }
+
+
+def benchmark_detectron_predictor(
+    image_dir: str = EXAMPLE_DIR, repeats: int = 3, model_name: str = None
+):
+    """
+    Задержка Detectron2: DefaultPredictor на каждый запрос против
+    кэшированного predictor (первый вызов и установившийся режим).
+    """
+    from particleanalyzer.core.ModelManager import ModelManager, DETECTRON2_AVAILABLE
+
+    if not DETECTRON2_AVAILABLE:
+        raise RuntimeError("Detectron2 не установлен")
+    from detectron2.engine import DefaultPredictor
+
+    loader = ModelManager().detectron_loader
+    model_name = model_name or next(iter(loader.MODEL_MAPPING))
+    image = next(iter(load_example_images(image_dir).values()))
+
+    def run_per_request():
+        return DefaultPredictor(loader.get_config(model_name).clone())(image)
+
+    def run_cached():
+        return loader.predict(model_name, image, 0.5, 0.5, 100)
+
+    # Первый вызов включает построение модели и загрузку весов
+    first_call = _best_time(run_cached, 1)
+    timings = {
+        "per-request": _best_time(run_per_request, repeats),
+        "first call": first_call,
+        "steady": _best_time(run_cached, repeats),
+    }
+
+    print(f"Model: {model_name}, image: {image.shape[1]}x{image.shape[0]}")
+    _print_timings(timings, baseline="per-request")
+    return timings
+
+
+def _model_startup(preload):
+    """Время создания ModelManager и RSS процесса после него (байты)"""
+    import resource
+    from particleanalyzer.core.ModelManager import ModelManager
+
+    start = time.perf_counter()
+    manager = ModelManager(preload=preload)
+    elapsed = time.perf_counter() - start
+    # ru_maxrss в Linux — в килобайтах
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return {"seconds": elapsed, "rss": rss, "loaded": len(manager.cache)}
+
+
+def benchmark_model_startup(image_dir: str = EXAMPLE_DIR, repeats: int = 1):
+    """
+    Запуск ModelManager: все модели сразу (как раньше) против ленивой
+    загрузки. Каждый вариант — в отдельном процессе.
+    """
+    import multiprocessing
+    from particleanalyzer.core.YOLOLoader import YOLOLoader
+    from particleanalyzer.core.ONNXLoader import ONNXLoader
+    from particleanalyzer.core.ModelManager import DETECTRON2_AVAILABLE
+
+    every_model = [*YOLOLoader.MODEL_MAPPING, *ONNXLoader.MODEL_MAPPING]
+    if DETECTRON2_AVAILABLE:
+        from particleanalyzer.core.Detectron2Loader import Detectron2Loader
+
+        every_model += list(Detectron2Loader.MODEL_MAPPING)
+
+    context = multiprocessing.get_context("spawn")
+    runs = {}
+    for name, preload in (("eager", every_model), ("lazy", [])):
+        with context.Pool(1) as pool:
+            runs[name] = pool.apply(_model_startup, (preload,))
+
+    _print_timings({name: run["seconds"] for name, run in runs.items()}, "eager")
+    for name, run in runs.items():
+        print(
+            f"  {name:<12} RSS {run['rss'] / 2**20:10.1f} MiB, "
+            f"models loaded: {run['loaded']}"
+        )
+    return runs
+
+
+def benchmark_yolo_batch(
+    image_dir: str = EXAMPLE_DIR,
+    repeats: int = 3,
+    model_name: str = "Yolo11 (dataset 9)",
+    batch_size: int = 8,
+):
+    """Инференс YOLO по одному изображению против общих пакетов predict_batch"""
+    from particleanalyzer.core.ModelManager import ModelManager
+    from particleanalyzer.core.ImagePreprocessor import ImagePreprocessor
+
+    manager = ModelManager(preload=[model_name])
+    model = manager.get_model(model_name)
+    # Один профиль обработки: все изображения приводятся к 1024x1024
+    images = [
+        ImagePreprocessor.resize_image(
+            cv2.resize(image, (1024, 1024)), "1024x1024", False
+        )[0]
+        for image in load_example_images(image_dir).values()
+    ]
+    images = (images * batch_size)[: max(batch_size, len(images))]
+    options = {"imgsz": 640, "retina_masks": True, "max_det": 1000}
+
+    def run_single():
+        return [model(image, verbose=False, **options)[0] for image in images]
+
+    def run_batched():
+        return manager.predict_batch(model_name, images, batch_size, **options)
+
+    run_batched()  # прогрев
+    timings = {
+        "single": _best_time(run_single, repeats),
+        "batched": _best_time(run_batched, repeats),
+    }
+    mismatches = sum(
+        len(a.boxes) != len(b.boxes) for a, b in zip(run_single(), run_batched())
+    )
+    print(f"Images: {len(images)}, batch size: {batch_size}")
+    _print_timings(timings, baseline="single")
+    print(f"  detection count mismatches: {mismatches}")
+    return {"timings": timings, "mismatches": mismatches}
+
+
+def benchmark_onnx_session(
+    image_dir: str = EXAMPLE_DIR,
+    repeats: int = 3,
+    model_name: str = "RF-DETR Seg (Preview)",
+):
+    """
+    Задержка ONNX-модели на CPU для разных SessionOptions и время создания
+    сессии без кэша оптимизированного графа и с ним.
+    """
+    import itertools
+    from particleanalyzer.core.ONNXLoader import ONNXLoader
+
+    loader = ONNXLoader(device="cpu")
+    if not os.path.exists(loader.get_model_path(model_name)):
+        raise FileNotFoundError(f"Модель не найдена: {model_name}")
+    image = next(iter(load_example_images(image_dir).values()))
+    input_tensor, _ = loader._preprocess_numpy(image, model_name)
+
+    timings = {}
+    for level, mode, threads in itertools.product(
+        ("basic", "all"), ("sequential", "parallel"), (1, 0)
+    ):
+        loader.configure(
+            intra_op_threads=threads,
+            execution_mode=mode,
+            optimization_level=level,
+            cache_optimized=False,
+        )
+        info = loader.get_model(model_name)
+
+        def run(info=info):
+            return info["session"].run(
+                info["output_names"], {info["input_name"]: input_tensor}
+            )
+
+        run()  # прогрев
+        label = f"{level[:3]}/{mode[:3]}/{threads or 'auto'}"
+        timings[label] = _best_time(run, repeats)
+
+    def start_session():
+        loader.configure(cache_optimized=True)
+        return loader.get_model(model_name)
+
+    cached_path = loader.optimized_model_path(model_name)
+    if os.path.exists(cached_path):
+        os.remove(cached_path)
+    startup = {"cold start": _best_time(start_session, 1)}
+    startup["cached graph"] = _best_time(start_session, repeats)
+
+    print(f"Model: {model_name}, input: {tuple(input_tensor.shape)}")
+    _print_timings(timings, baseline=next(iter(timings)))
+    print("Session creation:")
+    _print_timings(startup, baseline="cold start")
+    return {"latency": timings, "startup": startup}
+
+
+def benchmark_onnx_batch(
+    image_dir: str = EXAMPLE_DIR,
+    repeats: int = 3,
+    model_name: str = "RF-DETR Seg (Preview)",
+    batch_size: int = 8,
+):
+    """
+    ONNX: прежний препроцессинг и инференс по одному изображению против
+    predict_batch с переиспользуемым входным тензором (время на изображение
+    и выделенная при препроцессинге память).
+    """
+    import tracemalloc
+    from particleanalyzer.core.ONNXLoader import ONNXLoader
+
+    loader = ONNXLoader()
+    info = loader.get_model(model_name)
+    if info is None:
+        raise FileNotFoundError(f"Модель не найдена: {model_name}")
+    images = list(load_example_images(image_dir).values())
+    images = (images * batch_size)[: max(batch_size, len(images))]
+
+    def legacy_preprocess(image):
+        resized = cv2.resize(image, (432, 432), interpolation=cv2.INTER_LINEAR)
+        resized = cv2.cvtColor(resized, cv2.COLOR_BGR2RGB)
+        processed = resized.astype(np.float32) / 255.0
+        processed = (
+            processed - np.array([0.485, 0.456, 0.406], dtype=np.float32)
+        ) / np.array([0.229, 0.224, 0.225], dtype=np.float32)
+        return np.expand_dims(processed.transpose(2, 0, 1), axis=0)
+
+    def run_legacy():
+        return [
+            loader._postprocess_rfdetr(
+                info["session"].run(
+                    info["output_names"],
+                    {info["input_name"]: legacy_preprocess(image)},
+                ),
+                (image.shape[1], image.shape[0]),
+                0.3,
+                300,
+            )
+            for image in images
+        ]
+
+    def run_batched(io_binding=False):
+        return loader.predict_batch(
+            model_name, images, 0.3, 300, batch_size, io_binding=io_binding
+        )
+
+    def preprocess_allocations(fn):
+        tracemalloc.start()
+        fn()
+        allocated = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return allocated
+
+    run_batched()  # прогрев и буферы
+    count = len(images)
+    timings = {
+        "per-image": _best_time(run_legacy, repeats) / count,
+        "batched": _best_time(run_batched, repeats) / count,
+        "io-binding": _best_time(lambda: run_batched(True), repeats) / count,
+    }
+    buffer = np.empty((1, 3, 432, 432), np.float32)
+    allocations = {
+        "per-image": preprocess_allocations(
+            lambda: [legacy_preprocess(image) for image in images]
+        ),
+        "batched": preprocess_allocations(
+            lambda: [
+                loader._preprocess_into(image, buffer[0], (432, 432))
+                for image in images
+            ]
+        ),
+    }
+    print(f"Images: {count}, batch size: {batch_size} (time per image)")
+    _print_timings(timings, baseline="per-image")
+    for name, allocated in allocations.items():
+        print(f"  {name:<12} preprocessing peak {allocated / 2**20:8.1f} MiB")
+    return {"timings": timings, "preprocess_peak_bytes": allocations}
+
+
+def benchmark_quantization(
+    image_dir: str = EXAMPLE_DIR,
+    repeats: int = 1,
+    model_name: str = "RF-DETR Seg INT8 (Preview)",
+):
+    """
+    INT8 против FP32 RF-DETR на CPU: задержка на изображение, число частиц
+    и дрейф распределения эквивалентных диаметров (проверка ONNXQuantizer).
+    """
+    from particleanalyzer.core.ONNXLoader import ONNXLoader
+    from particleanalyzer.core.ONNXQuantizer import ONNXQuantizer
+
+    if not ONNXLoader.is_available(model_name):
+        raise FileNotFoundError(
+            f"Модель {model_name} не создана: ParticleAnalyzer quantize"
+        )
+    quantizer = ONNXQuantizer()
+    images = list(load_example_images(image_dir).values())
+    reports = [
+        quantizer.evaluate(ONNXLoader.QUANTIZED_MODELS[model_name], model_name, images)
+        for _ in range(max(1, repeats))
+    ]
+    report = min(reports, key=lambda r: r["latency"])
+
+    _print_timings(
+        {"fp32": report["reference_latency"], "int8": report["latency"]},
+        baseline="fp32",
+    )
+    print(f"  particles: {report['reference_count']} -> {report['count']}")
+    print(f"  count drift:  {report['count_drift']:+.2%}")
+    if report["ks_statistic"] is not None:
+        print(f"  KS statistic: {report['ks_statistic']:.3f}")
+        print(f"  median D drift: {report['median_drift']:+.2%}")
+    if report["passed"]:
+        print("  accuracy gate: passed")
+    else:
+        print(f"  accuracy gate: FAILED ({report['reason']})")
+    return report
+
+
+def benchmark_yolo_onnx(
+    image_dir: str = EXAMPLE_DIR,
+    repeats: int = 3,
+    model_name: str = "Yolo11 ONNX (dataset 9)",
+    confidence_threshold: float = 0.5,
+    iou_threshold: float = 0.7,
+):
+    """
+    Экспортированная YOLO-seg в ONNXLoader против ultralytics (.pt,
+    retina_masks): задержка на изображение, число частиц, отклонение
+    рамок и IoU масок сопоставленных частиц.
+    """
+    from ultralytics import YOLO
+    from particleanalyzer.core.ONNXLoader import ONNXLoader
+    from particleanalyzer.core.YOLOLoader import YOLOLoader
+
+    if not ONNXLoader.is_available(model_name):
+        raise FileNotFoundError(
+            f"Модель {model_name} не создана: ParticleAnalyzer export-onnx"
+        )
+    loader = ONNXLoader(device="cpu")
+    weights = YOLOLoader().get_model_path(ONNXLoader.EXPORTED_MODELS[model_name])
+    model = YOLO(weights)
+    images = list(load_example_images(image_dir).values())
+    options = {
+        "imgsz": 640,
+        "retina_masks": True,
+        "max_det": 1000,
+        "conf": confidence_threshold,
+        "iou": iou_threshold,
+        "device": "cpu",
+        "verbose": False,
+    }
+
+    def run_ultralytics():
+        return [model(image, **options)[0] for image in images]
+
+    def run_onnx():
+        return loader.predict_batch(
+            model_name,
+            images,
+            confidence_threshold,
+            1000,
+            batch_size=1,
+            iou_threshold=iou_threshold,
+        )
+
+    reference, candidate = run_ultralytics(), run_onnx()  # прогрев
+    timings = {
+        "ultralytics": _best_time(run_ultralytics, repeats) / len(images),
+        "onnx": _best_time(run_onnx, repeats) / len(images),
+    }
+
+    counts, box_errors, mask_ious = [0, 0], [], []
+    for result, detections in zip(reference, candidate):
+        boxes = result.boxes.xyxy.cpu().numpy()
+        masks = (
+            result.masks.data.cpu().numpy() > 0.5
+            if result.masks is not None
+            else np.zeros((0,) + result.orig_shape, dtype=bool)
+        )
+        counts[0] += len(boxes)
+        counts[1] += len(detections)
+        if len(boxes) == 0 or len(detections) == 0:
+            continue
+        # Сопоставление по максимальному IoU рамок
+        tiles = detections.data["mask_tiles"]
+        for index, box in enumerate(detections.xyxy):
+            top_left = np.maximum(boxes[:, :2], box[:2])
+            bottom_right = np.minimum(boxes[:, 2:], box[2:])
+            intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=1)
+            union = (
+                np.prod(boxes[:, 2:] - boxes[:, :2], axis=1)
+                + np.prod(box[2:] - box[:2])
+                - intersection
+            )
+            match = int(np.argmax(intersection / np.maximum(union, 1e-9)))
+            box_errors.append(np.abs(boxes[match] - box).max())
+            mask = tiles[index].to_full()
+            overlap = np.logical_and(mask, masks[match]).sum()
+            total = np.logical_or(mask, masks[match]).sum()
+            mask_ious.append(overlap / total if total else 1.0)
+
+    report = {
+        "timings": timings,
+        "counts": tuple(counts),
+        "max_box_error": float(np.max(box_errors)) if box_errors else 0.0,
+        "mean_mask_iou": float(np.mean(mask_ious)) if mask_ious else 1.0,
+    }
+    print(f"Images: {len(images)} (time per image)")
+    _print_timings(timings, baseline="ultralytics")
+    print(f"  particles: {counts[0]} -> {counts[1]}")
+    print(f"  max box error: {report['max_box_error']:.2f} px")
+    print(f"  mean mask IoU: {report['mean_mask_iou']:.4f}")
+    return report
+
+
+def benchmark_scheduler(
+    image_dir: str = EXAMPLE_DIR,
+    repeats: int = 3,
+    model_name: str = "Yolo11 (dataset 9)",
+    clients: int = 5,
+    max_wait: float = 0.015,
+):
+    """
+    Параллельные запросы clients пользователей (как очередь Gradio):
+    отдельные прямые проходы против микропакетов InferenceScheduler.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from particleanalyzer.core.ModelManager import ModelManager
+    from particleanalyzer.core.InferenceScheduler import InferenceScheduler
+
+    manager = ModelManager(preload=[model_name])
+    images = [
+        cv2.resize(image, (1024, 1024))
+        for image in load_example_images(image_dir).values()
+    ]
+    images = (images * clients)[: max(clients, len(images))]
+    options = {"imgsz": 640, "retina_masks": True, "max_det": 1000, "conf": 0.5}
+
+    def run(scheduler):
+        with ThreadPoolExecutor(clients) as pool:
+            return list(
+                pool.map(
+                    lambda image: scheduler.predict(model_name, image, **options),
+                    images,
+                )
+            )
+
+    separate = InferenceScheduler(manager, max_batch_size=1, max_wait=0)
+    batched = InferenceScheduler(manager, max_batch_size=clients, max_wait=max_wait)
+    run(batched)  # прогрев
+    timings = {
+        "separate": _best_time(lambda: run(separate), repeats) / len(images),
+        "micro-batch": _best_time(lambda: run(batched), repeats) / len(images),
+    }
+    mismatches = sum(
+        len(a.boxes) != len(b.boxes) for a, b in zip(run(separate), run(batched))
+    )
+    print(f"Requests: {len(images)}, clients: {clients} (time per request)")
+    _print_timings(timings, baseline="separate")
+    print(f"  detection count mismatches: {mismatches}")
+    return {"timings": timings, "mismatches": mismatches}
+
+
+def benchmark_tiled(
+    image_dir: str = EXAMPLE_DIR,
+    repeats: int = 3,
+    model_name: str = "Yolo11 (dataset 9)",
+    slice_size: int = 400,
+    overlap_ratio: float = 0.2,
+):
+    """
+    Нарезанный инференс мозаики 2x2 из примеров: SAHI get_sliced_prediction
+    (фрагменты по одному) против встроенного TiledInference (пакеты
+    фрагментов и NMS по маскам). Время и число частиц.
+    """
+    import torch
+    from particleanalyzer.core.ParticleAnalyzer import ParticleAnalyzer
+    from particleanalyzer.core.TiledInference import TiledInference
+
+    try:
+        from sahi import AutoDetectionModel
+        from sahi.predict import get_sliced_prediction
+    except ImportError:
+        raise RuntimeError("Для сравнения нужен пакет sahi (pip install sahi)")
+
+    analyzer = ParticleAnalyzer(preload_models=[model_name])
+    sahi_model = AutoDetectionModel.from_pretrained(
+        model_type="ultralytics",
+        model_path=analyzer.model_manager.get_model_path(model_name),
+        confidence_threshold=0.5,
+        device=str(analyzer.device or "cpu"),
+    )
+    images = [
+        cv2.resize(image, (1024, 1024))
+        for image in load_example_images(image_dir).values()
+    ]
+    images = (images * 4)[:4]
+    mosaic = np.vstack([np.hstack(images[:2]), np.hstack(images[2:])])
+    tiler = TiledInference(
+        slice_size, slice_size, overlap_ratio, overlap_ratio, match_threshold=0.5
+    )
+
+    def run_sahi():
+        return get_sliced_prediction(
+            mosaic,
+            sahi_model,
+            slice_height=slice_size,
+            slice_width=slice_size,
+            overlap_height_ratio=overlap_ratio,
+            overlap_width_ratio=overlap_ratio,
+            postprocess_match_threshold=0.5,
+            verbose=0,
+        ).object_prediction_list
+
+    def run_native():
+        return tiler.predict(
+            mosaic,
+            lambda crops: analyzer._predict_crops(model_name, crops, 0.5, 0.5, 1000),
+        )[0]
+
+    with torch.no_grad():
+        run_native()  # прогрев
+        timings = {
+            "sahi": _best_time(run_sahi, repeats),
+            "native": _best_time(run_native, repeats),
+        }
+        counts = {"sahi": len(run_sahi()), "native": len(run_native())}
+    print(
+        f"Mosaic: {mosaic.shape[1]}x{mosaic.shape[0]}, "
+        f"slices: {len(tiler.slices(*mosaic.shape[:2]))}"
+    )
+    _print_timings(timings, baseline="sahi")
+    print(f"  particles: sahi {counts['sahi']}, native {counts['native']}")
+    return {"timings": timings, "counts": counts}
+
+
+def benchmark_tile_merge(
+    image_dir: str = EXAMPLE_DIR,
+    repeats: int = 3,
+    counts=(2500, 5000, 10000, 20000),
+):
+    """
+    Слияние результатов фрагментов для синтетических мозаик с counts
+    частицами: время на частицу должно оставаться постоянным. Частицы
+    «детектора» — связные области фрагмента, поэтому разрезанные швами
+    частицы должны собираться обратно целиком.
+    """
+    from particleanalyzer.core.TiledInference import TiledInference
+
+    tiler = TiledInference(400, 400, 0.2, 0.2, match_threshold=0.5, full_image=False)
+    timings, report = {}, {}
+    for count in counts:
+        rng = np.random.default_rng(0)
+        side = int(np.sqrt(count) * 60)
+        image = np.zeros((side, side), dtype=np.uint8)
+        for x, y, radius in zip(
+            rng.integers(side, size=count),
+            rng.integers(side, size=count),
+            rng.integers(4, 12, size=count),
+        ):
+            cv2.circle(image, (int(x), int(y)), int(radius), 255, -1)
+        reference = cv2.connectedComponents(image)[0] - 1
+
+        tiles, scores, windows = [], [], []
+        for x1, y1, x2, y2 in tiler.slices(side, side):
+            number, labels, stats, _ = cv2.connectedComponentsWithStats(
+                image[y1:y2, x1:x2]
+            )
+            for label in range(1, number):
+                x, y, width, height = stats[label, :4]
+                tiles.append(
+                    MaskTile(
+                        labels[y : y + height, x : x + width] == label,
+                        x1 + x,
+                        y1 + y,
+                        image.shape,
+                    )
+                )
+                windows.append((x1, y1, x2, y2))
+        scores = rng.random(len(tiles))
+        windows = np.array(windows, dtype=np.int64)
+
+        label = f"{count} particles"
+        timings[label] = _best_time(
+            lambda: tiler.merge(tiles, scores, windows), repeats
+        )
+        merged = len(tiler.merge(tiles, scores, windows)[0])
+        report[label] = (len(tiles), merged, reference)
+
+    print("Merge of slice detections")
+    for label, (detections, merged, reference) in report.items():
+        print(
+            f"  {label:<16} {timings[label] * 1000:9.2f} ms "
+            f"({timings[label] / detections * 1e6:.1f} us per detection), "
+            f"detections {detections} -> {merged}, connected regions {reference}"
+        )
+    return {"timings": timings, "counts": report}
+
+
+def benchmark_inference_cache(image_dir: str = EXAMPLE_DIR, repeats: int = 3):
+    """
+    Стоимость попадания в кэш обнаружений: хэш изображения, чтение из
+    памяти и с диска. Частицы «детектора» — контуры порога Оцу и их маски
+    по рамкам; после чтения с диска они должны совпадать с исходными.
+    """
+    import tempfile
+    from particleanalyzer.core.InferenceCache import InferenceCache
+
+    images = load_example_images(image_dir)
+    timings = {}
+    with tempfile.TemporaryDirectory() as directory:
+        memory_cache = InferenceCache()
+        disk_cache = InferenceCache(max_bytes=0, directory=directory)
+        for name, image in images.items():
+            contours = extract_contours(image)
+            masks = []
+            for contour in contours:
+                x, y, width, height = cv2.boundingRect(contour)
+                mask = np.zeros((height, width), dtype=np.uint8)
+                cv2.drawContours(mask, [contour - (x, y)], -1, 1, -1)
+                masks.append(MaskTile(mask, x, y, image.shape))
+
+            key = InferenceCache.key(image, model="benchmark")
+            memory_cache.put(key, contours, masks)
+            disk_cache.put(key, contours, masks)
+            loaded_contours, loaded_masks, _, _ = disk_cache.get(key)
+            assert all(
+                np.array_equal(a, b) for a, b in zip(contours, loaded_contours)
+            ) and len(contours) == len(loaded_contours)
+            assert all(
+                np.array_equal(a.mask, b.mask) and a.bbox == b.bbox
+                for a, b in zip(masks, loaded_masks)
+            ) and len(masks) == len(loaded_masks)
+
+            timings[f"{name} key"] = _best_time(
+                lambda: InferenceCache.key(image, model="benchmark"), repeats
+            )
+            timings[f"{name} memory"] = _best_time(
+                lambda: memory_cache.get(key), repeats
+            )
+            timings[f"{name} disk"] = _best_time(lambda: disk_cache.get(key), repeats)
+            print(
+                f"{name}: {len(contours)} particles, "
+                f"key {timings[f'{name} key'] * 1000:.2f} ms, "
+                f"memory {timings[f'{name} memory'] * 1000:.3f} ms, "
+                f"disk {timings[f'{name} disk'] * 1000:.2f} ms"
+            )
+    return timings
+
+
+def _with_info_bar(image: np.ndarray, bar_length: int, text: str):
+    """Снимок с синтетической информационной панелью и рамки ее элементов"""
+    height, width = image.shape[:2]
+    panel = np.full((70, width, 3), 20, dtype=np.uint8)
+    cv2.putText(
+        panel,
+        "HV 10.0kV WD 5.1mm",
+        (20, 40),
+        cv2.FONT_HERSHEY_SIMPLEX,
+        0.8,
+        (255, 255, 255),
+        2,
+    )
+    x = width - bar_length - 40
+    cv2.rectangle(panel, (x, 45), (x + bar_length - 1, 52), (255, 255, 255), -1)
+    cv2.putText(panel, text, (x, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
+    boxes = {
+        "info_bar": np.array([0, height, width, height + 70]),
+        "scale_bar": np.array([x - 2, height + 43, x + bar_length + 2, height + 55]),
+        "scale_text": np.array([x - 3, height + 8, x + 90, height + 36]),
+    }
+    return np.vstack([image, panel]), boxes
+
+
+def benchmark_scale_templates(image_dir: str = EXAMPLE_DIR, repeats: int = 3):
+    """
+    Поиск шкалы по шаблону панели: время сопоставления для известной
+    подписи (без модели и OCR) и для новой подписи (без модели, длина
+    шкалы измеряется по строкам шкалы; должна совпадать с нарисованной).
+    """
+    from particleanalyzer.core.ScaleTemplates import ScaleTemplates
+
+    timings = {}
+    for name, image in load_example_images(image_dir).items():
+        templates = ScaleTemplates()
+        learned, boxes = _with_info_bar(image, image.shape[1] // 6, "500nm")
+        templates.learn(learned, boxes, "500nm")
+
+        bar_length = image.shape[1] // 4
+        same, _ = _with_info_bar(image, image.shape[1] // 6, "500nm")
+        other, _ = _with_info_bar(image, bar_length, "1um")
+        known = templates.match(same)
+        assert known is not None and known["text"] == "500nm"
+        new = templates.match(other)
+        assert new is not None and new["text"] is None
+        x1, _, x2, _ = new["boxes"]["scale_bar"]
+        assert x2 - x1 == bar_length, (x2 - x1, bar_length)
+        # Окно OCR новой подписи содержит ее начало
+        text_x1, _, text_x2, _ = new["boxes"]["scale_text"]
+        assert text_x1 <= x1 < text_x2
+
+        timings[f"{name} known"] = _best_time(lambda: templates.match(same), repeats)
+        timings[f"{name} new"] = _best_time(lambda: templates.match(other), repeats)
+        print(
+            f"{name}: known caption {timings[f'{name} known'] * 1000:.2f} ms, "
+            f"new caption {timings[f'{name} new'] * 1000:.2f} ms "
+            f"(bar {x2 - x1} px)"
+        )
+    return timings
+
+
+BENCHMARKS = {
+    "feret": benchmark_feret,
+    "measurement": benchmark_measurement,
+    "diameter": benchmark_diameter,
+    "intensity": benchmark_intensity,
+    "render": benchmark_render,
+    "parallel": benchmark_parallel,
+    "rfdetr_postprocess": benchmark_rfdetr_postprocess,
+    "yolo_masks": benchmark_yolo_masks,
+    "annotations": benchmark_annotations,
+    "detectron_predictor": benchmark_detectron_predictor,
+    "model_startup": benchmark_model_startup,
+    "yolo_batch": benchmark_yolo_batch,
+    "onnx_session": benchmark_onnx_session,
+    "onnx_batch": benchmark_onnx_batch,
+    "quantization": benchmark_quantization,
+    "yolo_onnx": benchmark_yolo_onnx,
+    "scheduler": benchmark_scheduler,
+    "tiled": benchmark_tiled,
+    "tile_merge": benchmark_tile_merge,
+    "inference_cache": benchmark_inference_cache,
+    "scale_templates": benchmark_scale_templates,
+}
@@ -5,6 +5,7 @@ from particleanalyzer.core.ParticleAnalyzer import ParticleAnalyzer
 from particleanalyzer.core.utils import (
     scale_input_visibility,
     sahi_mode_visibility,
+    detection_controls_state,
     reset_interface,
     reset_interface2,
     log_analytics,
@@ -15,10 +16,10 @@ from particleanalyzer.core.utils import (
     toggleTheme,
     translate_chatbot,
     statistic_an,
+    redraw_particles,
     select_particle_from_image,
     particle_removal,
     reset_selection,
-    sahi_row_visibility,
 )
 from particleanalyzer.core.about import about_ru
 from particleanalyzer.core.parameter_information import reference_ru
@@ -41,12 +42,13 @@ except ImportError:
 
 def get_available_models():
     yolo_models = list(YOLOLoader.MODEL_MAPPING.keys())
-    rfdetr_models = list(ONNXLoader.MODEL_MAPPING.keys())
+    # ONNX-модели не требуют torch и доступны без Detectron2
+    onnx_models = [
+        name for name in ONNXLoader.MODEL_MAPPING if ONNXLoader.is_available(name)
+    ]
     if not DETECTRON2_AVAILABLE:
-        return yolo_models[:-1]
-    return (
-        yolo_models[:-1] + rfdetr_models + list(Detectron2Loader.MODEL_MAPPING.keys())
-    )
+        return yolo_models[:-1] + onnx_models
+    return yolo_models[:-1] + onnx_models + list(Detectron2Loader.MODEL_MAPPING.keys())
 
 
 def assets_path(name: str):
@@ -65,8 +67,39 @@ my_theme = gr.Theme.load(f"{assets_path('')}/themes/theme_schema@0.0.1.json").se
 )
 
 
-def create_interface(api_key):
+def create_interface(
+    api_key,
+    measurement_workers=1,
+    measurement_backend="thread",
+    model_memory_budget=None,
+    preload_models=(),
+    onnx_options=None,
+    inference_batch_size=8,
+    inference_max_wait=0.015,
+    warmup=False,
+    inference_cache_size=256 * 2**20,
+    inference_cache_dir=None,
+):
     llm_amalysis = LLMAnalysis(api_key)
+    analyzer.measurement.workers = measurement_workers
+    analyzer.measurement.backend = measurement_backend
+    if onnx_options:
+        analyzer.model_manager.onnx_loader.configure(**onnx_options)
+    # Модели загружаются лениво; preload_models — загрузить сразу
+    analyzer.model_manager.set_memory_budget(model_memory_budget)
+    analyzer.model_manager.preload(preload_models)
+    # Пакетирование запросов пользователей, работающих одновременно
+    analyzer.scheduler.configure(inference_batch_size, inference_max_wait)
+    # Повторная обработка того же снимка без запуска модели
+    analyzer.inference_cache.configure(inference_cache_size, inference_cache_dir)
+    if warmup:
+        # Прогрев загруженных моделей (без preload — модели по умолчанию)
+        timings = analyzer.warmup(
+            analyzer.model_manager.loaded_models() or get_available_models()[:1]
+        )
+        print("Warm-up (first / steady):")
+        for name, timing in timings.items():
+            print(f"  {name:<36} {timing['first']:7.2f} s / {timing['steady']:7.2f} s")
 
     demo = gr.Blocks(
         theme=my_theme,
@@ -78,7 +111,7 @@ def create_interface(api_key):
 
     with demo:
         api_key = gr.State(True if api_key else False)
-        points_df = gr.State()
+        particle_results = gr.State()
         scale = gr.State()
         points_scale = gr.State()
 
@@ -391,7 +424,7 @@ def create_interface(api_key):
                                 step=0.01,
                                 label=i18n("Порог перекрытия (IoU)"),
                             )
-                    with gr.Group(elem_id="sahi-setting") as sahi_row:
+                    with gr.Group(elem_id="sahi-setting"):
                         gr.Markdown(
                             f"<h3 style='margin-left: 7px;'><i class='fas fa-puzzle-piece'></i> {i18n('Обработка с разбиением (SAHI)')}</h3>"
                         )
@@ -636,7 +669,7 @@ def create_interface(api_key):
             outputs=[
                 output_image,
                 output_table,
-                points_df,
+                particle_results,
                 output_plot,
                 vector_field,
                 output_table2,
@@ -658,7 +691,7 @@ def create_interface(api_key):
 
         output_image.select(
             select_particle_from_image,
-            inputs=[points_df, output_table],
+            inputs=[particle_results, output_table],
             outputs=[
                 output_table_image2,
                 output_table_image2_row,
@@ -671,7 +704,7 @@ def create_interface(api_key):
             particle_removal,
             inputs=[
                 output_table_image2,
-                points_df,
+                particle_results,
                 output_table,
                 round_value,
                 scale_selector,
@@ -679,7 +712,7 @@ def create_interface(api_key):
             outputs=[
                 output_table_image2_row,
                 reset_delete_buttons_row,
-                points_df,
+                particle_results,
                 output_table,
                 d_max_slider,
                 d_min_slider,
@@ -691,12 +724,12 @@ def create_interface(api_key):
                 I_slider,
             ],
             show_progress="hide",
-            show_progress_on=[points_df],
+            show_progress_on=[particle_results],
         ).success(
             fn=statistic_an,
             inputs=[
                 output_table,
-                points_df,
+                particle_results,
                 scale_selector,
                 round_value,
                 number_of_bins,
@@ -711,6 +744,10 @@ def create_interface(api_key):
                 in_image,
                 solution,
                 sahi_mode,
+                scale,
+                points_scale,
+                show_Feret_diametr,
+                show_Scale_bar,
                 outline_color,
                 show_fillPoly,
                 show_polylines,
@@ -744,7 +781,7 @@ def create_interface(api_key):
             fn=statistic_an,
             inputs=[
                 output_table,
-                points_df,
+                particle_results,
                 scale_selector,
                 round_value,
                 number_of_bins,
@@ -759,6 +796,10 @@ def create_interface(api_key):
                 in_image,
                 solution,
                 sahi_mode,
+                scale,
+                points_scale,
+                show_Feret_diametr,
+                show_Scale_bar,
                 outline_color,
                 show_fillPoly,
                 show_polylines,
@@ -769,6 +810,49 @@ def create_interface(api_key):
             outputs=[output_image, output_table2, output_plot, vector_field],
         )
 
+        # Параметры визуализации: только перерисовка сохраненных результатов
+        gr.on(
+            triggers=[
+                show_polylines.input,
+                outline_color.input,
+                show_fillPoly.input,
+                fill_type_color.input,
+                fill_color.input,
+                fill_alpha.release,
+                show_Feret_diametr.input,
+                show_Scale_bar.input,
+            ],
+            fn=redraw_particles,
+            inputs=[
+                output_table,
+                particle_results,
+                d_max_slider,
+                d_min_slider,
+                theta_max_slider,
+                theta_min_slider,
+                e_slider,
+                S_slider,
+                P_slider,
+                I_slider,
+                in_image,
+                solution,
+                sahi_mode,
+                scale_selector,
+                scale,
+                points_scale,
+                show_Feret_diametr,
+                show_Scale_bar,
+                outline_color,
+                show_fillPoly,
+                show_polylines,
+                fill_type_color,
+                fill_color,
+                fill_alpha,
+            ],
+            outputs=output_image,
+            show_progress="hidden",
+        )
+
         llm_start = llm_run.click(
             fn=llm_amalysis.analyze,
             inputs=[output_table, model_llm],
@@ -876,16 +960,16 @@ def create_interface(api_key):
 
         output_table.change(
             fn=save_data_to_csv,
-            inputs=[output_table, output_table2],
+            inputs=[output_table, output_table2, particle_results],
             outputs=download_output,
         )
 
-        model_change.change(
-            fn=sahi_row_visibility,
-            inputs=model_change,
-            outputs=[sahi_row, number_detections, confidence_iou],
+        gr.on(
+            triggers=[model_change.change, sahi_mode.change],
+            fn=detection_controls_state,
+            inputs=[model_change, sahi_mode],
+            outputs=[number_detections, confidence_iou],
             show_progress="hide",
-            show_progress_on=question_row,
         )
 
     return demo
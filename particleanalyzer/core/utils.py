@@ -8,8 +8,11 @@ from datetime import datetime
 from particleanalyzer.core.languages import translations
 from particleanalyzer.core.language_context import LanguageContext
 from particleanalyzer.core.ParticleAnalyzer import ParticleAnalyzer
+from particleanalyzer.core.ParticleResults import ParticleResults
 from particleanalyzer.core.StatisticsBuilder import StatisticsBuilder
 from particleanalyzer.core.ImagePreprocessor import ImagePreprocessor
+from particleanalyzer.core.PointManager import PointManager
+from particleanalyzer.core.ONNXLoader import ONNXLoader
 
 
 def assets_path(name: str):
@@ -109,6 +112,21 @@ def sahi_mode_visibility(sahi_mode):
     )
 
 
+def detection_controls_state(model_change, sahi_mode=False):
+    # RF-DETR (и его INT8-версия) не использует порог IoU, а число
+    # обнаружений ограничено его фиксированным числом запросов. При
+    # разбиении на фрагменты порог IoU задает склейку фрагментов и
+    # остается доступным для любой модели
+    adjustable = (
+        model_change not in ONNXLoader.MODEL_MAPPING
+        or model_change in ONNXLoader.EXPORTED_MODELS
+    )
+    return (
+        gr.update(interactive=adjustable),
+        gr.update(interactive=adjustable or bool(sahi_mode)),
+    )
+
+
 def reset_interface():
     """Функция для сброса интерфейса"""
     global selected_particles
@@ -161,9 +179,12 @@ def scale_input_unit_measurement(scale_selector, request: gr.Request):
 
 
 def save_data_to_csv(
-    data_table: pd.DataFrame, data_table2: pd.DataFrame, output_dir: str = "output"
+    data_table: pd.DataFrame,
+    data_table2: pd.DataFrame,
+    results: ParticleResults = None,
+    output_dir: str = "output",
 ):
-    """Сохраняет данные частиц в CSV файлы"""
+    """Сохраняет данные частиц в CSV файлы и маски в COCO JSON"""
     os.makedirs(output_dir, exist_ok=True)
     particle_path = os.path.join(output_dir, "particle_characteristics.csv")
     stats_path = os.path.join(output_dir, "particle_statistics.csv")
@@ -171,7 +192,12 @@ def save_data_to_csv(
     data_table.to_csv(particle_path, index=False, encoding="utf-8-sig")
     data_table2.to_csv(stats_path, index=False, encoding="utf-8-sig")
 
-    return [particle_path, stats_path]
+    paths = [particle_path, stats_path]
+    if results is not None and results.annotations:
+        annotations_path = os.path.join(output_dir, "particle_annotations.json")
+        results.annotations.save_coco(annotations_path, numbers=results.numbers)
+        paths.append(annotations_path)
+    return paths
 
 
 def log_analytics(
@@ -224,12 +250,8 @@ def chatbot_visibility():
     return gr.update(visible=True)
 
 
-def statistic_an(
+def filter_table(
     df: pd.DataFrame,
-    points_df: pd.DataFrame,
-    scale_selector: int,
-    round_value: int,
-    number_of_bins: int,
     d_max_slider,
     d_min_slider,
     theta_max_slider,
@@ -238,25 +260,8 @@ def statistic_an(
     S_slider,
     P_slider,
     I_slider,
-    image2: np.ndarray,
-    solution,
-    sahi_mode,
-    outline_color,
-    show_fillPoly,
-    show_polylines,
-    fill_type_color,
-    fill_color,
-    fill_alpha,
-):
-
-    lang = LanguageContext.get_language()
-    scale_config = ParticleAnalyzer.SCALE_OPTIONS[scale_selector]
-    selected_image = image2
-    selected_image = cv2.cvtColor(selected_image, cv2.COLOR_RGB2BGR)
-    selected_image, scale_factor_glob = ImagePreprocessor.resize_image(
-        selected_image, solution, sahi_mode
-    )
-
+) -> pd.DataFrame:
+    """Строки таблицы частиц в пределах ползунков фильтрации"""
     d_max_min, d_max_max = d_max_slider
     d_min_min, d_min_max = d_min_slider
     theta_max_min, theta_max_max = theta_max_slider
@@ -266,7 +271,7 @@ def statistic_an(
     P_min, P_max = P_slider
     I_min, I_max = I_slider
 
-    filtered_df = df[
+    return df[
         (df.iloc[:, 2] >= d_max_min)
         & (df.iloc[:, 2] <= d_max_max)
         & (df.iloc[:, 3] >= d_min_min)
@@ -285,7 +290,100 @@ def statistic_an(
         & (df.iloc[:, 10] <= I_max)
     ].copy()
 
-    filtered_points_df = points_df.loc[filtered_df.index].copy()
+
+def render_overlay(
+    image2: np.ndarray,
+    results: ParticleResults,
+    solution,
+    sahi_mode,
+    scale_selector,
+    scale,
+    points_scale,
+    show_Feret_diametr,
+    show_Scale_bar,
+    outline_color,
+    show_fillPoly,
+    show_polylines,
+    fill_type_color,
+    fill_color,
+    fill_alpha,
+):
+    """Разметка частиц (RGB) по сохраненным результатам, без анализа"""
+    image = cv2.cvtColor(image2, cv2.COLOR_RGB2BGR)
+    image, scale_factor_glob = ImagePreprocessor.resize_image(
+        image, solution, sahi_mode
+    )
+    ParticleAnalyzer.render_results(
+        image,
+        results,
+        show_Feret_diametr=show_Feret_diametr,
+        outline_color=outline_color,
+        show_fillPoly=show_fillPoly,
+        show_polylines=show_polylines,
+        fill_type_color=fill_type_color,
+        fill_color=fill_color,
+        fill_alpha=fill_alpha,
+    )
+    image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    if (
+        ParticleAnalyzer.SCALE_OPTIONS[scale_selector]["scale"]
+        and show_Scale_bar
+        and points_scale
+    ):
+        image = PointManager().draw_scale_on_image(
+            image, scale_factor_glob, scale, *points_scale
+        )
+    return image
+
+
+def statistic_an(
+    df: pd.DataFrame,
+    results: ParticleResults,
+    scale_selector: int,
+    round_value: int,
+    number_of_bins: int,
+    d_max_slider,
+    d_min_slider,
+    theta_max_slider,
+    theta_min_slider,
+    e_slider,
+    S_slider,
+    P_slider,
+    I_slider,
+    image2: np.ndarray,
+    solution,
+    sahi_mode,
+    scale,
+    points_scale,
+    show_Feret_diametr,
+    show_Scale_bar,
+    outline_color,
+    show_fillPoly,
+    show_polylines,
+    fill_type_color,
+    fill_color,
+    fill_alpha,
+):
+
+    lang = LanguageContext.get_language()
+    scale_config = ParticleAnalyzer.SCALE_OPTIONS[scale_selector]
+    selected_image = cv2.cvtColor(image2, cv2.COLOR_RGB2BGR)
+    selected_image, _ = ImagePreprocessor.resize_image(
+        selected_image, solution, sahi_mode
+    )
+
+    filtered_df = filter_table(
+        df,
+        d_max_slider,
+        d_min_slider,
+        theta_max_slider,
+        theta_min_slider,
+        e_slider,
+        S_slider,
+        P_slider,
+        I_slider,
+    )
+    filtered_results = results.select(filtered_df["№"].astype(int))
 
     builder = StatisticsBuilder(
         filtered_df,
@@ -297,91 +395,133 @@ def statistic_an(
     stats_df = builder.build_stats_table()
     fig, vector_fig = builder.build_distribution_fig(selected_image)
 
-    thickness = ParticleAnalyzer._get_scaled_thickness(
-        selected_image.shape[1], selected_image.shape[0]
+    output_image = render_overlay(
+        image2,
+        filtered_results,
+        solution,
+        sahi_mode,
+        scale_selector,
+        scale,
+        points_scale,
+        show_Feret_diametr,
+        show_Scale_bar,
+        outline_color,
+        show_fillPoly,
+        show_polylines,
+        fill_type_color,
+        fill_color,
+        fill_alpha,
     )
 
-    points_arrays = [
-        np.array(p, dtype=np.int32).reshape((-1, 1, 2))
-        for p in filtered_points_df.iloc[:, -1]
-        if p and len(p) > 0
-    ]
-
-    if points_arrays:
-        if show_fillPoly:
-            overlay = selected_image.copy()
-            for contour in points_arrays:
-                cv2.fillPoly(
-                    overlay,
-                    [contour],
-                    (
-                        ParticleAnalyzer.get_random_color()
-                        if fill_type_color == "Random"
-                        else ParticleAnalyzer.rgba_to_bgr(fill_color)
-                    ),
-                )
-            alpha = fill_alpha
-            cv2.addWeighted(
-                overlay, alpha, selected_image, 1 - alpha, 0, selected_image
-            )
-        if show_polylines:
-            cv2.polylines(
-                selected_image,
-                points_arrays,
-                isClosed=True,
-                color=ParticleAnalyzer.rgba_to_bgr(outline_color),
-                thickness=thickness,
-            )
-    selected_image = cv2.cvtColor(selected_image, cv2.COLOR_BGR2RGB)
-
     return (
-        selected_image,
+        output_image,
         stats_df,
         fig,
         vector_fig,
     )
 
 
+def redraw_particles(
+    df: pd.DataFrame,
+    results: ParticleResults,
+    d_max_slider,
+    d_min_slider,
+    theta_max_slider,
+    theta_min_slider,
+    e_slider,
+    S_slider,
+    P_slider,
+    I_slider,
+    image2: np.ndarray,
+    solution,
+    sahi_mode,
+    scale_selector,
+    scale,
+    points_scale,
+    show_Feret_diametr,
+    show_Scale_bar,
+    outline_color,
+    show_fillPoly,
+    show_polylines,
+    fill_type_color,
+    fill_color,
+    fill_alpha,
+):
+    """
+    Перерисовка разметки при смене параметров визуализации: сохраненные
+    контуры, углы и центры частиц с учетом фильтров, без модели и
+    повторного измерения.
+    """
+    if results is None or df is None or image2 is None:
+        return gr.skip()
+    filtered_df = filter_table(
+        df,
+        d_max_slider,
+        d_min_slider,
+        theta_max_slider,
+        theta_min_slider,
+        e_slider,
+        S_slider,
+        P_slider,
+        I_slider,
+    )
+    return render_overlay(
+        image2,
+        results.select(filtered_df["№"].astype(int)),
+        solution,
+        sahi_mode,
+        scale_selector,
+        scale,
+        points_scale,
+        show_Feret_diametr,
+        show_Scale_bar,
+        outline_color,
+        show_fillPoly,
+        show_polylines,
+        fill_type_color,
+        fill_color,
+        fill_alpha,
+    )
+
+
 selected_particles = []  # Глобальный список для хранения выбранных частиц
 
 
-def select_particle_from_image(points_df, output_table, evt: gr.SelectData):
+def select_particle_from_image(results, output_table, evt: gr.SelectData):
     global selected_particles
     target_point = (evt.index[0], evt.index[1])
 
-    matching_contours = []
-    already_selected = False
-
-    for selected_idx in selected_particles:
-        contour_points = points_df.loc[selected_idx, "points"]
-        if contour_points and len(contour_points) >= 3:
-            contour = np.array(contour_points, dtype=np.int32).reshape((-1, 1, 2))
+    for position in selected_particles:
+        contour = results.contour(position)
+        if len(contour) >= 3:
             if cv2.pointPolygonTest(contour, target_point, measureDist=False) >= 0:
-                already_selected = True
-                break
+                return gr.skip(), gr.skip(), gr.skip()
 
-    if already_selected:
-        return gr.skip(), gr.skip(), gr.skip()
-
-    for idx, contour_points in points_df["points"].items():
-        if not contour_points or len(contour_points) < 3:
-            continue
-
-        contour = np.array(contour_points, dtype=np.int32).reshape((-1, 1, 2))
-        distance = cv2.pointPolygonTest(contour, target_point, measureDist=False)
+    # Быстрый путь: номер частицы под курсором из изображения меток
+    matching_contours = []
+    label_image = results.label_image
+    x, y = target_point
+    if label_image is not None:
+        if 0 <= y < label_image.shape[0] and 0 <= x < label_image.shape[1]:
+            matching_contours = [
+                position
+                for position in results.positions([label_image[y, x]])
+                if position not in selected_particles
+            ]
 
-        if distance >= 0 and idx not in selected_particles:
-            matching_contours.append(idx)
+    if not matching_contours:
+        for position in range(len(results)):
+            contour = results.contour(position)
+            if len(contour) < 3 or position in selected_particles:
+                continue
+            if cv2.pointPolygonTest(contour, target_point, measureDist=False) >= 0:
+                matching_contours.append(position)
 
     if not matching_contours:
         return gr.skip(), gr.skip(), gr.skip()
 
     if len(matching_contours) > 1:
-        matching_contours.sort(
-            key=lambda x: cv2.contourArea(
-                np.array(points_df.loc[x, "points"]).reshape((-1, 1, 2))
-            )
-        )
+        matching_contours.sort(key=lambda x: cv2.contourArea(results.contour(x)))
     selected_particles.append(matching_contours[0])
 
     return (
@@ -402,7 +542,7 @@ def reset_selection(output_table_image2):
 
 
 def particle_removal(
-    output_table_image2, points_df, output_table, round_value, scale_selector
+    output_table_image2, results, output_table, round_value, scale_selector
 ):
     global selected_particles
     if not output_table_image2.empty and "№" in output_table_image2.columns:
@@ -416,7 +556,7 @@ def particle_removal(
                     drop=True
                 )
 
-                points_df = points_df.drop(rows_to_remove.index).reset_index(drop=True)
+                results = results.drop(numbers_to_remove)
                 selected_particles = []
         except (ValueError, KeyError) as e:
             print(f"Ошибка при удалении строк: {e}")
@@ -425,7 +565,7 @@ def particle_removal(
     return (
         gr.update(visible=False),
         gr.update(visible=False),
-        points_df,
+        results,
         output_table,
         gr.update(
             minimum=limits["d_max_min"],
@@ -474,10 +614,6 @@ def particle_removal(
     )
 
 
-def sahi_row_visibility(model_change):
-    return gr.update(visible=(model_change != "RF-DETR Seg (Preview)")), gr.update(interactive=(model_change != "RF-DETR Seg (Preview)")), gr.update(interactive=(model_change != "RF-DETR Seg (Preview)"))
-
-
 empty_df_ParticleCharacteristics = get_columns("Pixels").fillna("")
 empty_df_ParticleStatistics = get_stats_columns()
 
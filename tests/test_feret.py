@@ -0,0 +1,72 @@
+"""Диаметры Ферета и D по выпуклой оболочке против прямого перебора"""
+
+import numpy as np
+import pytest
+from scipy.spatial.distance import pdist
+
+from particleanalyzer.core.benchmarks import load_example_contours
+from particleanalyzer.core.FeretCalculator import FeretCalculator
+from particleanalyzer.core.ParticleMeasurement import ParticleMeasurement
+
+
+@pytest.fixture(scope="module")
+def packed():
+    points, offsets, _ = ParticleMeasurement.pack_contours(load_example_contours())
+    assert len(offsets) > 1
+    return points, offsets
+
+
+def _contours(points, offsets):
+    return [points[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+
+
+def _brute_force_feret(hull: np.ndarray):
+    """Dmax — самая далекая пара вершин; Dmin — наименьшая ширина по ребрам"""
+    hull = hull.astype(np.float64)
+    if len(hull) < 3:
+        return np.max(pdist(hull)) if len(hull) > 1 else 0.0, 0.0
+    widths = []
+    for i in range(len(hull)):
+        edge = hull[(i + 1) % len(hull)] - hull[i]
+        normal = np.array([-edge[1], edge[0]]) / np.hypot(*edge)
+        widths.append(np.ptp((hull - hull[i]) @ normal))
+    return np.max(pdist(hull)), min(widths)
+
+
+def _width(points: np.ndarray, angle: float) -> float:
+    """Протяженность точек вдоль направления angle (градусы)"""
+    theta = np.radians(angle)
+    return np.ptp(points @ np.array([np.cos(theta), np.sin(theta)]))
+
+
+@pytest.mark.parametrize("mode", FeretCalculator.MODES)
+def test_hull_diameter_matches_pdist(packed, mode):
+    points, offsets = packed
+    measurement = ParticleMeasurement(FeretCalculator(mode))
+    diameters = measurement.measure(points, offsets)["D"]
+    expected = [np.max(pdist(contour)) for contour in _contours(points, offsets)]
+    np.testing.assert_allclose(diameters, expected, rtol=0, atol=1e-9)
+
+
+def test_rotating_calipers_match_brute_force(packed):
+    points, offsets = packed
+    hulls, hull_offsets = FeretCalculator.convex_hulls(points, offsets)
+    feret_max, feret_min, _, angle_max, angle_min = FeretCalculator.rotating_calipers(
+        hulls, hull_offsets
+    )
+    expected_max, expected_min = zip(
+        *(_brute_force_feret(hull) for hull in _contours(hulls, hull_offsets))
+    )
+    np.testing.assert_allclose(feret_max, expected_max, rtol=0, atol=1e-9)
+    np.testing.assert_allclose(feret_min, expected_min, rtol=0, atol=1e-6)
+
+    # Углы задают направления, вдоль которых достигаются Dmax и Dmin
+    for hull, d_max, d_min, a_max, a_min in zip(
+        _contours(hulls.astype(np.float64), hull_offsets),
+        feret_max,
+        feret_min,
+        angle_max,
+        angle_min,
+    ):
+        assert _width(hull, a_max) == pytest.approx(d_max, abs=1e-6)
+        assert _width(hull, a_min) == pytest.approx(d_min, abs=1e-6)
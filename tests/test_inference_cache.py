@@ -0,0 +1,130 @@
+"""Кэш обнаружений: вытеснение по объему, запись на диск и его очистка"""
+
+import os
+
+import numpy as np
+import pytest
+
+from particleanalyzer.core.InferenceCache import InferenceCache
+from particleanalyzer.core.MaskTile import MaskTile
+
+
+def _entry(seed: int, particles: int = 3):
+    """Контуры, маски (фрагменты и одна полная) и изображения"""
+    rng = np.random.default_rng(seed)
+    contours = [
+        rng.integers(0, 64, (int(rng.integers(3, 20)), 2), dtype=np.int32)
+        for _ in range(particles)
+    ]
+    masks = [
+        MaskTile(rng.random((5 + i, 7 + i)) > 0.5, i, 2 * i, (64, 80))
+        for i in range(particles - 1)
+    ]
+    masks.append(rng.random((64, 80)) > 0.5)
+    images = {"prepared": rng.integers(0, 255, (64, 80, 3), dtype=np.uint8)}
+    return contours, masks, images
+
+
+def _size(entry) -> int:
+    return InferenceCache._entry_size((*entry, {}))
+
+
+def test_disabled_cache():
+    cache = InferenceCache(max_bytes=0)
+    cache.put("key", *_entry(0))
+    assert not cache.enabled and cache.get("key") is None and len(cache) == 0
+
+
+def test_memory_eviction_follows_lru_within_budget():
+    entries = [_entry(seed) for seed in range(3)]
+    sizes = [_size(entry) for entry in entries]
+    cache = InferenceCache(max_bytes=sizes[0] + sizes[1] + sizes[2] - 1)
+    cache.put("a", *entries[0])
+    cache.put("b", *entries[1])
+    # Обращение делает запись "a" самой новой: вытесняется "b"
+    assert cache.get("a") is not None
+    cache.put("c", *entries[2])
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.used_bytes == sizes[0] + sizes[2] <= cache.max_bytes
+
+    # Повторная запись по тому же ключу не учитывается дважды
+    cache.put("c", *entries[2])
+    assert cache.used_bytes == sizes[0] + sizes[2]
+
+    cache.configure(max_bytes=sizes[2])
+    assert len(cache) == 1 and cache.get("c") is not None
+    assert cache.used_bytes == sizes[2]
+    cache.clear()
+    assert len(cache) == 0 and cache.used_bytes == 0
+
+
+def test_entry_larger_than_budget_is_not_kept():
+    entry = _entry(0)
+    cache = InferenceCache(max_bytes=_size(entry) - 1)
+    cache.put("a", *entry)
+    assert len(cache) == 0 and cache.used_bytes == 0
+
+
+def test_disk_round_trip(tmp_path):
+    contours, masks, images = _entry(0)
+    InferenceCache(max_bytes=0, directory=str(tmp_path)).put(
+        "key", contours, masks, images, {"limit_reached": True}
+    )
+    # Новый экземпляр: запись читается только с диска
+    cache = InferenceCache(max_bytes=0, directory=str(tmp_path))
+    loaded_contours, loaded_masks, loaded_images, info = cache.get("key")
+
+    assert info == {"limit_reached": True}
+    assert len(loaded_contours) == len(contours)
+    for loaded, contour in zip(loaded_contours, contours):
+        np.testing.assert_array_equal(loaded, contour)
+    assert len(loaded_masks) == len(masks)
+    for loaded, mask in zip(loaded_masks, masks):
+        if not isinstance(mask, MaskTile):
+            # Полная маска возвращается фрагментом на весь кадр
+            mask = MaskTile(mask, 0, 0, mask.shape)
+        np.testing.assert_array_equal(loaded.mask, mask.mask)
+        assert loaded.bbox == mask.bbox and loaded.image_shape == mask.image_shape
+    assert loaded_images.keys() == images.keys()
+    np.testing.assert_array_equal(loaded_images["prepared"], images["prepared"])
+    assert cache.get("missing") is None
+
+
+def test_key_depends_on_pixels_and_params():
+    image = np.zeros((8, 8, 3), dtype=np.uint8)
+    changed = image.copy()
+    changed[0, 0, 0] = 1
+    key = InferenceCache.key(image, model="a", confidence=0.5)
+    assert key == InferenceCache.key(image.copy(), confidence=0.5, model="a")
+    assert key != InferenceCache.key(changed, model="a", confidence=0.5)
+    assert key != InferenceCache.key(image, model="a", confidence=0.6)
+
+
+@pytest.fixture
+def disk_cache(tmp_path):
+    """Три записи на диске с временем использования 1, 2, 3"""
+    cache = InferenceCache(max_bytes=0, directory=str(tmp_path))
+    for index, key in enumerate("abc"):
+        cache.put(key, *_entry(index))
+        os.utime(cache._path(key), (index + 1, index + 1))
+    return cache
+
+
+def test_trim_disk_removes_least_recently_used(disk_cache):
+    sizes = {key: os.path.getsize(disk_cache._path(key)) for key in "abc"}
+    disk_cache.max_disk_bytes = sizes["b"] + sizes["c"]
+    disk_cache._trim_disk()
+    assert not os.path.exists(disk_cache._path("a"))
+    assert os.path.exists(disk_cache._path("b"))
+    assert os.path.exists(disk_cache._path("c"))
+
+
+def test_trim_disk_respects_reads(disk_cache):
+    # Чтение с диска отмечает использование: "a" становится самой новой
+    assert disk_cache.get("a") is not None
+    disk_cache.max_disk_bytes = 1
+    disk_cache._trim_disk()
+    remaining = [key for key in "abc" if os.path.exists(disk_cache._path(key))]
+    # Последний использованный файл остается даже сверх ограничения
+    assert remaining == ["a"]
@@ -0,0 +1,155 @@
+"""Микропакетирование запросов в InferenceScheduler"""
+
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from particleanalyzer.core.InferenceScheduler import InferenceScheduler
+
+
+class _OnnxLoader:
+    MODEL_MAPPING = {"onnx": "model.onnx"}
+
+
+class _ModelManager:
+    """Модель возвращает среднее изображения; fail=True — ошибка прохода"""
+
+    onnx_loader = _OnnxLoader()
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.calls = []
+        self.running = 0
+        self.max_running = 0
+        self._lock = threading.Lock()
+
+    def predict_batch(self, model_name, images, batch_size=8, **kwargs):
+        with self._lock:
+            self.calls.append((model_name, len(images), kwargs))
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        try:
+            time.sleep(self.delay)
+            if kwargs.get("fail"):
+                raise RuntimeError("boom")
+            return [float(image.mean()) for image in images]
+        finally:
+            with self._lock:
+                self.running -= 1
+
+
+def _submit_together(scheduler, requests, timeout=10):
+    """
+    Одновременные запросы (model_name, значение, kwargs) из отдельных
+    потоков; результат или исключение каждого запроса
+    """
+    barrier = threading.Barrier(len(requests))
+    outcomes = [None] * len(requests)
+
+    def worker(index, model_name, value, kwargs):
+        barrier.wait()
+        image = np.full((4, 4), value, dtype=np.float32)
+        try:
+            outcomes[index] = scheduler.predict(model_name, image, **kwargs)
+        except Exception as e:
+            outcomes[index] = e
+
+    threads = [
+        threading.Thread(target=worker, args=(index, *request), daemon=True)
+        for index, request in enumerate(requests)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout)
+    assert not any(thread.is_alive() for thread in threads), "запрос завис"
+    return outcomes
+
+
+def test_concurrent_requests_share_one_forward_pass():
+    manager = _ModelManager()
+    # Долгое окно: пакет запускается, когда наберется max_batch_size
+    scheduler = InferenceScheduler(manager, max_batch_size=6, max_wait=5)
+    outcomes = _submit_together(
+        scheduler, [("yolo", value, {"conf": 0.5}) for value in range(6)]
+    )
+    assert outcomes == [float(value) for value in range(6)]
+    assert manager.calls == [("yolo", 6, {"conf": 0.5})]
+
+
+def test_window_closes_after_max_wait():
+    manager = _ModelManager()
+    scheduler = InferenceScheduler(manager, max_batch_size=8, max_wait=0.05)
+    outcomes = _submit_together(scheduler, [("yolo", value, {}) for value in range(3)])
+    assert outcomes == [0.0, 1.0, 2.0]
+    assert sum(count for _, count, _ in manager.calls) == 3
+
+
+def test_different_parameters_are_not_batched_together():
+    manager = _ModelManager()
+    scheduler = InferenceScheduler(manager, max_batch_size=2, max_wait=5)
+    outcomes = _submit_together(
+        scheduler,
+        [("yolo", 1, {"conf": 0.5}), ("yolo", 2, {"conf": 0.3})]
+        + [("yolo", 3, {"conf": 0.5}), ("yolo", 4, {"conf": 0.3})],
+    )
+    assert outcomes == [1.0, 2.0, 3.0, 4.0]
+    assert sorted((count, kwargs["conf"]) for _, count, kwargs in manager.calls) == [
+        (2, 0.3),
+        (2, 0.5),
+    ]
+
+
+def test_batch_error_reaches_every_caller():
+    manager = _ModelManager(delay=0.05)
+    scheduler = InferenceScheduler(manager, max_batch_size=3, max_wait=5)
+    outcomes = _submit_together(
+        scheduler, [("yolo", value, {"fail": True}) for value in range(3)]
+    )
+    assert len(manager.calls) == 1
+    assert all(isinstance(outcome, RuntimeError) for outcome in outcomes)
+    # После ошибки модель снова принимает запросы
+    scheduler.configure(max_batch_size=1)
+    assert scheduler.predict("yolo", np.ones((2, 2))) == 1.0
+
+
+def test_error_does_not_block_other_batches():
+    manager = _ModelManager(delay=0.05)
+    scheduler = InferenceScheduler(manager, max_batch_size=2, max_wait=5)
+    outcomes = _submit_together(
+        scheduler,
+        [("yolo", 1, {"fail": True}), ("yolo", 2, {"fail": True})]
+        + [("yolo", 3, {}), ("yolo", 4, {})],
+    )
+    assert isinstance(outcomes[0], RuntimeError)
+    assert isinstance(outcomes[1], RuntimeError)
+    assert outcomes[2:] == [3.0, 4.0]
+
+
+def test_forward_passes_of_one_model_run_one_at_a_time():
+    manager = _ModelManager(delay=0.05)
+    scheduler = InferenceScheduler(manager, max_batch_size=2, max_wait=5)
+    # Четыре пакета с разными параметрами — разные окна одной модели
+    _submit_together(
+        scheduler,
+        [("yolo", value, {"conf": value // 2}) for value in range(8)],
+    )
+    assert len(manager.calls) == 4 and manager.max_running == 1
+
+
+def test_disabled_scheduler_runs_each_request_alone():
+    manager = _ModelManager()
+    scheduler = InferenceScheduler(manager, max_batch_size=1)
+    assert not scheduler.enabled
+    outcomes = _submit_together(scheduler, [("onnx", value, {}) for value in range(3)])
+    assert outcomes == [0.0, 1.0, 2.0]
+    assert [count for _, count, _ in manager.calls] == [1, 1, 1]
+
+
+def test_invalid_settings():
+    with pytest.raises(ValueError):
+        InferenceScheduler(_ModelManager(), max_batch_size=0)
+    with pytest.raises(ValueError):
+        InferenceScheduler(_ModelManager(), max_wait=-1)
@@ -0,0 +1,45 @@
+"""Контуры фрагментов масок против полноразмерных масок ultralytics"""
+
+import cv2
+import numpy as np
+import pytest
+
+from particleanalyzer.core.MaskTile import MaskTile
+
+
+def _two_part_mask(shape=(120, 160)):
+    """Маска из крупной и мелкой частей (как у частицы с отколотым краем)"""
+    full = np.zeros(shape, dtype=np.uint8)
+    cv2.circle(full, (60, 50), 25, 1, -1)
+    cv2.rectangle(full, (95, 70), (110, 90), 1, -1)
+    return full.astype(bool)
+
+
+def _tile(full):
+    ys, xs = np.nonzero(full)
+    x1, y1, x2, y2 = xs.min() - 2, ys.min() - 2, xs.max() + 3, ys.max() + 3
+    return MaskTile(full[y1:y2, x1:x2], x1, y1, full.shape)
+
+
+def test_main_contour_keeps_largest_part():
+    full = _two_part_mask()
+    contour = _tile(full).main_contour()
+    assert cv2.pointPolygonTest(contour.reshape(-1, 1, 2), (60, 50), False) > 0
+    assert cv2.pointPolygonTest(contour.reshape(-1, 1, 2), (102, 80), False) < 0
+
+
+def test_merged_contour_matches_masks_xy():
+    pytest.importorskip("ultralytics")
+    from ultralytics.utils.ops import masks2segments
+
+    full = _two_part_mask()
+    (expected,) = masks2segments(full[None].astype(np.uint8), strategy="all")
+    np.testing.assert_array_equal(_tile(full).merged_contour(), expected)
+
+
+def test_merged_contour_of_single_part():
+    full = np.zeros((50, 50), dtype=bool)
+    full[10:20, 15:30] = True
+    tile = _tile(full)
+    np.testing.assert_array_equal(tile.merged_contour(), tile.main_contour())
+    assert MaskTile(np.zeros((3, 3), dtype=bool), 0, 0, (5, 5)).merged_contour() is None
@@ -0,0 +1,64 @@
+"""Проверка точности INT8-модели в ONNXQuantizer"""
+
+import numpy as np
+import pytest
+
+from particleanalyzer.core.MaskTile import MaskTile
+from particleanalyzer.core.ONNXQuantizer import ONNXQuantizer
+
+
+class _Detections:
+    def __init__(self, tiles):
+        self.data = {"mask_tiles": tiles}
+
+
+class _Loader:
+    """Загрузчик с заранее заданными масками для каждой модели"""
+
+    def __init__(self, tiles):
+        self.tiles = tiles
+
+    def predict_batch(self, name, images, confidence_threshold):
+        return [_Detections(self.tiles[name]) for _ in images]
+
+
+def _square(size):
+    return MaskTile(np.ones((size, size), dtype=bool), 0, 0, (64, 64))
+
+
+@pytest.mark.parametrize(
+    "reference, candidate, empty",
+    [([], [_square(10)], "fp32"), ([_square(10)], [], "int8"), ([], [], "fp32")],
+)
+def test_empty_diameters_fail_gate(reference, candidate, empty):
+    quantizer = ONNXQuantizer(_Loader({"fp32": reference, "int8": candidate}))
+    report = quantizer.evaluate("fp32", "int8", [np.zeros((64, 64, 3), np.uint8)])
+    assert not report["passed"]
+    assert report["ks_statistic"] is None and report["median_drift"] is None
+    assert f"модель {empty} не нашла частиц" in report["reason"]
+
+
+def test_equal_diameters_pass_gate():
+    tiles = [_square(10), _square(20)]
+    quantizer = ONNXQuantizer(_Loader({"fp32": tiles, "int8": tiles}))
+    report = quantizer.evaluate("fp32", "int8", [np.zeros((64, 64, 3), np.uint8)])
+    assert report["passed"] and report["reason"] is None
+    assert report["ks_statistic"] == 0 and report["median_drift"] == 0
+
+
+def test_split_images_keeps_calibration_and_validation_apart():
+    images = [np.full((4, 4, 3), i, np.uint8) for i in range(5)]
+    calibration, validation = ONNXQuantizer.split_images(images)
+    assert [int(i[0, 0, 0]) for i in calibration] == [0, 2, 4]
+    assert [int(i[0, 0, 0]) for i in validation] == [1, 3]
+
+
+def test_gate_needs_images_outside_calibration():
+    pytest.importorskip("onnxruntime")
+    quantizer = ONNXQuantizer(_Loader({}))
+    with pytest.raises(ValueError, match="не входящие в калибровку"):
+        quantizer.quantize(images=[np.zeros((64, 64, 3), np.uint8)])
+    with pytest.raises(ValueError, match="не входящие в калибровку"):
+        quantizer.quantize(
+            images=[np.zeros((64, 64, 3), np.uint8)] * 3, validation_images=[]
+        )
@@ -0,0 +1,51 @@
+"""Параллельное измерение частей контуров против последовательного"""
+
+import numpy as np
+import pytest
+
+from particleanalyzer.core.benchmarks import load_example_contours
+from particleanalyzer.core.ParticleMeasurement import ParticleMeasurement
+
+
+@pytest.fixture(scope="module")
+def packed():
+    points, offsets, _ = ParticleMeasurement.pack_contours(load_example_contours() * 4)
+    assert len(offsets) > 1
+    return points, offsets
+
+
+def test_split_shards_cover_all_contours_in_order(packed):
+    _, offsets = packed
+    shards = ParticleMeasurement.split_shards(offsets, 7)
+    assert shards[0][0] == 0 and shards[-1][1] == len(offsets) - 1
+    assert all(a[1] == b[0] for a, b in zip(shards[:-1], shards[1:]))
+    assert all(last > first for first, last in shards)
+
+
+@pytest.mark.parametrize("backend", ParticleMeasurement.BACKENDS)
+def test_parallel_matches_serial(packed, backend):
+    points, offsets = packed
+    expected = ParticleMeasurement().measure(points, offsets)
+    measurement = ParticleMeasurement(
+        workers=2, backend=backend, min_parallel_particles=1
+    )
+    try:
+        result = measurement.measure(points, offsets)
+    finally:
+        measurement.close()
+    for column in ParticleMeasurement.COLUMNS:
+        # Эксцентриситет (fitEllipse) зависит от выравнивания входа
+        if column != "eccentricity":
+            np.testing.assert_array_equal(result[column], expected[column])
+
+
+def test_small_inputs_are_measured_serially(packed):
+    points, offsets = packed
+    measurement = ParticleMeasurement(workers=2, min_parallel_particles=len(offsets))
+    measurement.measure(points, offsets)
+    assert measurement._executor is None
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        ParticleMeasurement(backend="gpu")
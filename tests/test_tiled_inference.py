@@ -0,0 +1,123 @@
+"""Слияние частиц из фрагментов: сетка соседей, швы и NMS по маскам"""
+
+import cv2
+import numpy as np
+import pytest
+
+from particleanalyzer.core.MaskTile import MaskTile
+from particleanalyzer.core.TiledInference import (
+    TiledInference,
+    _overlapping_pairs,
+    mask_nms,
+)
+
+
+def _brute_force_pairs(boxes):
+    pairs = []
+    for i in range(len(boxes)):
+        for j in range(i + 1, len(boxes)):
+            if min(boxes[i, 2], boxes[j, 2]) > max(boxes[i, 0], boxes[j, 0]) and min(
+                boxes[i, 3], boxes[j, 3]
+            ) > max(boxes[i, 1], boxes[j, 1]):
+                pairs.append((i, j))
+    return pairs
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_grid_pairs_match_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    count = 400
+    corners = rng.integers(0, 1000, (count, 2))
+    # Мелкие рамки, несколько крупных через много ячеек и повторы
+    sizes = rng.integers(1, 40, (count, 2))
+    sizes[:10] = rng.integers(200, 600, (10, 2))
+    boxes = np.concatenate([corners, corners + sizes], axis=1)
+    boxes[-5:] = boxes[:5]
+
+    first, second = _overlapping_pairs(boxes)
+    assert np.all(first < second)
+    assert np.all(np.diff(first) >= 0)
+    assert list(zip(first.tolist(), second.tolist())) == _brute_force_pairs(boxes)
+
+
+def test_grid_pairs_of_few_boxes():
+    assert len(_overlapping_pairs(np.empty((0, 4), dtype=np.int64))[0]) == 0
+    assert len(_overlapping_pairs(np.array([[0, 0, 5, 5]]))[0]) == 0
+    # Касание краями — не пересечение
+    first, second = _overlapping_pairs(np.array([[0, 0, 5, 5], [5, 0, 9, 5]]))
+    assert len(first) == 0
+
+
+def _disc_image(shape, discs):
+    image = np.zeros(shape, dtype=np.uint8)
+    for label, (x, y, radius) in enumerate(discs, start=1):
+        cv2.circle(image, (x, y), radius, label, -1)
+    return image
+
+
+def _components(crop):
+    """«Модель»: связные области фрагмента как MaskTile, уверенность 1"""
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(
+        (crop > 0).astype(np.uint8)
+    )
+    tiles = []
+    for label in range(1, count):
+        x, y, width, height = stats[label, :4]
+        mask = labels[y : y + height, x : x + width] == label
+        tiles.append(MaskTile(mask, x, y, crop.shape[:2]))
+    return tiles, np.ones(len(tiles), dtype=np.float32)
+
+
+def test_particle_split_by_seam_is_merged():
+    # Диски на швах, на пересечении швов и внутри фрагментов
+    discs = [(64, 30, 14), (100, 64, 12), (48, 100, 9), (20, 20, 6), (150, 110, 10)]
+    image = _disc_image((128, 176), discs)
+    tiler = TiledInference(64, 64, 0.25, 0.25, full_image=False)
+    tiles, scores = tiler.predict(
+        image, lambda crops: [_components(crop) for crop in crops]
+    )
+
+    assert len(tiles) == len(discs) == len(scores)
+    found = sorted(tiles, key=lambda tile: tile.bbox)
+    # Эталон — связные области всего кадра
+    expected = sorted(_components(image)[0], key=lambda tile: tile.bbox)
+    for tile, reference in zip(found, expected):
+        assert tile.bbox == reference.bbox
+        np.testing.assert_array_equal(tile.mask, reference.mask)
+
+
+def test_merge_joins_halves_from_neighbouring_slices():
+    image = _disc_image((100, 160), [(80, 50, 30)])
+    windows = np.array([[0, 0, 100, 100], [60, 0, 160, 100]])
+    halves = []
+    for x1, y1, x2, y2 in windows:
+        (tile,), _ = _components(image[y1:y2, x1:x2])
+        halves.append(MaskTile(tile.mask, tile.x + x1, tile.y + y1, image.shape))
+    tiles, scores = TiledInference().merge(
+        halves, np.array([0.6, 0.9], dtype=np.float32), windows
+    )
+    assert len(tiles) == 1 and scores.tolist() == [pytest.approx(0.9)]
+    np.testing.assert_array_equal(tiles[0].to_full(), image > 0)
+
+
+def _tile(image_shape, x, y, width, height):
+    return MaskTile(np.ones((height, width), dtype=bool), x, y, image_shape)
+
+
+def test_mask_nms_suppresses_overlapping_duplicates():
+    shape = (200, 200)
+    tiles = [
+        _tile(shape, 10, 10, 40, 40),  # частица
+        _tile(shape, 11, 11, 40, 40),  # ее дубликат со сдвигом, менее уверенный
+        _tile(shape, 120, 120, 30, 30),  # отдельная частица
+        _tile(shape, 20, 20, 10, 10),  # фрагмент внутри первой
+        _tile(shape, 45, 10, 40, 40),  # соседняя с небольшим перекрытием
+    ]
+    scores = np.array([0.8, 0.7, 0.6, 0.5, 0.9])
+
+    keep = mask_nms(tiles, scores, 0.5, "ios")
+    assert keep.tolist() == [4, 0, 2]
+    # По IoU маленький фрагмент внутри частицы не дубликат
+    keep = mask_nms(tiles, scores, 0.5, "iou")
+    assert keep.tolist() == [4, 0, 2, 3]
+    assert len(mask_nms([], np.empty(0))) == 0
@@ -0,0 +1,193 @@
+"""Постобработка YOLO-seg в ONNXLoader против ultralytics и torchvision"""
+
+import os
+import shutil
+
+import cv2
+import numpy as np
+import pytest
+
+from particleanalyzer.core.ONNXLoader import ONNXLoader, _nms
+
+INPUT_SIZE = (640, 640)
+# Квадратные, широкие, высокие и нечетные поля letterbox
+SHAPES = [(480, 640), (1000, 700), (333, 517), (640, 640), (481, 1279), (50, 50)]
+
+
+def _ultralytics_ops():
+    # Геометрия scale_boxes и process_mask_native — как в ultralytics 8.4
+    pytest.importorskip("ultralytics", minversion="8.4")
+    pytest.importorskip("torch")
+    from ultralytics.utils import ops
+
+    return ops
+
+
+def _letterbox(image):
+    out = np.empty((3, INPUT_SIZE[1], INPUT_SIZE[0]), dtype=np.float32)
+    transform = ONNXLoader._letterbox_into(image, out, INPUT_SIZE)
+    return out, transform
+
+
+def _random_boxes(rng, count, width, height):
+    corners = rng.uniform(0, [width, height], size=(count, 2))
+    sizes = rng.uniform(1, [width / 4, height / 4], size=(count, 2))
+    return np.concatenate([corners, corners + sizes], axis=1).astype(np.float32)
+
+
+@pytest.mark.parametrize("shape", SHAPES)
+def test_letterbox_geometry_and_padding(shape):
+    height, width = shape
+    image = np.random.default_rng(0).integers(0, 256, (*shape, 3), dtype=np.uint8)
+    out, ((orig_w, orig_h), (gain_x, gain_y), (left, top)) = _letterbox(image)
+
+    gain = min(INPUT_SIZE[1] / height, INPUT_SIZE[0] / width)
+    new_w, new_h = round(width * gain), round(height * gain)
+    assert (orig_w, orig_h) == (width, height)
+    assert (gain_x, gain_y) == (new_w / width, new_h / height)
+    assert (left, top) == (
+        round((INPUT_SIZE[0] - new_w) / 2 - 0.1),
+        round((INPUT_SIZE[1] - new_h) / 2 - 0.1),
+    )
+
+    resized = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    content = out[:, top : top + new_h, left : left + new_w]
+    np.testing.assert_array_equal(
+        content, resized.transpose(2, 0, 1)[::-1] / np.float32(255)
+    )
+    padding = np.ones(out.shape[1:], dtype=bool)
+    padding[top : top + new_h, left : left + new_w] = False
+    assert np.all(out[:, padding] == np.float32(114) / np.float32(255))
+
+
+@pytest.mark.parametrize("shape", SHAPES)
+def test_letterbox_matches_ultralytics(shape):
+    ops = _ultralytics_ops()
+    import torch
+    from ultralytics.data.augment import LetterBox
+
+    rng = np.random.default_rng(1)
+    image = rng.integers(0, 256, (*shape, 3), dtype=np.uint8)
+    out, ((width, height), (gain_x, gain_y), (shift_x, shift_y)) = _letterbox(image)
+    expected = LetterBox(INPUT_SIZE[::-1], auto=False)(image=image)
+    np.testing.assert_array_equal(
+        out, expected.transpose(2, 0, 1)[::-1] / np.float32(255)
+    )
+
+    # Обратное преобразование рамок — как ultralytics scale_boxes
+    boxes = _random_boxes(rng, 64, *INPUT_SIZE)
+    mapped = boxes.copy()
+    mapped[:, [0, 2]] = ((mapped[:, [0, 2]] - shift_x) / gain_x).clip(0, width)
+    mapped[:, [1, 3]] = ((mapped[:, [1, 3]] - shift_y) / gain_y).clip(0, height)
+    expected = ops.scale_boxes(INPUT_SIZE[::-1], torch.tensor(boxes), shape)
+    np.testing.assert_allclose(mapped, expected.numpy(), rtol=0, atol=1e-3)
+
+
+@pytest.mark.parametrize("iou_threshold", [0.3, 0.45, 0.7])
+def test_nms_matches_torchvision(iou_threshold):
+    torch = pytest.importorskip("torch")
+    torchvision = pytest.importorskip("torchvision")
+
+    rng = np.random.default_rng(2)
+    # Скопления пересекающихся рамок, упорядоченные по убыванию уверенности
+    boxes = _random_boxes(rng, 300, 200, 200)
+    scores = rng.permutation(len(boxes)).astype(np.float32)
+    order = np.argsort(-scores, kind="stable")
+    boxes, scores = boxes[order], scores[order]
+
+    expected = torchvision.ops.nms(
+        torch.tensor(boxes), torch.tensor(scores), iou_threshold
+    )
+    np.testing.assert_array_equal(_nms(boxes, iou_threshold), expected.numpy())
+
+
+@pytest.mark.parametrize("shape", SHAPES)
+def test_prototype_masks_match_ultralytics(shape):
+    ops = _ultralytics_ops()
+    import torch
+
+    height, width = shape
+    rng = np.random.default_rng(3)
+    protos = rng.normal(size=(32, 160, 160)).astype(np.float32)
+    coefficients = rng.normal(size=(48, 32)).astype(np.float32)
+    boxes = _random_boxes(rng, len(coefficients), width, height)
+    boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, width)
+    boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, height)
+
+    expected = ops.process_mask_native(
+        torch.tensor(protos), torch.tensor(coefficients), torch.tensor(boxes), shape
+    ).numpy()
+    masks = np.stack(
+        [
+            ONNXLoader._prototype_mask_tile(
+                protos, coefficient, box, (width, height)
+            ).to_full()
+            for coefficient, box in zip(coefficients, boxes)
+        ]
+    )
+    # Логиты, близкие к нулю, могут отличаться порядком операций float32
+    mismatches = np.count_nonzero(masks != expected.astype(bool))
+    assert mismatches <= max(1, expected.sum() // 10000)
+
+
+@pytest.fixture(scope="module")
+def exported_models(tmp_path_factory):
+    """
+    YOLO11n-seg без обученных весов, экспортированный с динамическим входом
+    320 и статическим 256x320; смещение классов дает уверенные рамки
+    """
+    pytest.importorskip("ultralytics", minversion="8.4")
+    pytest.importorskip("onnx")
+    from ultralytics import YOLO
+
+    directory = tmp_path_factory.mktemp("onnx")
+    model = YOLO("yolo11n-seg.yaml")
+    for layer in model.model.model[-1].cv3:
+        layer[-1].bias.data[:] = 3.0
+    paths = {}
+    for name, imgsz, dynamic in (("dynamic", 320, True), ("static", (256, 320), False)):
+        path = model.export(format="onnx", imgsz=imgsz, dynamic=dynamic, simplify=False)
+        paths[name] = str(directory / f"{name}.onnx")
+        os.replace(path, paths[name])
+    return paths
+
+
+@pytest.mark.parametrize(
+    "name, input_size", [("dynamic", (320, 320)), ("static", (320, 256))]
+)
+def test_input_size_follows_export(exported_models, name, input_size):
+    import onnxruntime as ort
+
+    session = ort.InferenceSession(exported_models[name])
+    model_name = "Yolo11 ONNX (dataset 9)"
+    assert ONNXLoader._session_input_size(session, model_name) == input_size
+
+
+def test_non_default_input_size_matches_ultralytics(exported_models, tmp_path):
+    ops = _ultralytics_ops()
+    import onnxruntime as ort
+    import torch
+    import torchvision  # noqa: F401 — NMS ultralytics через torchvision
+    from ultralytics.data.augment import LetterBox
+    from ultralytics.utils.nms import non_max_suppression
+
+    model_name = "Yolo11 ONNX (dataset 9)"
+    shutil.copy(
+        exported_models["static"], tmp_path / ONNXLoader.MODEL_MAPPING[model_name]
+    )
+    loader = ONNXLoader(cache_optimized=False)
+    loader._base_path = str(tmp_path)
+    image = np.random.default_rng(4).integers(0, 256, (481, 700, 3), dtype=np.uint8)
+    result = loader.predict_batch(model_name, [image], 0.5, 100, iou_threshold=0.7)[0]
+
+    session = ort.InferenceSession(exported_models["static"])
+    letterboxed = LetterBox((256, 320), auto=False)(image=image)
+    batch = letterboxed.transpose(2, 0, 1)[None, ::-1] / np.float32(255)
+    outputs = session.run(None, {session.get_inputs()[0].name: batch})
+    nc = outputs[0].shape[1] - 4 - outputs[1].shape[1]
+    expected = non_max_suppression(
+        torch.from_numpy(outputs[0]), 0.5, 0.7, max_det=100, nc=nc
+    )[0]
+    boxes = ops.scale_boxes((256, 320), expected[:, :4], image.shape[:2]).numpy()
+    assert len(result) == len(boxes) > 0
+    np.testing.assert_allclose(result.xyxy, boxes, rtol=0, atol=1e-2)